@@ -0,0 +1,298 @@
+"""
+Benchmarks of dictionary_oa.Dict, dictionary_chain.Dict,
+dictionary_cuckoo.CuckooDict, dictionary_swiss.SwissDict and the builtin
+dict.
+
+For every implementation, key type, number of keys and load factor, the
+following operations are timed:
+
+   * insert - Insert all keys into a table created large enough to hold
+     them. The tables round their size up to a power of two, so the number
+     of keys is raised until the table is filled to the load factor asked
+     for (or just below it, where it would grow).
+   * resize - Insert all keys into a table of the default size, which has to
+     grow along the way.
+   * hit - Look up all keys, in random order.
+   * miss - Look up as many keys that are not in the table.
+   * delete - Delete all keys, in random order.
+   * churn - Replace the keys one by one: delete one, insert a new one and
+     look up another.
+   * iterate - Iterate over the keys.
+
+Each result is one row with the number of keys, the load factor asked for
+and the load the table actually had (used slots, or entries per bucket for
+dictionary_chain, when the operation started; none for the builtin dict),
+the time per operation in nanoseconds, the number of slots or chain entries
+looked at per operation (counted by the stats of the table in a separate
+run, so counting does not slow down the timed one; none for the builtin
+dict) and the peak memory allocated while building the table, measured in
+a separate run with tracemalloc. The rows are written as JSON or CSV, so
+they can be compared between runs.
+
+Run python benchmark.py --help for the options.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import argparse, csv, gc, json, random, string, sys
+from timeit import default_timer
+try:
+    import tracemalloc
+except ImportError:
+    TRACEMALLOC_INSTALLED = False
+else:
+    TRACEMALLOC_INSTALLED = True
+
+import dictionary_oa
+import dictionary_chain
+import dictionary_cuckoo
+import dictionary_swiss
+
+def random_int(rng):
+    return rng.getrandbits(63)
+
+def random_str(rng):
+    return ''.join(rng.choice(string.ascii_letters) for k in range(10))
+
+def random_tuple(rng):
+    return (rng.getrandbits(31), random_str(rng))
+
+KEY_TYPES = {
+    'int': random_int,
+    'str': random_str,
+    'tuple': random_tuple,
+    }
+
+class Implementation(object):
+    """
+    How to create tables of one implementation.
+
+    Attributes:
+       * name - The name used to select the implementation.
+       * module - The module of the table class, or None.
+       * cls - The name of the table class in the module.
+    """
+
+    def __init__(self, name, module = None, cls = "Dict"):
+        self.name = name
+        self.module = module
+        self.cls = cls
+
+    def create(self, num_keys, load):
+        """
+        Return an empty table for num_keys keys at the given load factor.
+        If num_keys is None, the table has the default size.
+        """
+        cls = getattr(self.module, self.cls)
+        if num_keys is None:
+            return cls(max_load=load)
+        return cls(int(num_keys/load) + 1, max_load=load)
+
+    def fill(self, num_keys, load):
+        """
+        Return the number of keys that fills a table created for num_keys
+        keys to the given load factor without making it grow.
+        """
+        # One less than the limit, since some tables grow on reaching it.
+        return max(num_keys, int(load*slots(self.create(num_keys, load))) - 1)
+
+class BuiltinDict(Implementation):
+
+    def create(self, num_keys, load):
+        return {}
+
+    def fill(self, num_keys, load):
+        return num_keys
+
+IMPLEMENTATIONS = dict((impl.name, impl) for impl in (
+        Implementation('oa', dictionary_oa),
+        Implementation('chain', dictionary_chain),
+        Implementation('cuckoo', dictionary_cuckoo, 'CuckooDict'),
+        Implementation('swiss', dictionary_swiss, 'SwissDict'),
+        BuiltinDict('dict')))
+
+def slots(d):
+    """
+    Return the number of slots of a table, or of buckets for a
+    dictionary_chain.Dict.
+    """
+    if hasattr(d, 'slot_keys'):
+        return len(d.slot_keys)
+    return d.size
+
+def table_load(d):
+    """
+    Return the load of a table, or None for the builtin dict.
+    """
+    if isinstance(d, dict):
+        return None
+    return len(d)/slots(d)
+
+def insert(d, keys):
+    for key in keys:
+        d[key] = 1
+
+def lookup(d, keys):
+    for key in keys:
+        key in d
+
+def delete(d, keys):
+    for key in keys:
+        del d[key]
+
+def churn(d, removed, added, looked_up):
+    for old, new, key in zip(removed, added, looked_up):
+        del d[old]
+        d[new] = 1
+        key in d
+
+def iterate(d):
+    for key in d:
+        pass
+
+def measure_time(d, func, args, ops):
+    """
+    Run func(*args) on the table d and return the time per operation.
+    """
+    gc.collect()
+    t1 = default_timer()
+    func(*args)
+    t2 = default_timer()
+    return (t2-t1)*1e9/ops
+
+def count_probes(d, func, args, ops):
+    """
+    Run func(*args) on the table d and return the slots or chain entries
+    looked at per operation, or None if d does not count them.
+    """
+    if not hasattr(d, 'enable_stats'):
+        func(*args)
+        return None
+    d.enable_stats()
+    func(*args)
+    probes = d.stats()['counters']['probes']
+    d.disable_stats()
+    return probes/ops
+
+def peak_memory(impl, keys, load):
+    """
+    Return the peak memory in bytes allocated while building the table.
+    """
+    if not TRACEMALLOC_INSTALLED:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    d = impl.create(len(keys), load)
+    insert(d, keys)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def workloads(impl, keys, misses, shuffled, load, measure):
+    """
+    Run all operations, each through measure (measure_time or
+    count_probes), and return a dict of the results.
+    """
+    n = len(keys)
+    results = {}
+    d = impl.create(n, load)
+    results['insert'] = measure(d, insert, (d, keys), n)
+    results['load'] = table_load(d)
+    results['hit'] = measure(d, lookup, (d, shuffled), n)
+    results['miss'] = measure(d, lookup, (d, misses), n)
+    results['iterate'] = measure(d, iterate, (d,), n)
+    new = [key for key in misses if key not in d]
+    results['churn'] = measure(d, churn, (d, shuffled[:len(new)], new, keys),
+                               len(new))
+    d = impl.create(n, load)
+    insert(d, keys)
+    results['delete'] = measure(d, delete, (d, shuffled), n)
+    d = impl.create(None, load)
+    results['resize'] = measure(d, insert, (d, keys), n)
+    results['resize_load'] = table_load(d)
+    return results
+
+def run(impl, key_type, num_keys, load, seed = 3):
+    """
+    Return the result rows of all operations for one configuration.
+    """
+    rng = random.Random(seed)
+    make_key = KEY_TYPES[key_type]
+    num_keys = impl.fill(num_keys, load)
+    keys = set()
+    while len(keys) < num_keys:
+        keys.add(make_key(rng))
+    keys = list(keys)
+    misses = [make_key(rng) for i in range(len(keys))]
+    shuffled = keys[:]
+    rng.shuffle(shuffled)
+    times = workloads(impl, keys, misses, shuffled, load, measure_time)
+    probes = workloads(impl, keys, misses, shuffled, load, count_probes)
+    peak = peak_memory(impl, keys, load)
+    n = len(keys)
+    rows = []
+    for op in ('insert', 'resize', 'hit', 'miss', 'delete', 'churn',
+               'iterate'):
+        ns = times[op]
+        probes_per_op = probes[op]
+        real_load = times['resize_load' if op == 'resize' else 'load']
+        rows.append({'impl': impl.name, 'key_type': key_type, 'size': n,
+                     'load': load, 'real_load': None if real_load is None
+                     else round(real_load, 3),
+                     'op': op, 'ns_per_op': round(ns, 1),
+                     'probes_per_op': None if probes_per_op is None
+                     else round(probes_per_op, 3),
+                     'peak_bytes': peak})
+    return rows
+
+FIELDS = ['impl', 'key_type', 'size', 'load', 'real_load', 'op',
+          'ns_per_op', 'probes_per_op', 'peak_bytes']
+
+def write(rows, fp, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(fp, FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, fp, indent=1)
+        fp.write('\n')
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--impl', nargs='+', default=['oa', 'chain', 'dict'],
+                        choices=sorted(IMPLEMENTATIONS))
+    parser.add_argument('--key-type', nargs='+', default=['int', 'str'],
+                        choices=sorted(KEY_TYPES))
+    parser.add_argument('--size', nargs='+', type=float,
+                        default=[1e3, 1e4, 1e5],
+                        help='numbers of keys, raised to fill the tables '
+                        'to the load factor (sizes up to 1e7 work, but take '
+                        'long for the pure Python tables)')
+    parser.add_argument('--load', nargs='+', type=float, default=[0.5, 0.66],
+                        help='maximum load factors of the tables')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('--output', help='file to write, default stdout')
+    args = parser.parse_args(argv)
+    rows = []
+    for name in args.impl:
+        impl = IMPLEMENTATIONS[name]
+        for key_type in args.key_type:
+            for size in args.size:
+                # The load factor does not apply to the builtin dict.
+                loads = args.load if impl.module is not None else [None]
+                for load in loads:
+                    rows.extend(run(impl, key_type, int(size), load))
+                    print('done %s %s %d %s' % (name, key_type, size, load),
+                          file=sys.stderr)
+    if args.output is None:
+        write(rows, sys.stdout, args.format)
+    else:
+        with open(args.output, 'w') as fp:
+            write(rows, fp, args.format)
+
+if __name__ == '__main__':
+
+    main()
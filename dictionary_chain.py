@@ -4,9 +4,10 @@ This is for educational purposes only, for illustrating how dictionaries work.
 The original version was based heavily on Benjamin Peterson's code here:
 http://pybites.blogspot.com/2008/10/pure-python-dictionary-implementation.html
 
-This file implements chaining and requires the package coinor.blimpy to be
-installed (this provides a drop-in replacement for the Python list class
-based on linked lists).
+This file implements chaining. The chains are kept in Python lists by default.
+They can also be kept in one flat arena of arrays, or in linked lists, which
+requires the package coinor.blimpy to be installed (this provides a drop-in
+replacement for the Python list class based on linked lists).
 
 There is a method for visualizing the dictionary that requires pygame.
 
@@ -30,40 +31,41 @@ except ImportError:
 else:
     PYGAME_INSTALLED = True
 
-import random, string
+import random, string, sys
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
 from math import sqrt
-import time
-from coinor.blimpy import LinkedList
+from timeit import default_timer
+from array import array
+from hashing import MixHasher, random_seed, reseeded
+import snapshot
+import views
+from tablestats import TableStats
+from occupancy import Occupancy
 
-dummy = "<dummy key>"
+try:
+    from coinor.blimpy import LinkedList
+except ImportError:
+    BLIMPY_INSTALLED = False
+else:
+    BLIMPY_INSTALLED = True
+
+# Identifies snapshots written by Dict.dump.
+SNAPSHOT_MAGIC = b"PYDICTCH"
 
 times = {}
 
 def print_timing(func):
     def wrapper(*arg, **kargs):
-        t1 = time.clock()
+        t1 = default_timer()
         res = func(*arg, **kargs)
-        t2 = time.clock()
+        t2 = default_timer()
         times[func.__name__] = t2-t1
         print('%s took %0.3fms' % (func.__name__, (t2-t1)*1000.0))
         return res
     wrapper.func = func
     return wrapper
 
-counts = {}
-
-def counter(func):
-    counts[func.__name__] = 0
-    def wrapper(*arg, **kargs):
-        counts[func.__name__] += 1
-        res = func(*arg, **kargs)
-        return res
-    return wrapper
-
-@counter
-def compare(i, j):
-    return i == j
-
 def c_mul(a, b):
     return eval(hex((int(a) * b) & 0xFFFFFFFF)[:-1])
 
@@ -73,77 +75,435 @@ class Entry(object):
 
     Attributes:
        * key - The key for this entry.
-       * hash - The has of the key.
+       * hash - The full hash of the key, before it is reduced to a bucket.
        * value - The value associated with the key.
     """
 
-    def __init__(self):
-        self.key = None
-        self.value = None
-        self.hash = 0
+    __slots__ = ("key", "value", "hash")
+
+    def __init__(self, key = None, value = None, key_hash = 0):
+        self.key = key
+        self.value = value
+        self.hash = key_hash
 
     def __repr__(self):
         return "<Entry: key={0} value={1}>".format(self.key, self.value)
 
-class Dict(object):
+class ListBuckets(object):
     """
-    A mapping interface implemented as a hash table.
+    The chains of a table with size buckets, each kept in a Python list of
+    entries. An entry itself is the handle used to refer to it. Empty buckets
+    share one empty tuple, so creating a large table is cheap.
 
     Attributes:
-        * used - The number of entires used in the table.
-        * filled - used + number of entries with a dummy key.
-        * table - List of entries; contains the actual dict data.
-        * size - Length of table. Used to fetch values.
+       * name - The name used to select the store in Dict.
+       * size - The number of buckets.
+       * table - List of buckets.
     """
 
+    name = "list"
+
     def __init__(self, size):
         self.size = size
-        self.clear()
+        self.table = [()]*size
+
+    def new_bucket(self):
+        return []
+
+    def find(self, i, key, key_hash):
+        """
+        Return the handle of the entry for key in bucket i, or None.
+        """
+        for entry in self.table[i]:
+            if entry.hash == key_hash and entry.key == key:
+                return entry
+        return None
+
+    def add(self, i, key, value, key_hash):
+        """
+        Add an entry to bucket i and return its handle.
+        """
+        entry = Entry(key, value, key_hash)
+        if not self.table[i]:
+            self.table[i] = self.new_bucket()
+        self.table[i].append(entry)
+        return entry
+
+    def remove(self, i, entry):
+        """
+        Remove an entry from bucket i.
+        """
+        self.table[i].remove(entry)
+
+    def handles(self, i):
+        """
+        Return an iterator over the handles of the entries in bucket i.
+        """
+        return iter(self.table[i])
+
+    def take(self, i):
+        """
+        Empty bucket i and return its entries as (hash, key, value) tuples.
+        """
+        bucket = self.table[i]
+        self.table[i] = ()
+        return [(entry.hash, entry.key, entry.value) for entry in bucket]
+
+    def entries(self):
+        """
+        Generate the (key, value) pairs of all entries.
+        """
+        for bucket in self.table:
+            for entry in bucket:
+                yield entry.key, entry.value
+
+    def chain_length(self, i):
+        return len(self.table[i])
+
+    def chain_lengths(self):
+        return list(map(len, self.table))
+
+    def key(self, entry):
+        return entry.key
+
+    def value(self, entry):
+        return entry.value
+
+    def hash(self, entry):
+        return entry.hash
+
+    def set_value(self, entry, value):
+        entry.value = value
+
+class LinkedListBuckets(ListBuckets):
+    """
+    Like ListBuckets, but each chain is a coinor.blimpy LinkedList.
+    """
+
+    name = "linkedlist"
+
+    def __init__(self, size):
+        if not BLIMPY_INSTALLED:
+            raise ImportError("linked list buckets require coinor.blimpy")
+        ListBuckets.__init__(self, size)
+
+    def new_bucket(self):
+        return LinkedList()
+
+# A chain of a TreeBuckets store is sorted when it grows longer than
+# TREEIFY and goes back to a list when it gets shorter than UNTREEIFY, as in
+# the HashMap of Java 8.
+TREEIFY = 8
+UNTREEIFY = 6
+
+class SortedBucket(object):
+    """
+    A chain kept sorted by the full hashes of its entries, so an entry is
+    found by binary search. It has the list methods ListBuckets uses.
+
+    Attributes:
+       * hashes - The sorted full hashes.
+       * entries - The entries, in the order of their hashes.
+    """
+
+    __slots__ = ("hashes", "entries")
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=attrgetter("hash"))
+        self.hashes = [entry.hash for entry in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def find(self, key, key_hash):
+        hashes = self.hashes
+        n = bisect_left(hashes, key_hash)
+        # Only keys with the same full hash are compared.
+        while n < len(hashes) and hashes[n] == key_hash:
+            if self.entries[n].key == key:
+                return self.entries[n]
+            n += 1
+        return None
+
+    def append(self, entry):
+        n = bisect_right(self.hashes, entry.hash)
+        self.hashes.insert(n, entry.hash)
+        self.entries.insert(n, entry)
+
+    def remove(self, entry):
+        n = bisect_left(self.hashes, entry.hash)
+        while self.entries[n] is not entry:
+            n += 1
+        del self.hashes[n]
+        del self.entries[n]
+
+class TreeBuckets(ListBuckets):
+    """
+    Like ListBuckets, but a chain longer than TREEIFY becomes a
+    SortedBucket, so looking up a key in a chain of n entries with different
+    full hashes takes O(log n) comparisons, even if the keys were chosen to
+    fall into one bucket. Python has no balanced tree, so the sorted chain
+    is a pair of lists searched with bisect; adding and removing entries
+    moves the entries after them, which is fast for chains of this length.
+    """
+
+    name = "tree"
+
+    def find(self, i, key, key_hash):
+        bucket = self.table[i]
+        if type(bucket) is SortedBucket:
+            return bucket.find(key, key_hash)
+        return ListBuckets.find(self, i, key, key_hash)
+
+    def add(self, i, key, value, key_hash):
+        entry = ListBuckets.add(self, i, key, value, key_hash)
+        bucket = self.table[i]
+        if type(bucket) is list and len(bucket) > TREEIFY:
+            self.table[i] = SortedBucket(bucket)
+        return entry
+
+    def remove(self, i, entry):
+        bucket = self.table[i]
+        bucket.remove(entry)
+        if type(bucket) is SortedBucket and len(bucket) < UNTREEIFY:
+            self.table[i] = list(bucket)
+
+class ArenaBuckets(object):
+    """
+    The chains of a table with size buckets, all kept in one arena of
+    parallel arrays. Nodes are numbered and the number of a node is the
+    handle used to refer to its entry. Removed nodes are put on a free list
+    and reused, so adding an entry does not allocate once the arena is large
+    enough.
+
+    Attributes:
+       * name - The name used to select the store in Dict.
+       * size - The number of buckets.
+       * heads - The first node of each bucket, -1 for an empty bucket.
+       * links - The next node in the chain of each node, -1 at the end. For
+         a free node, the next node on the free list.
+       * hashes, keys, values - The entries of the nodes.
+       * free - The first node on the free list, -1 if it is empty.
+    """
+
+    name = "arena"
 
-    def hash(self, s):
-        h, a, b = 0, 31415, 27183
-        if s is None:
-            pass
-        for c in s:
-            h = (a*h + ord(c)) % self.size
-            a = a+b % (self.size - 1)
-        if h < 0:
-            return h + self.size
+    def __init__(self, size):
+        self.size = size
+        self.heads = array('q', [-1])*size
+        self.links = array('q')
+        self.hashes = array('Q')
+        self.keys = []
+        self.values = []
+        self.free = -1
+
+    def find(self, i, key, key_hash):
+        n = self.heads[i]
+        while n >= 0:
+            if self.hashes[n] == key_hash and self.keys[n] == key:
+                return n
+            n = self.links[n]
+        return None
+
+    def add(self, i, key, value, key_hash):
+        n = self.free
+        if n >= 0:
+            self.free = self.links[n]
+            self.keys[n] = key
+            self.values[n] = value
+            self.hashes[n] = key_hash
+            self.links[n] = self.heads[i]
+        else:
+            n = len(self.keys)
+            self.keys.append(key)
+            self.values.append(value)
+            self.hashes.append(key_hash)
+            self.links.append(self.heads[i])
+        self.heads[i] = n
+        return n
+
+    def remove(self, i, n):
+        if self.heads[i] == n:
+            self.heads[i] = self.links[n]
         else:
-            return h
+            prev = self.heads[i]
+            while self.links[prev] != n:
+                prev = self.links[prev]
+            self.links[prev] = self.links[n]
+        self.keys[n] = None
+        self.values[n] = None
+        self.links[n] = self.free
+        self.free = n
+
+    def handles(self, i):
+        n = self.heads[i]
+        while n >= 0:
+            yield n
+            n = self.links[n]
+
+    def take(self, i):
+        entries = []
+        n = self.heads[i]
+        while n >= 0:
+            entries.append((self.hashes[n], self.keys[n], self.values[n]))
+            self.keys[n] = None
+            self.values[n] = None
+            # Put the node on the free list.
+            after = self.links[n]
+            self.links[n] = self.free
+            self.free = n
+            n = after
+        self.heads[i] = -1
+        return entries
+
+    def entries(self):
+        # Free nodes have no value, so the arena is scanned in node order.
+        for item in zip(self.keys, self.values):
+            if item[1] is not None:
+                yield item
+
+    def chain_length(self, i):
+        length = 0
+        n = self.heads[i]
+        while n >= 0:
+            length += 1
+            n = self.links[n]
+        return length
+
+    def chain_lengths(self):
+        return list(map(self.chain_length, range(self.size)))
+
+    def key(self, n):
+        return self.keys[n]
+
+    def value(self, n):
+        return self.values[n]
+
+    def hash(self, n):
+        return self.hashes[n]
+
+    def set_value(self, n, value):
+        self.values[n] = value
+
+BUCKETS = dict((cls.name, cls) for cls in (ListBuckets, LinkedListBuckets,
+                                          TreeBuckets, ArenaBuckets))
+
+class Dict(object):
+    """
+    A mapping interface implemented as a hash table.
+
+    Attributes:
+        * used - The number of entires used in the table.
+        * buckets - The bucket store; contains the actual dict data. It can
+          be given as one of the names in BUCKETS or as a store class.
+        * size - Number of buckets. Used to fetch values. Always a power of
+          two.
+        * hasher - Maps keys to full hashes, see the hashing module. By
+          default, a MixHasher with a random seed.
+        * minsize - The initial number of buckets. The table never shrinks
+          below this.
+        * resizing - If False, the number of buckets stays fixed (this is the
+          mode used for experimentation). Otherwise, the table is rehashed
+          into more buckets when the average chain length exceeds max_load
+          and into fewer when it drops below min_load.
+        * max_load - Maximum average chain length before growing.
+        * min_load - Minimum average chain length before shrinking.
+        * growth - On a rehash, the new table has at least growth*used
+          buckets.
+        * incremental - If True, a rehash does not move all entries at once.
+          The old and new tables are both kept, and every insertion or
+          deletion moves the chains of rehash_steps old buckets to the new
+          table, as in Redis. Lookups look in both tables until the rehash is
+          done.
+        * new_buckets - The store being rehashed into, or None.
+        * rehash_pos - The next bucket of the old table to move.
+        * popitem_pos - The bucket popitem took the last entry from. The
+          next call starts looking there, so emptying the table with popitem
+          goes over the buckets once, not once per entry.
+        * version - Incremented by every change other than setting the value
+          of a key that is in the dictionary already. Iterators stop with an
+          error when it changes.
+        * flood_limit - Guards against keys chosen to collide (hash
+          flooding). An insertion that makes a chain longer than chain_limit
+          plus the average chain length reseeds the table, see reseed. If
+          None, the table is never reseeded. With buckets="tree", long
+          chains are also searched in logarithmic time.
+        * chain_limit - flood_limit times the number of bits of the size,
+          doubled after every reseed, so keys that collide whatever the seed
+          do not make the table rehash again and again.
+        * reseeds - The number of times the table was reseeded.
+        * table_stats - The counters of lookups and rehashes, a
+          tablestats.TableStats, or None if counting is disabled. See
+          enable_stats.
+    """
+
+    def __init__(self, size = 111, hasher = None, buckets = "list",
+                 resizing = True, max_load = 1, min_load = 1/10, growth = 2,
+                 incremental = False, rehash_steps = 1, flood_limit = 4):
+        if not 0 <= min_load < max_load:
+            raise ValueError("load factors must satisfy "
+                             "0 <= min_load < max_load")
+        if growth <= 1:
+            raise ValueError("growth factor must be greater than 1")
+        # Buckets are found by masking the hash, so round up to a power of
+        # two.
+        self.size = 1 << (size - 1).bit_length()
+        self.minsize = self.size
+        self.hasher = MixHasher(random_seed()) if hasher is None else hasher
+        if isinstance(buckets, str):
+            buckets = BUCKETS[buckets]
+        self.bucket_class = buckets
+        self.resizing = resizing
+        self.max_load = max_load
+        self.min_load = min_load
+        self.growth = growth
+        self.incremental = incremental
+        self.rehash_steps = rehash_steps
+        self.flood_limit = flood_limit
+        self.reseeds = 0
+        self.version = 0
+        self.table_stats = None
+        self.clear()
 
     @classmethod
     def fromkeys(cls, keys, value=0):
         """
         Return a new dictionary from a sequence of keys.
         """
+        keys = list(keys)
         d = cls()
-        for key in keys:
-            d[key] = value
+        d.set_many(keys, [value]*len(keys))
         return d
 
     def clear(self):
         """
         Clear the dictionary of all data.
         """
-        self.filled = 0
+        self.version += 1
         self.used = 0
-        self.table = [LinkedList() for i in range(self.size)]
+        self.size = self.minsize
+        self.buckets = self.bucket_class(self.size)
+        self.new_buckets = None
+        self.rehash_pos = 0
+        self.popitem_pos = 0
+        self._set_chain_limit()
 
     def pop(self, *args):
         """
         Remove and return the value for a key.
         """
         have_default = len(args) == 2
-        try:
-            v = self[args[0]]
-        except KeyError:
+        store, i, handle = self._lookup(args[0], self.hasher(args[0]))
+        if handle is None:
             if have_default:
                 return args[1]
-            raise
-        else:
-            del self[args[0]]
-            return v
+            raise KeyError("no such key: {0!r}".format(args[0]))
+        v = store.value(handle)
+        self._del(store, i, handle)
+        return v
 
     def popitem(self):
         """
@@ -151,78 +511,263 @@ class Dict(object):
         """
         if self.used == 0:
             raise KeyError("empty dictionary")
-        entry0 = self.table[0][0]
-        entry = entry0
-        if entry0.value is None:
-            i = entry0.hash
-            if i >= self.size or i < i:
-                i = 1
-            entry = self.table[i][0]
-            while entry.value is None:
-                i += 1
-                if i >= self.size:
-                    i = 1
-                entry = self.table[i][0]
-        res = entry.key, entry.value
-        self._del(entry)
-        entry0.hash = i + 1
-        return res
+        for store in (self.buckets, self.new_buckets):
+            if store is None:
+                continue
+            mask = store.size - 1
+            for n in range(store.size):
+                i = (self.popitem_pos + n) & mask
+                for handle in store.handles(i):
+                    res = store.key(handle), store.value(handle)
+                    self.popitem_pos = i
+                    self._del(store, i, handle)
+                    return res
 
     def setdefault(self, key, default=0):
         """
-        If key is in the dictionary, return it. Otherwise, set it to the default
-        value.
+        If key is in the dictionary, return it. Otherwise, set it to the
+        default value.
         """
-        val = self._lookup(key).value
-        if val is None:
-            self[key] = default
+        key_hash = self.hasher(key)
+        store, i, handle = self._lookup(key, key_hash)
+        if handle is None:
+            assert default is not None and key is not None, \
+                "key and value must not be None"
+            self._insert(key, default, key_hash)
             return default
-        return val
-
-    def _lookup(self, key):
-        """
-        Find the entry for a key.
-        """
-        key_hash = self.hash(key)
-        i = key_hash
-        LL = self.table[i]
-        k = 0
-        while k<len(LL):
-            if compare(LL[k].key, key):
-                return LL[k]
-            k+=1
-        k = 0
-        while k<len(LL):
-            if LL[k].key == None:
-                return LL[k]
-            k+=1
-        LL.append(Entry())
-        return LL[k]
-
-    def _insert(self, key, value):
+        return store.value(handle)
+
+    def bucket_count(self):
         """
-        Add a new value to the dictionary or replace an old one.
+        Return the number of buckets new entries are added to. While
+        rehashing, this is the size of the new table.
         """
-        entry = self._lookup(key)
-        if entry.value is None:
-            self.used += 1
-            if entry.key is not dummy:
-                self.filled += 1
-        entry.key = key
-        entry.hash = self.hash(key)
-        entry.value = value
+        if self.new_buckets is not None:
+            return self.new_buckets.size
+        return self.size
+
+    def chain_histogram(self):
+        """
+        Return a list whose k-th element is the number of buckets with a
+        chain of length k. While rehashing, both tables are counted.
+        """
+        histogram = [0]
+        for store in (self.buckets, self.new_buckets):
+            if store is None:
+                continue
+            for i in range(store.size):
+                length = store.chain_length(i)
+                while len(histogram) <= length:
+                    histogram.append(0)
+                histogram[length] += 1
+        return histogram
+
+    def enable_stats(self):
+        """
+        Start counting the chain entries looked at by every lookup and
+        timing every rehash, from zero. The counting versions of _lookup and
+        _resize are stored on the instance, so a table that does not count
+        runs the plain methods without any check. An incremental rehash is
+        timed when it starts, the steps made by later operations are not.
+        """
+        self.table_stats = TableStats()
+        self._lookup = self._counted_lookup
+        self._resize = self._timed_resize
+
+    def disable_stats(self):
+        """
+        Stop counting and drop the counters.
+        """
+        self.table_stats = None
+        for name in ('_lookup', '_resize'):
+            self.__dict__.pop(name, None)
+
+    def _counted_lookup(self, key, key_hash):
+        store, i, handle = type(self)._lookup(self, key, key_hash)
+        # The entries before the one found, or the whole chain.
+        probes = 0
+        for other in store.handles(i):
+            probes += 1
+            if other == handle:
+                break
+        self.table_stats.record_lookup(probes)
+        return store, i, handle
+
+    def _timed_resize(self, minused):
+        t1 = default_timer()
+        type(self)._resize(self, minused)
+        self.table_stats.record_rebuild('resize', default_timer() - t1)
+
+    def stats(self):
+        """
+        Return a snapshot of the shape of the table as a dict:
+
+           * size, used - As the attributes.
+           * load - The average chain length.
+           * chain_histogram - The result of chain_histogram.
+           * max_chain - The length of the longest chain.
+           * empty_ratio - The fraction of buckets with an empty chain.
+           * rehashing - The result of rehash_progress.
+           * counters - The counters of lookups and rehashes, see
+             tablestats.TableStats.snapshot, or None if counting is
+             disabled.
+        """
+        chains = self.chain_histogram()
+        buckets = sum(chains)
+        return {
+            'size': self.size,
+            'used': self.used,
+            'load': self.used/self.size,
+            'chain_histogram': chains,
+            'max_chain': len(chains) - 1,
+            'empty_ratio': chains[0]/buckets,
+            'rehashing': self.rehash_progress(),
+            'counters': None if self.table_stats is None
+            else self.table_stats.snapshot(),
+            }
+
+    def rehash_progress(self):
+        """
+        Return the fraction of the old buckets moved by the current rehash,
+        or None if the table is not being rehashed.
+        """
+        if self.new_buckets is None:
+            return None
+        return self.rehash_pos / self.size
 
-    def _del(self, entry):
+    def _lookup(self, key, key_hash):
+        """
+        Find the entry for a key with the given full hash. Return the store
+        and the bucket holding it, and its handle, which is None if the key
+        is not in the table. The hashes are compared first, so the (possibly
+        expensive) comparison of the keys is only done when they match.
         """
-        Mark an entry as free with the dummy key.
+        store = self.buckets
+        i = key_hash & (store.size - 1)
+        if i >= self.rehash_pos:
+            handle = store.find(i, key, key_hash)
+            if handle is not None or self.new_buckets is None:
+                return store, i, handle
+        # The bucket has been moved to the new table already.
+        store = self.new_buckets
+        i = key_hash & (store.size - 1)
+        return store, i, store.find(i, key, key_hash)
+
+    def _insert(self, key, value, key_hash):
         """
-        entry.key = dummy
-        entry.value = None
+        Add a new value to the dictionary or replace an old one.
+        """
+        store, i, handle = self._lookup(key, key_hash)
+        if handle is not None:
+            store.set_value(handle, value)
+            return
+        # While rehashing, new entries go to the new table.
+        if self.new_buckets is not None:
+            store = self.new_buckets
+            i = key_hash & (store.size - 1)
+        store.add(i, key, value, key_hash)
+        self.used += 1
+        self.version += 1
+        if store.chain_length(i) > self.chain_limit + self.used // store.size:
+            self._flooded()
+        if self.new_buckets is not None:
+            self._rehash_step()
+        elif self.resizing and self.used > self.max_load*self.size:
+            self._resize(self.growth*self.used)
+
+    def _del(self, store, i, handle):
+        """
+        Remove an entry from bucket i of a store.
+        """
+        store.remove(i, handle)
         self.used -= 1
+        self.version += 1
+        if self.new_buckets is not None:
+            self._rehash_step()
+        elif self.resizing and self.size > self.minsize and \
+                self.used < self.min_load*self.size:
+            self._resize(self.growth*self.used)
+
+    def _resize(self, minused):
+        """
+        Rehash the dictionary into a table with more than minused buckets.
+        The stored full hashes are reused, so no key is hashed again.
+        """
+        newsize = self.minsize
+        # Find the smallest value for newsize.
+        while newsize <= minused:
+            newsize <<= 1
+        self.new_buckets = self.bucket_class(newsize)
+        self.rehash_pos = 0
+        if not self.incremental:
+            self._rehash_step(self.size)
+
+    def _rehash_step(self, steps = None):
+        """
+        Move the chains of the next steps buckets of the old table to the
+        new one. When all of them are moved, the new table replaces the old.
+        """
+        # Entries move between the stores.
+        self.version += 1
+        old = self.buckets
+        new = self.new_buckets
+        mask = new.size - 1
+        end = min(old.size, self.rehash_pos +
+                  (self.rehash_steps if steps is None else steps))
+        for i in range(self.rehash_pos, end):
+            for key_hash, key, value in old.take(i):
+                new.add(key_hash & mask, key, value, key_hash)
+        self.rehash_pos = end
+        if end == old.size:
+            self.buckets = new
+            self.size = new.size
+            self.new_buckets = None
+            self.rehash_pos = 0
+            self._set_chain_limit()
+
+    def _set_chain_limit(self):
+        if self.flood_limit is None:
+            self.chain_limit = sys.maxsize
+        else:
+            self.chain_limit = \
+                (self.flood_limit*self.size.bit_length()) << self.reseeds
+
+    def _flooded(self):
+        if hasattr(self.hasher, "seed"):
+            self.reseed()
+        else:
+            # The hasher can not be reseeded, so stop checking.
+            self.flood_limit = None
+            self._set_chain_limit()
+
+    def reseed(self):
+        """
+        Replace the hasher with one of the same kind with a new random seed
+        and rehash all entries with it at once. Keys chosen to collide under
+        the old seed are spread over the buckets again. Raise ValueError if
+        the hasher does not take a seed.
+        """
+        hasher = reseeded(self.hasher)
+        if hasher is None:
+            raise ValueError("the hasher has no seed")
+        if self.new_buckets is not None:
+            self._rehash_step(self.size)
+        self.hasher = hasher
+        self.reseeds += 1
+        self.version += 1
+        old = self.buckets
+        new = self.bucket_class(old.size)
+        mask = new.size - 1
+        for i in range(old.size):
+            for key_hash, key, value in old.take(i):
+                key_hash = hasher(key)
+                new.add(key_hash & mask, key, value, key_hash)
+        self.buckets = new
+        self._set_chain_limit()
 
     def __getitem__(self, key):
-        value = self._lookup(key).value
-        if value is None:
+        store, i, handle = self._lookup(key, self.hasher(key))
+        if handle is None:
             # Check if we're a subclass.
             if type(self) is not Dict:
                 # Try to call the __missing__ method.
@@ -230,55 +775,48 @@ class Dict(object):
                 if missing is not None:
                     return missing(key)
             raise KeyError("no such key: {0!r}".format(key))
-        return value
+        return store.value(handle)
 
     def __setitem__(self, key, what):
         # None is used as a marker for empty entries, so it can't be in a
         # dictionary.
         assert what is not None and key is not None, \
             "key and value must not be None"
-        self._insert(key, what)
+        self._insert(key, what, self.hasher(key))
 
     def __delitem__(self, key):
-        entry = self._lookup(key)
-        if entry.value is None:
+        store, i, handle = self._lookup(key, self.hasher(key))
+        if handle is None:
             raise KeyError("no such key: {0!r}".format(key))
-        self._del(entry)
+        self._del(store, i, handle)
 
     def __contains__(self, key):
         """
         Check if a key is in the dictionary.
         """
-        key_hash = self.hash(key)
-        i = key_hash
-        LL = self.table[i]
-        k = 0
-        while k<len(LL):
-            if compare(LL[k].key, key):
-                return True
-            k+=1
-        return False
+        return self._lookup(key, self.hasher(key))[2] is not None
 
     def __eq__(self, other):
         if not isinstance(other, Dict):
             try:
                 # Try to coerce the other to a Dict, so we can compare it.
-                other = Dict(other)
-            except TypeError:
+                coerced = Dict()
+                coerced.update(other)
+                other = coerced
+            except (TypeError, ValueError):
                 return NotImplemented
         if self.used != other.used:
             # They're not the same size.
             return False
         # Look through the table and compare every entry, breaking out early if
         # we find a difference.
-        for entry in self.table:
-            if entry.value is not None:
-                try:
-                    bval = other[entry.key]
-                except KeyError:
-                    return False
-                if not bval == entry.value:
-                    return False
+        for key, value in self.iteritems():
+            try:
+                bval = other[key]
+            except KeyError:
+                return False
+            if not bval == value:
+                return False
         return True
 
     def __ne__(self, other):
@@ -286,24 +824,60 @@ class Dict(object):
 
     def keys(self):
         """
-        Return a list of keys in the dictionary.
+        Return a live view of the keys in the dictionary, see the views
+        module.
         """
-        return [entry for entry in self]
+        return views.KeysView(self)
 
     def values(self):
         """
-        Return a list of values in the dictionary.
+        Return a live view of the values in the dictionary.
         """
-        return [self[entry] for entry in self]
+        return views.ValuesView(self)
 
     def items(self):
         """
-        Return a list of key-value pairs.
+        Return a live view of the key-value pairs in the dictionary.
         """
-        return [(entry, self[entry]) for entry in self]
+        return views.ItemsView(self)
+
+    def _iter_items(self):
+        """
+        Generate the key-value pairs, walking each store once.
+        """
+        version = self.version
+        for store in (self.buckets, self.new_buckets):
+            if store is None:
+                continue
+            for item in store.entries():
+                yield item
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+
+    def _iter_keys(self):
+        for key, value in self._iter_items():
+            yield key
+
+    def _iter_values(self):
+        for key, value in self._iter_items():
+            yield value
+
+    def _reversed_items(self):
+        """
+        Generate the key-value pairs in the reverse order of iteration.
+        """
+        version = self.version
+        for item in reversed(list(self._iter_items())):
+            yield item
+            if self.version != version:
+                raise RuntimeError("dictionary changed during iteration")
 
     def __iter__(self):
-        return DictKeysIterator(self)
+        return self._iter_keys()
+
+    def __reversed__(self):
+        for key, value in self._reversed_items():
+            yield key
 
     def itervalues(self):
         """
@@ -324,11 +898,91 @@ class Dict(object):
         return DictItemsIterator(self)
 
     def _from_sequence(self, seq):
-        for double in seq:
-            if len(double) != 2:
-                raise ValueError("{0!r} doesn't have a length of 2".format(
-                        double))
-            self[double[0]] = double[1]
+        self.update(seq)
+
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping (anything with a keys method)
+        or a sequence of pairs, and from the keyword arguments, as dict.update
+        does.
+        """
+        if hasattr(other, "keys"):
+            keys = list(other.keys())
+            values = [other[key] for key in keys]
+        else:
+            keys = []
+            values = []
+            for double in other:
+                if len(double) != 2:
+                    raise ValueError("{0!r} doesn't have a length of 2".format(
+                            double))
+                keys.append(double[0])
+                values.append(double[1])
+        for key, value in kwargs.items():
+            keys.append(key)
+            values.append(value)
+        self.set_many(keys, values)
+
+    def _reserve(self, n):
+        """
+        Make room for n more entries, so that inserting them does not rehash
+        the table again.
+        """
+        if self.new_buckets is not None:
+            self._rehash_step(self.size)
+        if self.resizing and self.used + n > self.max_load*self.size:
+            self._resize((self.used + n)/self.max_load)
+            # The batch pays for all its insertions anyway, so the rehash is
+            # finished at once even in incremental mode.
+            if self.new_buckets is not None:
+                self._rehash_step(self.size)
+
+    def set_many(self, keys, values):
+        """
+        Set the values of many keys at once. The table is rehashed at most
+        once for the whole batch and the keys are hashed in one pass.
+        """
+        keys = list(keys)
+        values = list(values)
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        # None is used as a marker for empty entries, so it can't be in a
+        # dictionary.
+        assert None not in keys and None not in values, \
+            "key and value must not be None"
+        self._reserve(len(keys))
+        insert = self._insert
+        for key, value, key_hash in zip(keys, values,
+                                        map(self.hasher, keys)):
+            insert(key, value, key_hash)
+
+    def get_many(self, keys, default=0):
+        """
+        Return a list of the values for many keys, with the default for keys
+        that are not in the dictionary.
+        """
+        keys = list(keys)
+        lookup = self._lookup
+        result = []
+        for key, key_hash in zip(keys, map(self.hasher, keys)):
+            store, i, handle = lookup(key, key_hash)
+            result.append(default if handle is None else store.value(handle))
+        return result
+
+    def delete_many(self, keys):
+        """
+        Remove many keys at once. Keys that are not in the dictionary are
+        ignored. Return the number of keys removed.
+        """
+        keys = list(keys)
+        lookup = self._lookup
+        removed = 0
+        for key, key_hash in zip(keys, map(self.hasher, keys)):
+            store, i, handle = lookup(key, key_hash)
+            if handle is not None:
+                self._del(store, i, handle)
+                removed += 1
+        return removed
 
     def get(self, key, default=0):
         """
@@ -339,6 +993,64 @@ class Dict(object):
         except KeyError:
             return default
 
+    def _config(self):
+        """
+        Return the arguments that create an empty dictionary configured as
+        this one.
+        """
+        return dict(size=self.minsize, hasher=self.hasher,
+                    buckets=self.bucket_class, resizing=self.resizing,
+                    max_load=self.max_load, min_load=self.min_load,
+                    growth=self.growth, incremental=self.incremental,
+                    rehash_steps=self.rehash_steps,
+                    flood_limit=self.flood_limit)
+
+    def dump(self, fp):
+        """
+        Write a snapshot of the dictionary to the binary file fp, see the
+        snapshot module. The entries are written bucket by bucket with their
+        full hashes, so load does not hash any key.
+        """
+        if self.new_buckets is not None:
+            self._rehash_step(self.size)
+        store = self.buckets
+        hashes = array('Q')
+        keys = []
+        values = []
+        for i in range(self.size):
+            for handle in store.handles(i):
+                hashes.append(store.hash(handle))
+                keys.append(store.key(handle))
+                values.append(store.value(handle))
+        state = dict(config=self._config(), size=self.size, keys=keys,
+                     values=values)
+        snapshot.dump(fp, SNAPSHOT_MAGIC, self.hasher, state, [hashes])
+
+    @classmethod
+    def load(cls, fp):
+        """
+        Return a dictionary read from a snapshot written by dump.
+        """
+        state, same_hashes = snapshot.load(fp, SNAPSHOT_MAGIC)
+        d = cls(**state["config"])
+        keys = state["keys"]
+        hashes = array('Q', [0])*len(keys)
+        snapshot.read_array(fp, hashes, state)
+        if not same_hashes:
+            # The keys hash differently in this process.
+            hashes = array('Q', [d.hasher(key) for key in keys])
+        d.size = state["size"]
+        d._set_chain_limit()
+        d.buckets = store = d.bucket_class(d.size)
+        mask = d.size - 1
+        for key_hash, key, value in zip(hashes, keys, state["values"]):
+            store.add(key_hash & mask, key, value, key_hash)
+        d.used = len(keys)
+        return d
+
+    def __reduce__(self):
+        return snapshot.from_bytes, (type(self), snapshot.to_bytes(self))
+
     def __len__(self):
         return self.used
 
@@ -346,6 +1058,15 @@ class Dict(object):
         r = ["{0!r} : {1!r}".format(k, v) for k, v in self.items()]
         return "Dict({" + ", ".join(r) + "})"
 
+    def occupancy(self):
+        """
+        Return an occupancy.Occupancy of the chains of the buckets, for
+        exporting them as an image or JSON without a display. While
+        rehashing, only the old table is analyzed, and the buckets already
+        moved show as empty.
+        """
+        return Occupancy.from_chain_lengths(self.buckets.chain_lengths())
+
     def draw_init(self, dimension):
 
         # Initialize the pygame modules
@@ -374,9 +1095,10 @@ class Dict(object):
 
         # Draw every cell in the board as a rectangle on the screen
         i = j = 0
-        for cell in self.table:
-            shade = min(50*len(cell), 255)
-            print(len(cell), end=' ')
+        for cell in range(self.size):
+            length = self.buckets.chain_length(cell)
+            shade = min(50*length, 255)
+            print(length, end=' ')
             rectangle = (j*cell_dimension, i*cell_dimension,
                          cell_dimension, cell_dimension)
             pygame.draw.rect(self.bg, (shade, shade, shade), rectangle)
@@ -410,82 +1132,60 @@ class Dict(object):
                     quit = True
 
 class DictIterator(object):
+    """
+    An iterator over a dictionary that knows how many items are left. It
+    stops with a RuntimeError if the dictionary is changed, other than by
+    setting the value of a key that is in it already.
+    """
 
     def __init__(self, d):
         self.d = d
-        self.used = self.d.used
-        self.len = self.d.used
-        self.pos1 = 0
-        self.pos2 = 0
+        self.left = d.used
+        self.items = getattr(d, self.generator)()
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        # Check if the dictionary has been mutated under us.
-        if self.used != self.d.used:
-            # Make this state permanent.
-            self.used = -1
-            raise RuntimeError("dictionary size changed during iteration")
-        i = self.pos1
-        k = self.pos2
-        while i < self.d.size:
-            if len(self.d.table[i]) > 0:
-                if k < len(self.d.table[i]):
-                    self.pos2 = k+1
-                    self.pos1 = i
-                    if self.d.table[i][k].key == None or\
-                       self.d.table[i][k].key == dummy:
-                        k += 1
-                        continue
-                    return self._extract(self.d.table[i][k])
-                else:
-                    k = 0
-                    self.pos2 = 0
-                    i += 1
-            else:
-                k = 0
-                self.pos2 = 0
-                i+=1
-        self.pos1 = i+1
-        if i >= self.d.size:
-            # We're done.
-            raise StopIteration
-        self.len = self.len-1
+        item = next(self.items)
+        self.left -= 1
+        return item
 
     next = __next__
 
-    def _extract(self, entry):
-        return getattr(entry, self.kind)
+    def __length_hint__(self):
+        return self.left
 
-    def __len__(self):
-        return self.len
+    __len__ = __length_hint__
 
 class DictKeysIterator(DictIterator):
-    kind = "key"
+
+    generator = "_iter_keys"
 
 class DictValuesIterator(DictIterator):
-    kind = "value"
+
+    generator = "_iter_values"
 
 class DictItemsIterator(DictIterator):
 
-    def _extract(self, entry):
-        return entry.key, entry.value
+    generator = "_iter_items"
 
 @print_timing
-def testing(dict_size = 2000, num_items = 1000):
+def testing(dict_size = 2000, num_items = 1000, buckets = "list"):
     random.seed(3)
-    cd = Dict(dict_size)
+    cd = Dict(dict_size, buckets = buckets, resizing = False)
+    dict_size = cd.size
     i = 0
     while i < num_items:
         s = ''.join(random.choice(string.ascii_letters) for k in range(10))
         cd[s] = random.randint(3,9)
         i += 1
     ll1 = list(cd.keys())
-    counts['compare'] = 0
+    cd.enable_stats()
     for i in range(len(ll1)):
         ll1[i] in cd
-    print('Average number of comparisons: ', old_div((1.0*counts['compare']),len(ll1)))
+    print('Average number of probes: ',
+          cd.stats()['counters']['probes_per_lookup'])
     print('Load factor: ', old_div((1.0*len(ll1)),dict_size))
 
 if __name__ == '__main__':
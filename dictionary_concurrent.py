@@ -0,0 +1,315 @@
+"""
+A dictionary that can be shared by many threads, built from the chaining
+tables in dictionary_chain.
+
+The keys are split over a fixed number of stripes by the top bits of their
+full hash. Each stripe is a dictionary_chain.Dict with its own lock, so
+threads that write to different stripes do not wait for each other, and a
+stripe rehashes without stopping the others. The chain tables find buckets
+with the low bits of the hash, so each stripe still spreads its keys over all
+of its buckets.
+
+Reads do not take the lock. Each stripe has a version that a writer
+increments before and after changing the stripe (a sequence lock). A reader
+notes the version, looks up the key and checks that the version has not
+changed and was even, that is, no write was in progress. Otherwise, it reads
+again under the lock.
+
+Running this module compares the throughput of ConcurrentDict with a single
+dictionary_chain.Dict behind one global lock, for several numbers of threads.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import random, threading
+from timeit import default_timer
+from hashing import MixHasher, random_seed
+import dictionary_chain
+
+class ConcurrentDict(object):
+    """
+    A thread safe mapping with lock striping.
+
+    Attributes:
+        * stripes - The number of stripes. Always a power of two.
+        * shift - The hash is shifted right by this to get the stripe of a
+          key.
+        * hasher - Maps keys to full hashes, shared by all stripes. By
+          default, a MixHasher with a random seed. The stripes are never
+          reseeded; pass buckets="tree" to keep chains of colliding keys
+          fast.
+        * segments - The chain table of each stripe.
+        * locks - The lock of each stripe.
+        * versions - The version of each stripe. It is odd while a write is
+          in progress.
+
+    The other arguments are passed to the chain table of each stripe, whose
+    initial size is size divided by the number of stripes.
+    """
+
+    def __init__(self, size = 1024, stripes = 16, hasher = None, **kwargs):
+        if stripes < 1:
+            raise ValueError("there must be at least one stripe")
+        self.stripes = 1 << (stripes - 1).bit_length()
+        self.shift = 64 - (self.stripes - 1).bit_length()
+        self.hasher = MixHasher(random_seed()) if hasher is None else hasher
+        # The stripes share the hasher, so they can not reseed themselves.
+        kwargs["flood_limit"] = None
+        segment_size = max(1, size // self.stripes)
+        self.segments = [dictionary_chain.Dict(segment_size,
+                                               hasher=self.hasher, **kwargs)
+                         for j in range(self.stripes)]
+        self.locks = [threading.Lock() for j in range(self.stripes)]
+        self.versions = [0]*self.stripes
+
+    def _stripe(self, key_hash):
+        # With one stripe, the shift is 64 and the result always 0.
+        return key_hash >> self.shift
+
+    def _read(self, key, key_hash):
+        """
+        Return the value for a key with the given full hash, or None if the
+        key is not in the dictionary.
+        """
+        j = self._stripe(key_hash)
+        segment = self.segments[j]
+        version = self.versions[j]
+        if not version & 1:
+            try:
+                store, i, handle = segment._lookup(key, key_hash)
+                value = None if handle is None else store.value(handle)
+            except (IndexError, AttributeError, TypeError):
+                # The chains were changed under us.
+                pass
+            else:
+                if self.versions[j] == version:
+                    return value
+        with self.locks[j]:
+            store, i, handle = segment._lookup(key, key_hash)
+            return None if handle is None else store.value(handle)
+
+    def _begin(self, j):
+        """
+        Take the lock of stripe j and mark the stripe as being written.
+        """
+        self.locks[j].acquire()
+        self.versions[j] += 1
+
+    def _end(self, j):
+        self.versions[j] += 1
+        self.locks[j].release()
+
+    def __getitem__(self, key):
+        value = self._read(key, self.hasher(key))
+        if value is None:
+            raise KeyError("no such key: {0!r}".format(key))
+        return value
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        value = self._read(key, self.hasher(key))
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self._read(key, self.hasher(key)) is not None
+
+    def __setitem__(self, key, what):
+        # None is used as a marker for empty entries, so it can't be in a
+        # dictionary.
+        assert what is not None and key is not None, \
+            "key and value must not be None"
+        key_hash = self.hasher(key)
+        j = self._stripe(key_hash)
+        self._begin(j)
+        try:
+            self.segments[j]._insert(key, what, key_hash)
+        finally:
+            self._end(j)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def pop(self, *args):
+        """
+        Remove and return the value for a key, atomically.
+        """
+        key = args[0]
+        key_hash = self.hasher(key)
+        j = self._stripe(key_hash)
+        segment = self.segments[j]
+        self._begin(j)
+        try:
+            store, i, handle = segment._lookup(key, key_hash)
+            if handle is not None:
+                value = store.value(handle)
+                segment._del(store, i, handle)
+                return value
+        finally:
+            self._end(j)
+        if len(args) == 2:
+            return args[1]
+        raise KeyError("no such key: {0!r}".format(key))
+
+    def setdefault(self, key, default=0):
+        """
+        If key is in the dictionary, return it. Otherwise, set it to the
+        default value. The lookup and the insertion are atomic.
+        """
+        return self.compute_if_absent(key, lambda key: default)
+
+    def compute_if_absent(self, key, func):
+        """
+        Return the value for key. If the key is not in the dictionary, set it
+        to func(key) first. No other thread can set the key in between, so
+        func is called at most once per key. func is called while holding the
+        lock of the stripe, so it must not use the dictionary.
+        """
+        key_hash = self.hasher(key)
+        value = self._read(key, key_hash)
+        if value is not None:
+            return value
+        j = self._stripe(key_hash)
+        segment = self.segments[j]
+        self._begin(j)
+        try:
+            store, i, handle = segment._lookup(key, key_hash)
+            if handle is not None:
+                return store.value(handle)
+            value = func(key)
+            assert value is not None and key is not None, \
+                "key and value must not be None"
+            segment._insert(key, value, key_hash)
+            return value
+        finally:
+            self._end(j)
+
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping or a sequence of pairs, and
+        from the keyword arguments, as dict.update does. Each pair is set
+        atomically, the whole update is not.
+        """
+        if hasattr(other, "keys"):
+            other = [(key, other[key]) for key in other.keys()]
+        for key, value in other:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def clear(self):
+        """
+        Clear the dictionary of all data, one stripe at a time.
+        """
+        for j in range(self.stripes):
+            self._begin(j)
+            try:
+                self.segments[j].clear()
+            finally:
+                self._end(j)
+
+    def items(self):
+        """
+        Return a list of key-value pairs. Each stripe is copied under its
+        lock, so the list contains every key that was in the dictionary for
+        the whole call.
+        """
+        result = []
+        for j in range(self.stripes):
+            with self.locks[j]:
+                result.extend(self.segments[j].items())
+        return result
+
+    def keys(self):
+        """
+        Return a list of keys in the dictionary, see items.
+        """
+        return [key for key, value in self.items()]
+
+    def values(self):
+        """
+        Return a list of values in the dictionary, see items.
+        """
+        return [value for key, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(segment.used for segment in self.segments)
+
+    def __repr__(self):
+        r = ["{0!r} : {1!r}".format(k, v) for k, v in self.items()]
+        return "ConcurrentDict({" + ", ".join(r) + "})"
+
+class GlobalLockDict(object):
+    """
+    A dictionary_chain.Dict behind a single lock, for comparison.
+    """
+
+    def __init__(self, size = 1024, **kwargs):
+        self.d = dictionary_chain.Dict(size, **kwargs)
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.d[key]
+
+    def get(self, key, default=0):
+        with self.lock:
+            return self.d.get(key, default)
+
+    def __setitem__(self, key, what):
+        with self.lock:
+            self.d[key] = what
+
+    def pop(self, *args):
+        with self.lock:
+            return self.d.pop(*args)
+
+    def __len__(self):
+        return len(self.d)
+
+def benchmark(num_keys = 10000, ops = 200000, read_fraction = 0.9,
+              threads = (1, 2, 4, 8)):
+    """
+    Print the throughput of a mixed workload of lookups and insertions (of
+    keys that are mostly present already) split over several threads.
+    """
+    keys = list(range(num_keys))
+    for num_threads in threads:
+        for cls in (GlobalLockDict, ConcurrentDict):
+            d = cls()
+            for key in keys:
+                d[key] = key
+            per_thread = ops // num_threads
+
+            def work(seed):
+                rng = random.Random(seed)
+                for n in range(per_thread):
+                    key = rng.randrange(2*num_keys)
+                    if rng.random() < read_fraction:
+                        d.get(key)
+                    else:
+                        d[key] = n
+
+            workers = [threading.Thread(target=work, args=(t,))
+                       for t in range(num_threads)]
+            t1 = default_timer()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            t2 = default_timer()
+            print('%-15s %d threads %10.0f ops/s'
+                  % (cls.__name__, num_threads,
+                     per_thread*num_threads/(t2-t1)))
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,596 @@
+"""
+A mapping implemented as a bucketized cuckoo hash table, for read paths that
+need a bound on the worst-case lookup.
+
+Every key has two buckets of bucket_slots slots each, and is always in one
+of them (or in a small stash). A lookup looks at these two buckets and the
+stash, and nothing else, however full the table is. The two bucket indices
+are the low bits and the high bits of the full hash of the key from the
+hasher (see the hashing module); the hashers there mix every bit of the
+key into every bit of the hash, so the two are independent.
+
+An insertion into two full buckets moves an entry of one of them to its
+other bucket, which may in turn move another entry, as a cuckoo pushes the
+eggs out of a nest. After max_kicks moves the table is assumed to contain a
+cycle and the homeless entry goes to the stash. When the stash overflows,
+the table is rehashed with a new seed, and grown if that does not help.
+Keys whose full hashes are equal under every seed can not be separated
+this way; when a new seed does not shrink the stash, the stash is allowed
+to hold twice as many entries before the next rehash.
+
+With four slots per bucket, the table can be filled to more than 90%
+before insertions start to fail.
+
+Running this module compares lookups with a linear probing
+dictionary_oa.Dict at load factors from 0.5 to 0.95.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import random
+from array import array
+from timeit import default_timer
+from hashing import MixHasher, random_seed, reseeded
+from tablestats import TableStats
+import views
+
+class CuckooDict(object):
+    """
+    A mapping interface implemented as a bucketized cuckoo hash table, see
+    the module description. Iteration goes over the slots in order, so it
+    does not follow the order of insertion.
+
+    Attributes:
+        * used - The number of entries.
+        * size - The number of buckets. Always a power of two.
+        * bucket_slots - The number of slots of a bucket.
+        * shift - The full hash is shifted right by this to get the second
+          bucket of a key.
+        * slot_keys, slot_values - The entries of the slots; bucket b has
+          the slots b*bucket_slots to (b+1)*bucket_slots - 1. Empty slots
+          hold None.
+        * hashes - The full hashes of the entries of the slots, so entries
+          can be moved and the table rebuilt without hashing keys again.
+        * stash_keys, stash_values, stash_hashes - The entries that did not
+          fit. The stash is searched by every lookup, so it is kept small.
+        * stash_size - When the stash holds more entries than this, the
+          table is rehashed.
+        * stash_limit - The number of entries the stash currently holds
+          before the table is rehashed. It starts at stash_size and is
+          doubled when a rehash with a new seed does not shrink the stash,
+          so keys that collide whatever the seed do not make the table
+          rehash on every insertion.
+        * max_load - Maximum fraction of used slots before growing.
+        * max_kicks - The number of entries an insertion moves before it
+          gives up.
+        * hasher - Maps keys to full hashes. By default, a MixHasher with a
+          random seed.
+        * rehashes - The number of times the table was rehashed because the
+          stash overflowed.
+        * table_stats - The counters of lookups and rehashes, a
+          tablestats.TableStats, or None if counting is disabled. See
+          enable_stats.
+        * version - Incremented by every change other than setting the value
+          of a key that is in the dictionary already. Iterators stop with an
+          error when it changes.
+    """
+
+    def __init__(self, size = 111, bucket_slots = 4, max_load = 0.9,
+                 hasher = None, stash_size = 4, max_kicks = 256):
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be in (0, 1)")
+        if bucket_slots < 1:
+            raise ValueError("there must be at least one slot per bucket")
+        self.bucket_slots = bucket_slots
+        self.max_load = max_load
+        self.stash_size = stash_size
+        self.max_kicks = max_kicks
+        self.hasher = MixHasher(random_seed()) if hasher is None else hasher
+        self.rng = random.Random(random_seed())
+        # Buckets are found by masking the hash, so round up to a power of
+        # two.
+        buckets = max(1, -(-size // bucket_slots))
+        self.size = 1 << (buckets - 1).bit_length()
+        self.minsize = self.size
+        self.rehashes = 0
+        self.version = 0
+        self.table_stats = None
+        self.clear()
+
+    @classmethod
+    def fromkeys(cls, keys, value=0):
+        """
+        Return a new dictionary from a sequence of keys.
+        """
+        d = cls()
+        for key in keys:
+            d[key] = value
+        return d
+
+    def clear(self):
+        """
+        Clear the dictionary of all data.
+        """
+        self.version += 1
+        self._allocate(self.minsize)
+        self.used = 0
+        self.stash_limit = self.stash_size
+
+    def _allocate(self, size):
+        """
+        Make the table empty with size buckets.
+        """
+        self.size = size
+        self.shift = 64 - (size - 1).bit_length()
+        slots = size*self.bucket_slots
+        self.slot_keys = [None]*slots
+        self.slot_values = [None]*slots
+        self.hashes = array('Q', [0])*slots
+        self.stash_keys = []
+        self.stash_values = []
+        self.stash_hashes = []
+
+    def _lookup(self, key, key_hash):
+        """
+        Return the position of the entry for key: a slot, or the size of the
+        slots plus the index in the stash. Return -1 if the key is not in the
+        table. The hashes are compared first, so the (possibly expensive)
+        comparison of the keys is only done when they match.
+        """
+        keys = self.slot_keys
+        hashes = self.hashes
+        slots = self.bucket_slots
+        start = (key_hash & (self.size - 1))*slots
+        for n in range(start, start + slots):
+            if hashes[n] == key_hash and keys[n] is not None and \
+                    (keys[n] is key or keys[n] == key):
+                return n
+        start = (key_hash >> self.shift)*slots
+        for n in range(start, start + slots):
+            if hashes[n] == key_hash and keys[n] is not None and \
+                    (keys[n] is key or keys[n] == key):
+                return n
+        if self.stash_keys:
+            for n, other in enumerate(self.stash_keys):
+                if self.stash_hashes[n] == key_hash and \
+                        (other is key or other == key):
+                    return len(keys) + n
+        return -1
+
+    def enable_stats(self):
+        """
+        Start counting the slots looked at by every lookup and timing every
+        rehash, from zero. The counting versions of _lookup and _rehash are
+        stored on the instance, so a table that does not count runs the
+        plain methods without any check.
+        """
+        self.table_stats = TableStats()
+        self._lookup = self._counted_lookup
+        self._rehash = self._timed_rehash
+
+    def disable_stats(self):
+        """
+        Stop counting and drop the counters.
+        """
+        self.table_stats = None
+        for name in ('_lookup', '_rehash'):
+            self.__dict__.pop(name, None)
+
+    def _counted_lookup(self, key, key_hash):
+        n = type(self)._lookup(self, key, key_hash)
+        # The slots before the one found in the buckets, which are searched
+        # in order, and then the stash.
+        slots = self.bucket_slots
+        first = (key_hash & (self.size - 1))*slots
+        second = (key_hash >> self.shift)*slots
+        if first <= n < first + slots:
+            probes = n - first + 1
+        elif second <= n < second + slots:
+            probes = slots + n - second + 1
+        elif n >= 0:
+            probes = 2*slots + n - len(self.slot_keys) + 1
+        else:
+            probes = 2*slots + len(self.stash_keys)
+        self.table_stats.record_lookup(probes)
+        return n
+
+    def _timed_rehash(self, size, reseed = False):
+        t1 = default_timer()
+        type(self)._rehash(self, size, reseed)
+        self.table_stats.record_rebuild('reseed' if reseed else 'resize',
+                                        default_timer() - t1)
+
+    def stats(self):
+        """
+        Return a snapshot of the shape of the table as a dict:
+
+           * size, used, rehashes, stash_limit - As the attributes.
+           * slots - The number of slots.
+           * load - The fraction of slots used, counting the stash.
+           * stash - The number of entries in the stash.
+           * bucket_histogram - A list whose k-th element is the number of
+             buckets with k entries.
+           * counters - The counters of lookups and rehashes, see
+             tablestats.TableStats.snapshot, or None if counting is
+             disabled.
+        """
+        slots = self.bucket_slots
+        keys = self.slot_keys
+        histogram = [0]*(slots + 1)
+        for start in range(0, len(keys), slots):
+            histogram[slots - keys[start:start + slots].count(None)] += 1
+        return {
+            'size': self.size,
+            'used': self.used,
+            'rehashes': self.rehashes,
+            'stash_limit': self.stash_limit,
+            'slots': len(keys),
+            'load': self.used/len(keys),
+            'stash': len(self.stash_keys),
+            'bucket_histogram': histogram,
+            'counters': None if self.table_stats is None
+            else self.table_stats.snapshot(),
+            }
+
+    def _value(self, n):
+        if n < len(self.slot_values):
+            return self.slot_values[n]
+        return self.stash_values[n - len(self.slot_values)]
+
+    def _place(self, key, value, key_hash):
+        """
+        Put a new entry into a free slot of one of its buckets, moving
+        entries to their other bucket to make room. If there is no room after
+        max_kicks moves, the entry left without a slot (not necessarily the
+        new one) goes to the stash and False is returned.
+        """
+        keys = self.slot_keys
+        values = self.slot_values
+        hashes = self.hashes
+        slots = self.bucket_slots
+        mask = self.size - 1
+        shift = self.shift
+        for kick in range(self.max_kicks + 1):
+            first = (key_hash & mask)*slots
+            second = (key_hash >> shift)*slots
+            for start in (first, second):
+                for n in range(start, start + slots):
+                    if keys[n] is None:
+                        keys[n] = key
+                        values[n] = value
+                        hashes[n] = key_hash
+                        return True
+            if kick == self.max_kicks:
+                break
+            # Both buckets are full, so take the place of a random entry in
+            # one of them and carry on placing that entry.
+            n = self.rng.choice((first, second)) + self.rng.randrange(slots)
+            key, keys[n] = keys[n], key
+            value, values[n] = values[n], value
+            key_hash, hashes[n] = hashes[n], key_hash
+        self.stash_keys.append(key)
+        self.stash_values.append(value)
+        self.stash_hashes.append(key_hash)
+        return False
+
+    def _entries(self):
+        """
+        Return a list of the (hash, key, value) triples of all entries.
+        """
+        entries = [(key_hash, key, value) for key_hash, key, value
+                   in zip(self.hashes, self.slot_keys, self.slot_values)
+                   if key is not None]
+        entries.extend(zip(self.stash_hashes, self.stash_keys,
+                           self.stash_values))
+        return entries
+
+    def _rehash(self, size, reseed = False):
+        """
+        Rebuild the table with size buckets, and with a new seed if reseed is
+        True. Try new seeds until the stash holds at most stash_limit
+        entries, growing the table after every three failures. Keys that
+        collide whatever the seed (equal full hashes in more slots than two
+        buckets have) stay in the stash. When a new seed does not shrink the
+        stash, or the table is less than an eighth full, stop and double
+        stash_limit instead.
+        """
+        self.version += 1
+        entries = self._entries()
+        stashed = len(self.stash_keys)
+        failures = 0
+        while True:
+            if reseed:
+                hasher = reseeded(self.hasher)
+                if hasher is not None:
+                    self.hasher = hasher
+                    entries = [(hasher(key), key, value)
+                               for key_hash, key, value in entries]
+            self._allocate(size)
+            place = self._place
+            for key_hash, key, value in entries:
+                place(key, value, key_hash)
+            if len(self.stash_keys) <= self.stash_limit:
+                return
+            if (reseed and len(self.stash_keys) >= stashed) or \
+                    len(entries) < size*self.bucket_slots/8:
+                self.stash_limit = 2*len(self.stash_keys)
+                return
+            failures += 1
+            if failures % 3 == 0:
+                size <<= 1
+            reseed = True
+
+    def _insert(self, key, value, key_hash):
+        """
+        Add a new value to the dictionary or replace an old one.
+        """
+        n = self._lookup(key, key_hash)
+        if n >= 0:
+            if n < len(self.slot_values):
+                self.slot_values[n] = value
+            else:
+                self.stash_values[n - len(self.slot_values)] = value
+            return
+        self.version += 1
+        self.used += 1
+        if self.used > self.max_load*len(self.slot_keys):
+            hasher = self.hasher
+            self._rehash(self.size << 1)
+            if self.hasher is not hasher:
+                # The grown table had to be reseeded, so the new key hashes
+                # differently.
+                key_hash = self.hasher(key)
+        if not self._place(key, value, key_hash) and \
+                len(self.stash_keys) > self.stash_limit:
+            self.rehashes += 1
+            self._rehash(self.size, reseed=True)
+
+    def _del(self, n):
+        """
+        Remove the entry at position n, see _lookup.
+        """
+        self.version += 1
+        self.used -= 1
+        if n < len(self.slot_keys):
+            self.slot_keys[n] = None
+            self.slot_values[n] = None
+            self.hashes[n] = 0
+            return
+        n -= len(self.slot_keys)
+        del self.stash_keys[n]
+        del self.stash_values[n]
+        del self.stash_hashes[n]
+
+    def __getitem__(self, key):
+        n = self._lookup(key, self.hasher(key))
+        if n < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        return self._value(n)
+
+    def __setitem__(self, key, what):
+        # None is used as a marker for empty slots, so it can't be in a
+        # dictionary.
+        assert what is not None and key is not None, \
+            "key and value must not be None"
+        self._insert(key, what, self.hasher(key))
+
+    def __delitem__(self, key):
+        n = self._lookup(key, self.hasher(key))
+        if n < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        self._del(n)
+
+    def __contains__(self, key):
+        return self._lookup(key, self.hasher(key)) >= 0
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        n = self._lookup(key, self.hasher(key))
+        return default if n < 0 else self._value(n)
+
+    def pop(self, *args):
+        """
+        Remove and return the value for a key.
+        """
+        n = self._lookup(args[0], self.hasher(args[0]))
+        if n < 0:
+            if len(args) == 2:
+                return args[1]
+            raise KeyError("no such key: {0!r}".format(args[0]))
+        value = self._value(n)
+        self._del(n)
+        return value
+
+    def popitem(self):
+        """
+        Remove and return any key-value pair from the dictionary.
+        """
+        if self.used == 0:
+            raise KeyError("empty dictionary")
+        if self.stash_keys:
+            item = self.stash_keys[-1], self.stash_values[-1]
+            self._del(len(self.slot_keys) + len(self.stash_keys) - 1)
+            return item
+        for n, key in enumerate(self.slot_keys):
+            if key is not None:
+                item = key, self.slot_values[n]
+                self._del(n)
+                return item
+
+    def setdefault(self, key, default=0):
+        """
+        If key is in the dictionary, return it. Otherwise, set it to the
+        default value.
+        """
+        key_hash = self.hasher(key)
+        n = self._lookup(key, key_hash)
+        if n < 0:
+            assert default is not None and key is not None, \
+                "key and value must not be None"
+            self._insert(key, default, key_hash)
+            return default
+        return self._value(n)
+
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping (anything with a keys method)
+        or a sequence of pairs, and from the keyword arguments, as dict.update
+        does.
+        """
+        if hasattr(other, "keys"):
+            pairs = [(key, other[key]) for key in other.keys()]
+        else:
+            pairs = []
+            for double in other:
+                if len(double) != 2:
+                    raise ValueError("{0!r} doesn't have a length of 2".format(
+                            double))
+                pairs.append(tuple(double))
+        pairs.extend(kwargs.items())
+        for key, value in pairs:
+            self[key] = value
+
+    def __eq__(self, other):
+        if not hasattr(other, "keys"):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        for key, value in self._iter_items():
+            try:
+                if not other[key] == value:
+                    return False
+            except KeyError:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    def keys(self):
+        """
+        Return a live view of the keys in the dictionary, see the views
+        module.
+        """
+        return views.KeysView(self)
+
+    def values(self):
+        """
+        Return a live view of the values in the dictionary.
+        """
+        return views.ValuesView(self)
+
+    def items(self):
+        """
+        Return a live view of the key-value pairs in the dictionary.
+        """
+        return views.ItemsView(self)
+
+    def _iter_items(self):
+        """
+        Generate the key-value pairs, walking the slots and then the stash.
+        """
+        version = self.version
+        for item in zip(self.slot_keys, self.slot_values):
+            if item[0] is not None:
+                yield item
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+        for item in zip(self.stash_keys, self.stash_values):
+            yield item
+            if self.version != version:
+                raise RuntimeError("dictionary changed during iteration")
+
+    def _iter_keys(self):
+        for key, value in self._iter_items():
+            yield key
+
+    def _iter_values(self):
+        for key, value in self._iter_items():
+            yield value
+
+    def _reversed_items(self):
+        """
+        Generate the key-value pairs in the reverse order of iteration.
+        """
+        version = self.version
+        for item in reversed(list(self._iter_items())):
+            yield item
+            if self.version != version:
+                raise RuntimeError("dictionary changed during iteration")
+
+    def __iter__(self):
+        return self._iter_keys()
+
+    def __reversed__(self):
+        for key, value in self._reversed_items():
+            yield key
+
+    def __len__(self):
+        return self.used
+
+    def __repr__(self):
+        r = ["{0!r} : {1!r}".format(k, v) for k, v in self._iter_items()]
+        return "CuckooDict({" + ", ".join(r) + "})"
+
+def percentile(times, fraction):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(fraction*len(times)))]
+
+def benchmark(slots = 1 << 16, loads = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95),
+              samples = 20000):
+    """
+    Fill a CuckooDict and a linear probing dictionary_oa.Dict with the same
+    number of slots to each load factor, and print the mean time per
+    insertion, hit and miss, the 99.9th percentile of the time of single
+    lookups (hits and misses), and the most slots a lookup looked at. A
+    lookup of the cuckoo table looks at two buckets and the stash.
+    """
+    from dictionary_oa import Dict
+    rng = random.Random(3)
+    print('%-6s %-6s %9s %9s %9s %9s %9s %6s' % ('load', 'table', 'insert',
+                                                 'hit', 'miss', 'p99.9',
+                                                 'max', 'stash'))
+    for load in loads:
+        n = int(load*slots)
+        keys = [rng.getrandbits(63) for i in range(n)]
+        misses = [rng.getrandbits(63) for i in range(n)]
+        sample = rng.sample(keys, min(samples, n//2)) + \
+            misses[:min(samples, n//2)]
+        tables = [('linear', Dict(slots, resizing=False, probing="linear",
+                                 flood_limit=None)),
+                  ('cuckoo', CuckooDict(slots, max_load=0.99))]
+        for name, d in tables:
+            t1 = default_timer()
+            for key in keys:
+                d[key] = 1
+            t2 = default_timer()
+            for key in keys:
+                key in d
+            t3 = default_timer()
+            for key in misses:
+                key in d
+            t4 = default_timer()
+            single = []
+            for key in sample:
+                t = default_timer()
+                key in d
+                single.append(default_timer() - t)
+            d.enable_stats()
+            for key in sample:
+                key in d
+            longest = str(d.stats()['counters']['max_probes'])
+            stash = '-' if name == 'linear' else str(len(d.stash_keys))
+            print('%-6.2f %-6s %7.0fns %7.0fns %7.0fns %7.0fns %9s %6s'
+                  % (load, name, (t2-t1)*1e9/n, (t3-t2)*1e9/n,
+                     (t4-t3)*1e9/n, percentile(single, 0.999)*1e9, longest,
+                     stash))
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,474 @@
+"""
+A persistent dictionary that keeps the tables of dictionary_oa in memory
+mapped files, so a large table is built once and then opened in any number of
+processes without loading or hashing anything. Processes that open the same
+files share their pages through the page cache.
+
+A dictionary is stored in two files:
+
+   * The table file (path) starts with a fixed header (see HEADER) followed
+     by the index table and the dense entries, as in dictionary_oa.Dict. An
+     index is EMPTY, DUMMY or the number of an entry. An entry holds the full
+     hash of its key and the offsets of the pickled key and value in the
+     heap. The key offset of a deleted entry is 0.
+   * The heap file (path + ".heap") holds the pickled keys and values, each
+     stored as a 4 byte length followed by the data. Records are only ever
+     appended, so an offset stays valid for as long as the file exists.
+     Setting a new value for a key appends the value and leaves the old one
+     as garbage.
+
+Keys are hashed with hashing.FNVHasher, which gives the same hash in every
+process. This restricts keys to the types hashing.key_bytes can encode.
+
+Only one process may write to a dictionary at a time. When the writer
+resizes or compacts the table, it writes a new table file and renames it over
+the old one. Readers keep seeing the old (complete) table until they call
+refresh.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import mmap, os, pickle, struct
+from hashing import FNVHasher
+from dictionary_oa import DoubleHashing, EMPTY, DUMMY
+
+MAGIC = b"PYDICT01"
+HEAP_MAGIC = b"PYHEAP01"
+
+# Magic, size, used, filled, hash seed, number of entries and the end of the
+# data in the heap.
+HEADER = struct.Struct("<8sQQQQQQ")
+INDEX = struct.Struct("<q")
+# Full hash, key offset and value offset.
+ENTRY = struct.Struct("<QQQ")
+RECORD = struct.Struct("<I")
+
+# Pickles of this protocol can be read by Python 2 and 3.
+PICKLE_PROTOCOL = 2
+
+def table_length(size):
+    """
+    Return the length in bytes of a table with size slots.
+    """
+    return HEADER.size + (INDEX.size + ENTRY.size)*size
+
+class MmapDict(object):
+    """
+    A mapping stored in memory mapped files. If the table file at path does
+    not exist, an empty dictionary is created there.
+
+    Attributes:
+        * path - The table file. The heap is stored in path + ".heap".
+        * readonly - If True, the files are mapped read only and the
+          dictionary can not be changed.
+        * size - Length of the index table. Always a power of two. There is
+          room for size entries.
+        * used - The number of entries used in the table.
+        * filled - used + number of slots marked with DUMMY.
+        * entries - The number of entries, including deleted ones.
+        * seed - The seed of the hasher. It is stored in the header, so it is
+          only used when the dictionary is created.
+        * heap_end - The end of the data in the heap.
+        * max_load - The table is rebuilt when this fraction of the entries
+          is taken. The new table holds at least twice the used entries.
+        * max_dummies - Maximum fraction of slots marked with DUMMY before
+          the table is compacted.
+    """
+
+    minsize = 8
+
+    def __init__(self, path, readonly = False, size = 8, seed = 0,
+                 max_load = 2/3, max_dummies = 1/4):
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be in (0, 1)")
+        if not 0 < max_dummies <= 1:
+            raise ValueError("max_dummies must be in (0, 1]")
+        self.path = path
+        self.heap_path = path + ".heap"
+        self.readonly = readonly
+        self.max_load = max_load
+        self.max_dummies = max_dummies
+        self.probing = DoubleHashing()
+        self.table = None
+        self.heap = None
+        if os.path.exists(path):
+            self._open()
+        elif readonly:
+            raise IOError("no such dictionary: {0}".format(path))
+        else:
+            with open(self.heap_path, "wb") as f:
+                f.write(HEAP_MAGIC)
+            self.seed = seed
+            self.heap_end = len(HEAP_MAGIC)
+            self._replace_table(1 << (size - 1).bit_length(), [])
+        self.hasher = FNVHasher(self.seed)
+
+    def _open(self):
+        """
+        Map the files and read the header.
+        """
+        self._unmap()
+        mode, access = ("rb", mmap.ACCESS_READ) if self.readonly else \
+            ("r+b", mmap.ACCESS_WRITE)
+        with open(self.path, mode) as f:
+            self.table = mmap.mmap(f.fileno(), 0, access=access)
+        self.heap_file = open(self.heap_path, mode)
+        self.heap = mmap.mmap(self.heap_file.fileno(), 0, access=access)
+        self._read_header()
+
+    def _read_header(self):
+        (magic, self.size, self.used, self.filled, self.seed, self.entries,
+         self.heap_end) = HEADER.unpack_from(self.table, 0)
+        if magic != MAGIC or self.heap[:len(HEAP_MAGIC)] != HEAP_MAGIC:
+            self._unmap()
+            raise ValueError("{0!r} is not a dictionary".format(self))
+        self.entry_base = HEADER.size + INDEX.size*self.size
+
+    def _unmap(self):
+        if self.table is not None:
+            self.table.close()
+            self.heap.close()
+            self.heap_file.close()
+            self.table = None
+            self.heap = None
+
+    def refresh(self):
+        """
+        Map the files again, to see a table that was rebuilt by the writer
+        since the dictionary was opened.
+        """
+        self._open()
+
+    def flush(self):
+        """
+        Write the changes to disk.
+        """
+        if not self.readonly:
+            self.table.flush()
+            self.heap.flush()
+
+    def close(self):
+        """
+        Write the changes to disk and unmap the files.
+        """
+        if self.table is not None:
+            self.flush()
+            self._unmap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_header(self):
+        HEADER.pack_into(self.table, 0, MAGIC, self.size, self.used,
+                         self.filled, self.seed, self.entries, self.heap_end)
+
+    def _index(self, i):
+        return INDEX.unpack_from(self.table, HEADER.size + INDEX.size*i)[0]
+
+    def _set_index(self, i, ix):
+        INDEX.pack_into(self.table, HEADER.size + INDEX.size*i, ix)
+
+    def _entry(self, ix):
+        return ENTRY.unpack_from(self.table, self.entry_base + ENTRY.size*ix)
+
+    def _set_entry(self, ix, key_hash, key_off, value_off):
+        ENTRY.pack_into(self.table, self.entry_base + ENTRY.size*ix,
+                        key_hash, key_off, value_off)
+
+    def _read(self, offset):
+        """
+        Return the object stored at offset in the heap.
+        """
+        if offset + RECORD.size > len(self.heap):
+            # The writer has grown the heap since it was mapped.
+            self._remap_heap()
+        n = RECORD.unpack_from(self.heap, offset)[0]
+        start = offset + RECORD.size
+        if start + n > len(self.heap):
+            self._remap_heap()
+        return pickle.loads(self.heap[start:start + n])
+
+    def _append(self, obj):
+        """
+        Store an object at the end of the heap and return its offset.
+        """
+        data = pickle.dumps(obj, PICKLE_PROTOCOL)
+        offset = self.heap_end
+        end = offset + RECORD.size + len(data)
+        if end > len(self.heap):
+            self._grow_heap(end)
+        RECORD.pack_into(self.heap, offset, len(data))
+        self.heap[offset + RECORD.size:end] = data
+        self.heap_end = end
+        return offset
+
+    def _remap_heap(self):
+        access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+        self.heap.close()
+        self.heap = mmap.mmap(self.heap_file.fileno(), 0, access=access)
+
+    def _grow_heap(self, end):
+        """
+        Make the heap at least end bytes long, doubling it, so appending is
+        amortized constant time.
+        """
+        fileno = self.heap_file.fileno()
+        self.heap.close()
+        self.heap_file.truncate(max(end, 2*os.fstat(fileno).st_size))
+        self.heap = mmap.mmap(fileno, 0)
+
+    def _replace_table(self, size, entries):
+        """
+        Write a table with the given size holding the given entries (tuples of
+        hash, key offset and value offset) to a new file and rename it over
+        the table file.
+        """
+        tmp_path = self.path + ".tmp"
+        length = table_length(size)
+        with open(tmp_path, "w+b") as f:
+            f.truncate(length)
+            table = mmap.mmap(f.fileno(), length)
+            self._fill_table(table, size, entries)
+            table.flush()
+            table.close()
+        # The heap is flushed first, so the new table never refers to data
+        # that is not on disk.
+        if self.heap is not None:
+            self.heap.flush()
+        self._unmap()
+        os.rename(tmp_path, self.path)
+        self._open()
+
+    def _fill_table(self, table, size, entries):
+        """
+        Write the header, index table and entries of a table with the given
+        size to the buffer table.
+        """
+        entry_base = HEADER.size + INDEX.size*size
+        # EMPTY is -1, all bits set.
+        table[HEADER.size:entry_base] = b"\xff"*(INDEX.size*size)
+        probing = self.probing
+        for ix, entry in enumerate(entries):
+            ENTRY.pack_into(table, entry_base + ENTRY.size*ix, *entry)
+            # Place the entry in the first free slot of its probe sequence.
+            key_hash = entry[0]
+            i = key_hash & (size - 1)
+            stride = probing.stride(key_hash, size)
+            probes = 0
+            while INDEX.unpack_from(table,
+                                    HEADER.size + INDEX.size*i)[0] != EMPTY:
+                probes += 1
+                i = probing.next(i, stride, probes, size)
+            INDEX.pack_into(table, HEADER.size + INDEX.size*i, ix)
+        n = len(entries)
+        HEADER.pack_into(table, 0, MAGIC, size, n, n, self.seed, n,
+                         self.heap_end)
+
+    def _rebuild(self, newsize):
+        """
+        Rebuild the table with newsize slots, dropping the deleted entries.
+        """
+        live = [entry for entry in (self._entry(ix)
+                                    for ix in range(self.entries))
+                if entry[1] != 0]
+        self._replace_table(newsize, live)
+
+    def compact(self):
+        """
+        Rebuild the table in place. This clears all slots marked with DUMMY
+        and drops deleted entries. The heap is not compacted.
+        """
+        self._check_writable()
+        self._rebuild(self.size)
+
+    def _check_writable(self):
+        if self.readonly:
+            raise IOError("dictionary is read only")
+
+    def _lookup(self, key, key_hash):
+        """
+        Find the slot for a key with the given full hash. Return the slot and
+        the entry number for the key, or the first free slot and EMPTY or
+        DUMMY if the key is not in the table, as dictionary_oa.Dict._probe
+        does.
+        """
+        size = self.size
+        probing = self.probing
+        i = key_hash & (size - 1)
+        stride = probing.stride(key_hash, size)
+        free = -1
+        for probes in range(1, size + 1):
+            ix = self._index(i)
+            if ix == EMPTY:
+                return (i, ix) if free < 0 else (free, DUMMY)
+            if ix == DUMMY:
+                if free < 0:
+                    free = i
+            else:
+                entry_hash, key_off, value_off = self._entry(ix)
+                # The key is only unpickled if the hashes match.
+                if entry_hash == key_hash and key == self._read(key_off):
+                    return i, ix
+            i = probing.next(i, stride, probes, size)
+        return (-1, EMPTY) if free < 0 else (free, DUMMY)
+
+    def _insert(self, key, value, key_hash):
+        """
+        Add a new value to the dictionary or replace an old one.
+        """
+        i, ix = self._lookup(key, key_hash)
+        if ix >= 0:
+            self._set_entry(ix, key_hash, self._entry(ix)[1],
+                            self._append(value))
+            self._write_header()
+            return
+        if i < 0 or self.entries >= self.size:
+            # Not possible when max_load < 1, but rebuilding is always safe.
+            self._rebuild(self._newsize())
+            i, ix = self._lookup(key, key_hash)
+        # Data goes in before the indices that make it reachable, so a
+        # reader never finds an incomplete entry.
+        key_off = self._append(key)
+        self._set_entry(self.entries, key_hash, key_off, self._append(value))
+        self._set_index(i, self.entries)
+        self.entries += 1
+        self.used += 1
+        if ix == EMPTY:
+            self.filled += 1
+        self._write_header()
+
+    def _newsize(self):
+        """
+        Return the size of a rebuilt table: the smallest power of two that
+        is at least minsize and keeps the live entries under half of
+        max_load, so many insertions can follow before the next rebuild.
+        """
+        newsize = self.minsize
+        while newsize*self.max_load <= 2*self.used:
+            newsize <<= 1
+        return newsize
+
+    def _maybe_grow(self):
+        """
+        Rebuild the table if too many of its entries are taken.
+        """
+        if self.entries >= self.max_load*self.size:
+            self._rebuild(self._newsize())
+
+    def _del(self, i, ix):
+        """
+        Mark slot i, which holds entry ix, with DUMMY and clear the entry.
+        """
+        key_hash = self._entry(ix)[0]
+        self._set_index(i, DUMMY)
+        self._set_entry(ix, key_hash, 0, 0)
+        self.used -= 1
+        self._write_header()
+
+    def _maybe_shrink(self):
+        """
+        Compact the table if too many of its slots are marked with DUMMY.
+        """
+        if self.filled - self.used > self.max_dummies*self.size:
+            self._rebuild(self._newsize())
+
+    def __getitem__(self, key):
+        i, ix = self._lookup(key, self.hasher(key))
+        if ix < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        return self._read(self._entry(ix)[2])
+
+    def __setitem__(self, key, what):
+        self._check_writable()
+        self._insert(key, what, self.hasher(key))
+        self._maybe_grow()
+
+    def __delitem__(self, key):
+        self._check_writable()
+        i, ix = self._lookup(key, self.hasher(key))
+        if ix < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        self._del(i, ix)
+        self._maybe_shrink()
+
+    def __contains__(self, key):
+        return self._lookup(key, self.hasher(key))[1] >= 0
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping or a sequence of pairs, and
+        from the keyword arguments, as dict.update does.
+        """
+        self._check_writable()
+        if hasattr(other, "keys"):
+            other = [(key, other[key]) for key in other.keys()]
+        for key, value in list(other) + list(kwargs.items()):
+            self._insert(key, value, self.hasher(key))
+            self._maybe_grow()
+
+    def _live_entries(self):
+        for ix in range(self.entries):
+            entry = self._entry(ix)
+            if entry[1] != 0:
+                yield entry
+
+    def keys(self):
+        """
+        Return a list of keys in the dictionary, in insertion order.
+        """
+        return [self._read(key_off) for _, key_off, _ in self._live_entries()]
+
+    def values(self):
+        """
+        Return a list of values in the dictionary.
+        """
+        return [self._read(value_off)
+                for _, _, value_off in self._live_entries()]
+
+    def items(self):
+        """
+        Return a list of key-value pairs.
+        """
+        return [(self._read(key_off), self._read(value_off))
+                for _, key_off, value_off in self._live_entries()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self.used
+
+    def __repr__(self):
+        return "MmapDict({0!r}, {1} entries)".format(self.path, self.used)
+
+if __name__ == '__main__':
+
+    import tempfile
+    from timeit import default_timer
+    path = os.path.join(tempfile.mkdtemp(), "table")
+    num_items = 100000
+    t1 = default_timer()
+    with MmapDict(path) as d:
+        d.update(("key{0}".format(i), i) for i in range(num_items))
+    t2 = default_timer()
+    d = MmapDict(path, readonly=True)
+    t3 = default_timer()
+    assert all(d["key{0}".format(i)] == i for i in range(0, num_items, 97))
+    print('building %d items took %0.3fs, opening took %0.3fms'
+          % (num_items, t2-t1, (t3-t2)*1000.0))
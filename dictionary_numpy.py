@@ -0,0 +1,374 @@
+"""
+Hash tables for integer and fixed-width byte keys, built on the open
+addressing design of dictionary_oa, whose keys, hashes and values live in
+NumPy arrays.
+
+Besides the usual mapping methods, the tables have get_many, set_many and
+delete_many methods that take whole arrays of keys. These hash all the keys
+at once and probe in rounds: in every round, each key that is still looking
+for its slot moves one step along its (linear) probe sequence, and all of
+them are compared with a few array operations. The number of rounds is the
+length of the longest probe sequence in the batch, not the number of keys.
+
+Running this module compares the batch methods with looping over
+__getitem__ and __setitem__.
+
+This file requires numpy.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+try:
+    import numpy as np
+except ImportError:
+    NUMPY_INSTALLED = False
+else:
+    NUMPY_INSTALLED = True
+
+from timeit import default_timer
+
+# The state of a slot.
+EMPTY = 0
+FULL = 1
+DUMMY = 2
+
+def fmix64_array(h):
+    """
+    hashing.fmix64 on an array of uint64.
+    """
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xff51afd7ed558ccd)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xc4ceb9fe1a85ec53)
+    return h ^ (h >> np.uint64(33))
+
+class ArrayDict(object):
+    """
+    A mapping implemented as an open addressing hash table with linear
+    probing, stored in NumPy arrays. Subclasses define the key type.
+
+    Attributes:
+        * used - The number of entries used in the table.
+        * dummies - The number of slots whose entry was deleted.
+        * size - Length of the arrays. Always a power of two.
+        * state - EMPTY, FULL or DUMMY for every slot.
+        * hashes, keys, values - The entries of the slots.
+        * max_load - Maximum fraction of filled slots (used + dummies). The
+          table is rebuilt before a batch would fill more.
+        * seed - Changes the mapping from keys to hashes.
+    """
+
+    key_dtype = None
+
+    def __init__(self, size = 8, value_dtype = None, max_load = 1/2,
+                 seed = 0):
+        if not NUMPY_INSTALLED:
+            raise ImportError("{0} requires numpy".format(
+                    type(self).__name__))
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be in (0, 1)")
+        self.value_dtype = np.int64 if value_dtype is None else value_dtype
+        self.max_load = max_load
+        self.seed = seed
+        self._allocate(1 << (size - 1).bit_length())
+
+    def _allocate(self, size):
+        self.size = size
+        self.used = 0
+        self.dummies = 0
+        self.state = np.zeros(size, np.int8)
+        self.hashes = np.zeros(size, np.uint64)
+        self.keys_array = np.zeros(size, self.key_dtype)
+        self.values_array = np.zeros(size, self.value_dtype)
+
+    def clear(self):
+        """
+        Clear the dictionary of all data.
+        """
+        self._allocate(self.size)
+
+    def _as_keys(self, keys):
+        # _hash views the keys as raw bytes, which needs them contiguous.
+        return np.ascontiguousarray(np.atleast_1d(np.asarray(
+                    keys, dtype=self.key_dtype)))
+
+    def _hash(self, keys):
+        """
+        Return the full hashes of an array of keys as uint64. The bytes of
+        each key are split into 64-bit words, the last one padded with zero
+        bytes, and each word is mixed into the hash with the seeded
+        finalizer of hashing.MixHasher. A 64-bit integer is a single word,
+        so its hash is fmix64(key ^ seed).
+        """
+        width = keys.dtype.itemsize
+        words = -(-width // 8)
+        if width == 8*words:
+            columns = keys.view(np.uint64).reshape(len(keys), words)
+        else:
+            padded = np.zeros((len(keys), 8*words), np.uint8)
+            padded[:, :width] = keys.view(np.uint8).reshape(len(keys), width)
+            columns = padded.view(np.uint64)
+        h = np.full(len(keys), self.seed, np.uint64)
+        for c in range(words):
+            h = fmix64_array(h ^ columns[:, c])
+        return h
+
+    def _find(self, keys, hashes):
+        """
+        Return the slot of every key, -1 for keys not in the table.
+        """
+        mask = np.uint64(self.size - 1)
+        found = np.full(len(keys), -1, np.int64)
+        todo = np.arange(len(keys))
+        pos = (hashes & mask).astype(np.int64)
+        while todo.size:
+            state = self.state[pos]
+            hit = (state == FULL) & (self.hashes[pos] == hashes) & \
+                (self.keys_array[pos] == keys)
+            found[todo[hit]] = pos[hit]
+            # A key is not in the table once its probe sequence reaches an
+            # empty slot.
+            going = ~hit & (state != EMPTY)
+            todo = todo[going]
+            keys = keys[going]
+            hashes = hashes[going]
+            pos = (pos[going] + 1) & (self.size - 1)
+        return found
+
+    def _place(self, keys, values, hashes):
+        """
+        Add distinct keys that are not in the table. The table must have
+        room for them.
+        """
+        mask = np.uint64(self.size - 1)
+        pos = (hashes & mask).astype(np.int64)
+        while keys.size:
+            state = self.state[pos]
+            free = np.flatnonzero(state != FULL)
+            # Several keys can want the same free slot, the first one gets it.
+            slots, first = np.unique(pos[free], return_index=True)
+            win = free[first]
+            self.dummies -= int(np.count_nonzero(state[win] == DUMMY))
+            self.state[slots] = FULL
+            self.hashes[slots] = hashes[win]
+            self.keys_array[slots] = keys[win]
+            self.values_array[slots] = values[win]
+            self.used += len(win)
+            # Everybody else moves on to the next slot.
+            going = np.ones(len(keys), bool)
+            going[win] = False
+            keys = keys[going]
+            values = values[going]
+            hashes = hashes[going]
+            pos = (pos[going] + 1) & (self.size - 1)
+
+    def _reserve(self, n):
+        """
+        Make room for n more entries, rebuilding the table if it would get
+        too full. A rebuild also clears the deleted slots.
+        """
+        if self.used + self.dummies + n <= self.max_load*self.size:
+            return
+        newsize = 8
+        while newsize*self.max_load < self.used + n:
+            newsize <<= 1
+        live = self.state == FULL
+        keys = self.keys_array[live]
+        values = self.values_array[live]
+        hashes = self.hashes[live]
+        self._allocate(newsize)
+        self._place(keys, values, hashes)
+
+    def set_many(self, keys, values):
+        """
+        Set the values for an array of keys. If a key appears more than once,
+        its last value is kept.
+        """
+        keys = self._as_keys(keys)
+        values = np.atleast_1d(np.asarray(values, dtype=self.value_dtype))
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        # Keep the last occurrence of each key.
+        keys, last = np.unique(keys[::-1], return_index=True)
+        values = values[::-1][last]
+        hashes = self._hash(keys)
+        found = self._find(keys, hashes)
+        old = found >= 0
+        self.values_array[found[old]] = values[old]
+        new = ~old
+        self._reserve(int(np.count_nonzero(new)))
+        self._place(keys[new], values[new], hashes[new])
+
+    def get_many(self, keys, default=0):
+        """
+        Return an array of the values for an array of keys, with the default
+        for keys that are not in the dictionary.
+        """
+        keys = self._as_keys(keys)
+        found = self._find(keys, self._hash(keys))
+        result = np.full(len(keys), default, self.value_dtype)
+        hit = found >= 0
+        result[hit] = self.values_array[found[hit]]
+        return result
+
+    def contains_many(self, keys):
+        """
+        Return a boolean array telling which keys are in the dictionary.
+        """
+        keys = self._as_keys(keys)
+        return self._find(keys, self._hash(keys)) >= 0
+
+    def delete_many(self, keys):
+        """
+        Remove an array of keys. Keys that are not in the dictionary are
+        ignored. Return the number of keys removed.
+        """
+        keys = self._as_keys(keys)
+        found = self._find(keys, self._hash(keys))
+        slots = np.unique(found[found >= 0])
+        self.state[slots] = DUMMY
+        self.used -= len(slots)
+        self.dummies += len(slots)
+        return len(slots)
+
+    def __getitem__(self, key):
+        keys = self._as_keys(key)
+        slot = self._find(keys, self._hash(keys))[0]
+        if slot < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        return self.values_array[slot]
+
+    def __setitem__(self, key, what):
+        self.set_many([key], [what])
+
+    def __delitem__(self, key):
+        if not self.delete_many([key]):
+            raise KeyError("no such key: {0!r}".format(key))
+
+    def __contains__(self, key):
+        return bool(self.contains_many([key])[0])
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return self.used
+
+    def keys(self):
+        """
+        Return an array of the keys in the dictionary.
+        """
+        return self.keys_array[self.state == FULL]
+
+    def values(self):
+        """
+        Return an array of the values in the dictionary.
+        """
+        return self.values_array[self.state == FULL]
+
+    def items(self):
+        """
+        Return a list of key-value pairs.
+        """
+        live = self.state == FULL
+        return list(zip(self.keys_array[live], self.values_array[live]))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        r = ["{0!r} : {1!r}".format(k, v) for k, v in self.items()]
+        return "{0}({{{1}}})".format(type(self).__name__, ", ".join(r))
+
+class Int64Dict(ArrayDict):
+    """
+    A dictionary with 64-bit integer keys. Keys are hashed with the seeded
+    finalizer of hashing.MixHasher, applied to the key itself. Keys that
+    would change when converted to int64, such as 3.7, raise TypeError.
+    """
+
+    key_dtype = np.int64 if NUMPY_INSTALLED else None
+
+    def _as_keys(self, keys):
+        given = np.asarray(keys)
+        keys = None
+        if given.dtype.kind in "biufO":
+            try:
+                with np.errstate(invalid="ignore"):
+                    keys = ArrayDict._as_keys(self, given)
+            except OverflowError:
+                pass
+        # Floats and unsigned integers of 2**63 or more are converted
+        # without an error, but to a different key.
+        if keys is None or not (np.can_cast(given.dtype, self.key_dtype) or
+                                np.all(keys == given)):
+            raise TypeError("keys must be integers that fit in 64 bits")
+        return keys
+
+class BytesDict(ArrayDict):
+    """
+    A dictionary with byte string keys of at most width bytes, hashed eight
+    bytes at a time (see ArrayDict._hash). Like all NumPy byte strings, keys
+    are padded with zero bytes, so keys that only differ in trailing zero
+    bytes are the same key. Keys longer than width bytes raise ValueError.
+    """
+
+    def __init__(self, width, size = 8, value_dtype = None, max_load = 1/2,
+                 seed = 0):
+        self.width = width
+        self.key_dtype = "S{0}".format(width)
+        ArrayDict.__init__(self, size, value_dtype, max_load, seed)
+
+    def _as_keys(self, keys):
+        given = np.asarray(keys)
+        # Longer keys would be cut to width bytes without an error.
+        if given.dtype.kind in "SU" and given.size and \
+                np.char.str_len(given).max() > self.width:
+            raise ValueError("keys must be at most {0} bytes".format(
+                    self.width))
+        return ArrayDict._as_keys(self, given)
+
+def benchmark(num_keys = 10**6):
+    """
+    Print the time per key of batch and one at a time insertions and
+    lookups of random integer keys.
+    """
+    import dictionary_oa
+    rng = np.random.RandomState(3)
+    keys = rng.randint(0, 2**62, num_keys).astype(np.int64)
+    values = np.arange(num_keys)
+    lookups = keys[rng.randint(0, num_keys, num_keys)]
+
+    def report(name, func):
+        t1 = default_timer()
+        func()
+        t2 = default_timer()
+        print('%-28s %8.0fns/key' % (name, (t2-t1)*1e9/num_keys))
+
+    d = Int64Dict()
+    report('Int64Dict.set_many', lambda: d.set_many(keys, values))
+    report('Int64Dict.get_many', lambda: d.get_many(lookups))
+    oa = dictionary_oa.Dict()
+    key_list = keys.tolist()
+    value_list = values.tolist()
+    def insert_loop():
+        for k, v in zip(key_list, value_list):
+            oa[k] = v
+    report('dictionary_oa.Dict setitem', insert_loop)
+    lookup_list = lookups.tolist()
+    report('dictionary_oa.Dict getitem',
+           lambda: [oa[k] for k in lookup_list])
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -4,9 +4,10 @@ This is for educational purposes only, for illustrating how dictionaries work.
 The original version was based heavily on Benjamin Peterson's code here:
 http://pybites.blogspot.com/2008/10/pure-python-dictionary-implementation.html
 
-This file implements open addressing with double hashing (currently, the second 
-hash function is a constant, which means it behaves like linear probing).
-Replace the method hash2 below for better performance.
+This file implements open addressing. The probe sequence is selected when the
+dictionary is constructed: linear probing, double hashing (the default),
+quadratic probing or Robin Hood hashing. Keys are hashed with the functions
+in the hashing module.
 
 There is a method for visualizing the dictionary that requires pygame.
 """
@@ -30,271 +31,729 @@ else:
 
 import random, string
 from math import sqrt
-import time
-
-dummy = "<dummy key>"
+from timeit import default_timer
+from array import array
+from hashing import MixHasher, random_seed, reseeded
+import snapshot
+import views
+from tablestats import TableStats
+from occupancy import Occupancy
 
 times = {}
 
 def print_timing(func):
     def wrapper(*arg, **kargs):
-        t1 = time.clock()
+        t1 = default_timer()
         res = func(*arg, **kargs)
-        t2 = time.clock()
+        t2 = default_timer()
         times[func.__name__] = t2-t1
         print('%s took %0.3fms' % (func.__name__, (t2-t1)*1000.0))
         return res
     wrapper.func = func
     return wrapper
 
-counts = {}
-
-def counter(func):
-    counts[func.__name__] = 0
-    def wrapper(*arg, **kargs):
-        counts[func.__name__] += 1
-        res = func(*arg, **kargs)
-        return res
-    return wrapper
+def c_mul(a, b):
+    return eval(hex((int(a) * b) & 0xFFFFFFFF)[:-1])
 
-@counter
-def compare(i, j):
-    return i == j
+# Markers in the index table for a slot that has never been used and for a slot
+# whose entry was deleted.
+EMPTY = -1
+DUMMY = -2
 
-dummy = "<dummy key>"
+# Identifies snapshots written by Dict.dump.
+SNAPSHOT_MAGIC = b"PYDICTOA"
 
-def c_mul(a, b):
-    return eval(hex((int(a) * b) & 0xFFFFFFFF)[:-1])
+def index_typecode(size):
+    """
+    Return the smallest array typecode that can hold the indices into the
+    dense arrays of a table with size slots.
+    """
+    for typecode in 'bhiq':
+        if size <= 1 << (8*array(typecode).itemsize - 1):
+            return typecode
+    raise OverflowError("table too large")
 
-class Entry(object):
+class LinearProbing(object):
     """
-    A hash table entry.
+    A probe sequence for open addressing. The sequence for a key starts at
+    its first hash and moves a fixed stride through the table on every probe.
 
     Attributes:
-       * key - The key for this entry.
-       * hash - The has of the key.
-       * value - The value associated with the key.
+       * name - The name used to select the strategy in Dict.
+       * robin_hood - True if entries are displaced by Robin Hood hashing.
     """
 
-    __slots__ = ("key", "value", "hash")
+    name = "linear"
+    robin_hood = False
 
-    def __init__(self):
-        self.key = None
-        self.value = None
-        self.hash = 0
+    def stride(self, key_hash, size):
+        return 1
 
-    def __repr__(self):
-        return "<Entry: key={0} value={1}>".format(self.key, self.value)
+    def next(self, i, stride, probes, size):
+        """
+        Return the slot to look at after slot i, where probes is the number
+        of slots looked at so far.
+        """
+        return (i + stride) & (size - 1)
+
+class DoubleHashing(LinearProbing):
+    """
+    The stride is taken from the high bits of the hash of the key, so keys
+    that share a first slot are unlikely to share a stride as well. It is
+    made odd, so it is coprime to the (power of two) table size.
+    """
+
+    name = "double"
+
+    def stride(self, key_hash, size):
+        return ((key_hash >> 32) & (size - 1)) | 1
+
+class QuadraticProbing(LinearProbing):
+    """
+    Probe at the triangular numbers 1, 3, 6, 10, ... away from the first
+    hash, which visits every slot of a power of two table.
+    """
+
+    name = "quadratic"
+
+    def next(self, i, stride, probes, size):
+        return (i + probes) & (size - 1)
+
+class RobinHood(LinearProbing):
+    """
+    Linear probing where an inserted key takes the slot of any entry that is
+    closer to its own first hash. Lookups for missing keys stop as soon as
+    they reach such an entry and deletions shift the following entries back
+    instead of marking the slot with DUMMY.
+    """
+
+    name = "robin_hood"
+    robin_hood = True
+
+PROBING = dict((cls.name, cls) for cls in (LinearProbing, DoubleHashing,
+                                          QuadraticProbing, RobinHood))
 
 class Dict(object):
     """
     A mapping interface implemented as a hash table.
 
+    The table is split as in CPython 3.6. The index table has one small
+    integer per slot, which is EMPTY, DUMMY or the index of an entry in the
+    dense arrays. The dense arrays hold the hashes, keys and values of the
+    entries in insertion order, so iterating over them is a tight scan and
+    gives the keys in the order they were inserted. Deleted entries leave a
+    hole (a value of None) in the dense arrays until the table is rebuilt.
+
     Attributes:
         * used - The number of entires used in the table.
-        * filled - used + number of entries with a dummy key.
-        * table - List of entries; contains the actual dict data.
-        * size - Length of table, Used to fetch values.
+        * filled - used + number of slots marked with DUMMY.
+        * dummies - The number of slots marked with DUMMY.
+        * indices - Array of slots; holds indices into the dense arrays.
+        * hashes - Array of the full hashes of the entries.
+        * entry_keys - List of the keys of the entries.
+        * entry_values - List of the values of the entries.
+        * size - Length of the index table, Used to fetch values. Always a
+          power of two.
+        * minsize - The initial length of the table. The table never shrinks
+          below this.
+        * resizing - If False, the table keeps its initial size (this is the
+          mode used for experimentation). Otherwise, it grows when more than
+          max_load of the slots are filled and shrinks when less than
+          min_load of the slots are used.
+        * max_load - Maximum fraction of filled slots before growing.
+        * min_load - Minimum fraction of used slots before shrinking.
+        * max_dummies - Maximum fraction of slots marked with DUMMY. When
+          deletions mark more, the table is compacted, even if resizing is
+          off.
+        * growth - On a resize, the new table holds at least growth*used
+          entries.
+        * probing - The probe sequence strategy. It can be given as one of
+          the names in PROBING or as a strategy instance.
+        * hasher - Maps keys to full hashes, see the hashing module. By
+          default, a MixHasher with a random seed.
+        * incremental - If True, growing the table does not rebuild the index
+          table at once. The old index table is kept and every lookup moves
+          resize_steps of its slots to the new one, so no single operation
+          pays for the whole rebuild. Lookups look in both index tables
+          until all slots are moved. The dense arrays are shared by both, so
+          entries are never copied. Shrinking and rebuilds that only drop
+          deleted entries are still done at once.
+        * old_indices - The index table being moved, or None.
+        * old_size - The length of old_indices.
+        * migrate_pos - The next slot of old_indices to move. Entries found
+          before it have been moved already.
+        * version - Incremented by every change other than setting the value
+          of a key that is in the dictionary already. Iterators stop with an
+          error when it changes.
+        * flood_limit - Guards against keys chosen to collide (hash
+          flooding). A lookup that looks at more than probe_limit slots
+          marks the table as flooded, and the next insertion reseeds it, see
+          reseed. If None, the table is never reseeded.
+        * probe_limit - flood_limit times the number of bits of the size,
+          doubled after every reseed, so keys that collide whatever the seed
+          do not make the table rebuild again and again.
+        * flooded - True if a lookup looked at more than probe_limit slots
+          since the last insertion.
+        * reseeds - The number of times the table was reseeded.
+        * table_stats - The counters of lookups and rebuilds, a
+          tablestats.TableStats, or None if counting is disabled. See
+          enable_stats.
     """
 
-    def __init__(self, size = 111):
+    def __init__(self, size = 111, resizing = True, max_load = 2/3,
+                 min_load = 1/10, growth = 2, probing = "double",
+                 hasher = None, incremental = False, resize_steps = 16,
+                 max_dummies = 1/4, flood_limit = 16):
+        if not 0 <= min_load < max_load < 1:
+            raise ValueError("load factors must satisfy "
+                             "0 <= min_load < max_load < 1")
+        if not 0 < max_dummies <= 1:
+            raise ValueError("max_dummies must be in (0, 1]")
+        if growth <= 1:
+            raise ValueError("growth factor must be greater than 1")
+        if isinstance(probing, str):
+            probing = PROBING[probing]()
+        self.probing = probing
+        self.hasher = MixHasher(random_seed()) if hasher is None else hasher
+        # Slots are found by masking the hash, so round up to a power of two.
+        size = 1 << (size - 1).bit_length()
         self.size = size
+        self.minsize = size
+        self.resizing = resizing
+        self.max_load = max_load
+        self.min_load = min_load
+        self.max_dummies = max_dummies
+        self.growth = growth
+        self.incremental = incremental
+        self.resize_steps = resize_steps
+        self.flood_limit = flood_limit
+        self.reseeds = 0
+        self.version = 0
+        self.table_stats = None
         self.clear()
         self.colors = {0:(0,0,0), 
                        1:(200,200,100), 
                        2:(255, 255, 255)}
 
-    def hash1(self, s, mask):
-        h, a, b = 0, 31415, 27183
-        if isinstance(s, int):
-            return s % mask
-        for c in s:
-            h = (a*h + ord(c)) % mask
-            a = a+b % (mask - 1)
-        if h < 0:
-            return h + mask
-        else:
-            return h
-
-    def hash2(self, s, mask):
-        # Caution: cannot return zero, but we're not checking 
-        # that
-        return 1
-
-    def first_hash(self, s):
-        return self.hash1(s, self.size)
-
-    def second_hash(self, s):
-        return self.hash2(s, self.size - 1) + 1
-
     @classmethod
     def fromkeys(cls, keys, value=0):
         """
         Return a new dictionary from a sequence of keys.
         """
+        keys = list(keys)
         d = cls()
-        for key in keys:
-            d[key] = value
+        d.set_many(keys, [value]*len(keys))
         return d
 
     def clear(self):
         """
         Clear the dictionary of all data.
         """
+        self.version += 1
         self.filled = 0
         self.used = 0
-        self.table = []
-        # Initialize the table to a clean slate of entries.
-        for i in range(self.size):
-            self.table.append(Entry())
+        self.dummies = 0
+        self.size = self.minsize
+        # Initialize the index table to a clean slate of free slots.
+        self.indices = array(index_typecode(self.size), [EMPTY])*self.size
+        self.hashes = array('Q')
+        self.entry_keys = []
+        self.entry_values = []
+        self.old_indices = None
+        self.old_size = 0
+        self.migrate_pos = 0
+        self.flooded = False
+        self._set_probe_limit()
 
     def pop(self, *args):
         """
         Remove and return the value for a key.
         """
         have_default = len(args) == 2
-        try:
-            v = self[args[0]]
-        except KeyError:
+        i, ix = self._lookup(args[0], self.hasher(args[0]))
+        if ix < 0:
             if have_default:
                 return args[1]
-            raise
-        else:
-            del self[args[0]]
-            return v
+            raise KeyError("no such key: {0!r}".format(args[0]))
+        v = self.entry_values[ix]
+        self._del(i, ix)
+        self._maybe_shrink()
+        return v
 
     def popitem(self):
         """
-        Remove and return any key-value pair from the dictionary.
+        Remove and return the most recently inserted key-value pair from the
+        dictionary.
         """
         if self.used == 0:
             raise KeyError("empty dictionary")
-        entry0 = self.table[0]
-        entry = entry0
-        i = 0
-        if entry0.value is None:
-            # The first entry in the table's hash is abused to hold the index to
-            # the next place to look for a value to pop.
-            i = entry0.hash
-            if i >= self.size or i < i:
-                i = 1
-            entry = self.table[i]
-            while entry.value is None:
-                i += 1
-                if i >= self.size:
-                    i = 1
-                entry = self.table[i]
-        res = entry.key, entry.value
-        self._del(entry)
-        # Set the next place to start.
-        entry0.hash = i + 1
+        ix = len(self.entry_values) - 1
+        while self.entry_values[ix] is None:
+            ix -= 1
+        res = self.entry_keys[ix], self.entry_values[ix]
+        self._del(*self._lookup(res[0], self.hashes[ix]))
+        # The entry and the deleted ones after it are at the end of the dense
+        # arrays, so they can be dropped. While resizing, the old index table
+        # may still refer to them.
+        if self.old_indices is None:
+            del self.entry_keys[ix:]
+            del self.entry_values[ix:]
+            del self.hashes[ix:]
+        self._maybe_shrink()
         return res
 
     def setdefault(self, key, default=0):
         """
-        If key is in the dictionary, return it. Otherwise, set it to the default
-        value.
+        If key is in the dictionary, return it. Otherwise, set it to the
+        default value.
         """
-        val = self._lookup(key).value
-        if val is None:
-            self[key] = default
+        key_hash = self.hasher(key)
+        i, ix = self._lookup(key, key_hash)
+        if ix < 0:
+            assert default is not None and key is not None, \
+                "key and value must not be None"
+            self._insert(key, default, key_hash)
+            self._maybe_grow()
             return default
-        return val
+        return self.entry_values[ix]
 
-    def _lookup(self, key):
+    def _lookup(self, key, key_hash):
         """
-        Find the entry for a key.
+        Find the slot for a key with the given full hash. Return the slot and
+        the index of the entry for the key in the dense arrays. If the key is
+        not in the table, the index is EMPTY or DUMMY and the slot is the
+        first free one on its probe sequence, or -1 if the table is
+        completely filled. If the key is only in the old index table, the
+        slot is None.
         """
-        key_hash = self.first_hash(key)
-        entry = self.table[key_hash]
-        if entry.key is None or entry is key:
-            return entry
-        free = None
-        if entry.key is dummy:
-            free = entry
-        elif compare(entry.hash, key_hash) and key == entry.key:
-            return entry
+        if self.old_indices is None:
+            return self._probe(self.indices, self.size, key, key_hash)
+        self._migrate(self.resize_steps)
+        i, ix = self._probe(self.indices, self.size, key, key_hash)
+        if ix < 0 and self.old_indices is not None:
+            j, old_ix = self._probe(self.old_indices, self.old_size, key,
+                                    key_hash)
+            if old_ix >= 0 and j >= self.migrate_pos:
+                return None, old_ix
+        return i, ix
+
+    def _probe(self, indices, size, key, key_hash):
+        """
+        Look for a key in the index table indices with the given size, as
+        described in _lookup.
 
-        i = key_hash
+        The hashes are compared first, so the (possibly expensive) comparison
+        of the keys is only done when they match.
+        """
+        if self.probing.robin_hood:
+            return self._robin_hood_lookup(indices, size, key, key_hash)
+        i = key_hash & (size - 1)
+        ix = indices[i]
+        if ix == EMPTY:
+            return i, ix
+        free = -1
+        if ix == DUMMY:
+            free = i
+        elif self.entry_keys[ix] is key or \
+                (self.hashes[ix] == key_hash and
+                 key == self.entry_keys[ix]):
+            return i, ix
+
+        probing = self.probing
+        stride = probing.stride(key_hash, size)
+        # Every slot is visited at most once, so a full table does not loop
+        # forever.
+        for probes in range(1, size):
+            i = probing.next(i, stride, probes, size)
+            ix = indices[i]
+            if ix == EMPTY:
+                break
+            if ix == DUMMY:
+                if free < 0:
+                    free = i
+            elif self.entry_keys[ix] is key or \
+                    (self.hashes[ix] == key_hash and
+                     key == self.entry_keys[ix]):
+                break
+        else:
+            i, ix, probes = -1, EMPTY, size
+        if probes > self.probe_limit:
+            self.flooded = True
+        if ix >= 0 or free < 0:
+            return i, ix
+        return free, DUMMY
+
+    def _robin_hood_lookup(self, indices, size, key, key_hash):
+        """
+        Find the slot for a key with Robin Hood hashing. If the key is not in
+        the table, return (-1, EMPTY).
+        """
+        mask = size - 1
+        i = key_hash & mask
+        for dist in range(size):
+            ix = indices[i]
+            # The key would have displaced any entry closer to its first slot,
+            # so it cannot be further along.
+            if ix == EMPTY or (i - self.hashes[ix]) & mask < dist:
+                break
+            if self.entry_keys[ix] is key or \
+                    (self.hashes[ix] == key_hash and
+                     key == self.entry_keys[ix]):
+                if dist > self.probe_limit:
+                    self.flooded = True
+                return i, ix
+            i = (i + 1) & mask
+        if dist > self.probe_limit:
+            self.flooded = True
+        return -1, EMPTY
+
+    def _robin_hood_insert(self, ix):
+        """
+        Place the entry with the given index in the index table with Robin
+        Hood hashing. The table must have a free slot.
+        """
+        indices = self.indices
+        hashes = self.hashes
+        mask = self.size - 1
+        i = hashes[ix] & mask
+        dist = 0
         while True:
-            i += self.second_hash(key)
-            i = i % self.size
-            entry = self.table[i]
-            if entry.key is None:
-                return entry if free is None else free
-            if entry.key is key or \
-                    (compare(entry.hash, key_hash) and key == entry.key):
-                return entry
-            elif entry.key is dummy and free is None:
-                free = dummy
-
-        assert False, "not reached"
+            other = indices[i]
+            if other == EMPTY:
+                indices[i] = ix
+                return
+            other_dist = (i - hashes[other]) & mask
+            if other_dist < dist:
+                # Take the slot and carry on placing the displaced entry.
+                indices[i], ix = ix, other
+                dist = other_dist
+            i = (i + 1) & mask
+            dist += 1
+
+    def _robin_hood_del(self, i):
+        """
+        Free slot i with Robin Hood hashing, shifting the entries after it
+        back towards their first slot.
+        """
+        indices = self.indices
+        hashes = self.hashes
+        mask = self.size - 1
+        j = (i + 1) & mask
+        while indices[j] >= 0 and (j - hashes[indices[j]]) & mask > 0:
+            indices[i] = indices[j]
+            i = j
+            j = (j + 1) & mask
+        indices[i] = EMPTY
 
     def _resize(self, minused):
         """
-        Resize the dictionary to at least minused.
+        Resize the dictionary so it holds minused entries below max_load.
         """
-        newsize = self.size
-        # Find the smalled value for newsize.
-        while newsize <= minused and newsize > 0:
+        newsize = self.minsize
+        # Find the smallest value for newsize. Growing to just above
+        # minused would leave no room below max_load, so a table with many
+        # deletions would be rebuilt again after a few insertions.
+        while newsize*self.max_load <= minused:
             newsize <<= 1
-            newsize += 1
-        oldtable = self.table
-        # Create a new table newsize long.
-        newtable = []
-        while len(newtable) < newsize:
-            newtable.append(Entry())
-        # Replace the old table.
-        self.table = newtable
-        self.used = 0
+        if not self.incremental or newsize <= self.size:
+            self._rebuild(newsize)
+            return
+        # Finish moving the previous index table first.
+        if self.old_indices is not None:
+            self._migrate(self.old_size)
+        self.old_indices = self.indices
+        self.old_size = self.size
+        self.migrate_pos = 0
+        self.size = newsize
+        self.indices = array(index_typecode(newsize), [EMPTY])*newsize
         self.filled = 0
-        # Copy the old data into the new table.
-        for entry in oldtable:
-            if entry.value is not None:
-                self._insert_into_clean(entry)
-            elif entry.key is dummy:
-                entry.key = None
+        self.dummies = 0
+        self._set_probe_limit()
+
+    def _migrate(self, steps):
+        """
+        Move the next steps slots of the old index table to the new one.
+        Only the indices are moved, the entries stay in the dense arrays.
+        """
+        old = self.old_indices
+        values = self.entry_values
+        end = min(self.old_size, self.migrate_pos + steps)
+        for j in range(self.migrate_pos, end):
+            ix = old[j]
+            # Entries deleted while moving are left as holes.
+            if ix >= 0 and values[ix] is not None:
+                self._insert_into_clean(ix)
+                self.filled += 1
+        self.migrate_pos = end
+        if end == self.old_size:
+            self.old_indices = None
+
+    def _rebuild(self, newsize):
+        """
+        Rebuild the index table with newsize slots. Deleted entries are
+        dropped from the dense arrays, the others keep their order.
+        """
+        # The entries are renumbered.
+        self.version += 1
+        values = self.entry_values
+        if self.used < len(values):
+            live = [ix for ix, value in enumerate(values) if value is not None]
+            self.entry_keys = [self.entry_keys[ix] for ix in live]
+            self.entry_values = [values[ix] for ix in live]
+            self.hashes = array('Q', [self.hashes[ix] for ix in live])
+        # The size has to be updated before copying since it determines where
+        # entries are placed. All entries are placed from the dense arrays,
+        # so an index table that is being moved can be dropped.
+        self.old_indices = None
         self.size = newsize
+        self.indices = array(index_typecode(newsize), [EMPTY])*newsize
+        for ix in range(self.used):
+            self._insert_into_clean(ix)
+        self.filled = self.used
+        self.dummies = 0
+        self._set_probe_limit()
+
+    def compact(self):
+        """
+        Rebuild the table in place. This clears all slots marked with DUMMY
+        and drops deleted entries from the dense arrays, which shortens the
+        probe sequences of a table that has seen many deletions.
+        """
+        self._rebuild(self.size)
+
+    def _set_probe_limit(self):
+        if self.flood_limit is None:
+            # No lookup looks at more than all slots.
+            self.probe_limit = self.size
+        else:
+            self.probe_limit = \
+                (self.flood_limit*self.size.bit_length()) << self.reseeds
 
-    def _insert_into_clean(self, entry):
+    def reseed(self):
         """
-        Insert an item in a clean dict. This is a helper for resizing.
+        Replace the hasher with one of the same kind with a new random seed
+        and rebuild the table with the new hashes. Keys chosen to collide
+        under the old seed are spread over the table again. Raise ValueError
+        if the hasher does not take a seed.
         """
-        i = entry.hash
-        new_entry = self.table[i]
-        while new_entry.key is not None:
-            i += self.second_hash(new_entry.key)
-            new_entry = self.table[i]
-        new_entry.key = entry.key
-        new_entry.value = entry.value
-        new_entry.hash = entry.hash
-        self.used += 1
-        self.filled += 1
+        hasher = reseeded(self.hasher)
+        if hasher is None:
+            raise ValueError("the hasher has no seed")
+        self.hasher = hasher
+        self.reseeds += 1
+        self.flooded = False
+        self.hashes = array('Q', [hasher(key) if value is not None else 0
+                                  for key, value in zip(self.entry_keys,
+                                                        self.entry_values)])
+        self._rebuild(self.size)
+
+    def enable_stats(self):
+        """
+        Start counting the slots looked at by every lookup and timing every
+        resize and compaction, from zero. The counting versions of _lookup,
+        _resize and compact are stored on the instance, so a table that does
+        not count runs the plain methods without any check.
+        """
+        self.table_stats = TableStats()
+        self._lookup = self._counted_lookup
+        self._resize = self._timed_resize
+        self.compact = self._timed_compact
 
-    def _insert(self, key, value):
+    def disable_stats(self):
         """
-        Add a new value to the dictionary or replace an old one.
+        Stop counting and drop the counters.
         """
-        entry = self._lookup(key)
-        if entry.value is None:
-            self.used += 1
-            if entry.key is not dummy:
+        self.table_stats = None
+        for name in ('_lookup', '_resize', 'compact'):
+            self.__dict__.pop(name, None)
+
+    def _counted_lookup(self, key, key_hash):
+        i, ix = type(self)._lookup(self, key, key_hash)
+        self.table_stats.record_lookup(self._probe_length(key_hash, ix))
+        return i, ix
+
+    def _probe_length(self, key_hash, ix):
+        """
+        Return the number of slots of the index table a lookup of the given
+        full hash looked at to find the entry with index ix, or to find out
+        that the key is not there if ix is EMPTY or DUMMY. The probe
+        sequence is walked again, comparing slots instead of keys.
+        """
+        indices = self.indices
+        size = self.size
+        mask = size - 1
+        probing = self.probing
+        robin_hood = probing.robin_hood
+        hashes = self.hashes
+        i = key_hash & mask
+        stride = probing.stride(key_hash, size)
+        for probes in range(1, size + 1):
+            slot = indices[i]
+            if slot == EMPTY or (ix >= 0 and slot == ix):
+                return probes
+            if robin_hood and (i - hashes[slot]) & mask < probes - 1:
+                return probes
+            i = probing.next(i, stride, probes, size)
+        return size
+
+    def _timed_resize(self, minused):
+        t1 = default_timer()
+        type(self)._resize(self, minused)
+        self.table_stats.record_rebuild('resize', default_timer() - t1)
+
+    def _timed_compact(self):
+        t1 = default_timer()
+        type(self).compact(self)
+        self.table_stats.record_rebuild('compact', default_timer() - t1)
+
+    def stats(self):
+        """
+        Return a snapshot of the shape of the table as a dict:
+
+           * size, used, filled, dummies - As the attributes.
+           * load - The fraction of slots used.
+           * tombstone_ratio - The fraction of slots marked with DUMMY.
+           * holes - The deleted entries left in the dense arrays.
+           * cluster_histogram - Maps the length of a run of slots that are
+             not EMPTY to the number of such runs. Runs wrap around the end
+             of the index table. While resizing, only the new index table is
+             counted.
+           * max_cluster - The length of the longest run.
+           * counters - The counters of lookups and rebuilds, see
+             tablestats.TableStats.snapshot, or None if counting is
+             disabled.
+        """
+        clusters = self.occupancy().clusters()
+        return {
+            'size': self.size,
+            'used': self.used,
+            'filled': self.filled,
+            'dummies': self.dummies,
+            'load': self.used/self.size,
+            'tombstone_ratio': self.dummies/self.size,
+            'holes': len(self.entry_keys) - self.used,
+            'cluster_histogram': clusters,
+            'max_cluster': max(clusters) if clusters else 0,
+            'counters': None if self.table_stats is None
+            else self.table_stats.snapshot(),
+            }
+
+    def _insert_into_clean(self, ix):
+        """
+        Place the entry with the given index in the first free slot of its
+        probe sequence, skipping slots marked with DUMMY. This is a helper for
+        resizing. The full hash stored in the dense arrays is reused, so no
+        key is hashed again.
+        """
+        if self.probing.robin_hood:
+            self._robin_hood_insert(ix)
+            return
+        key_hash = self.hashes[ix]
+        i = key_hash & (self.size - 1)
+        probing = self.probing
+        stride = probing.stride(key_hash, self.size)
+        probes = 0
+        while self.indices[i] != EMPTY:
+            probes += 1
+            i = probing.next(i, stride, probes, self.size)
+        self.indices[i] = ix
+
+    def _maybe_grow(self):
+        """
+        Reseed the table if a lookup found it flooded, and grow it if too
+        many of its slots are filled.
+        """
+        if self.flooded:
+            if hasattr(self.hasher, "seed"):
+                self.reseed()
+            else:
+                # The hasher can not be reseeded, so stop checking.
+                self.flood_limit = None
+                self.flooded = False
+                self._set_probe_limit()
+        if not self.resizing:
+            return
+        limit = self.max_load*self.size
+        # While resizing, filled only counts the slots of the new index
+        # table, but all used entries end up in it.
+        if self.filled >= limit or self.used >= limit or \
+                len(self.entry_keys) >= limit:
+            self._resize(self.growth*self.used)
+
+    def _maybe_shrink(self):
+        """
+        Shrink the table if too few of its slots are used. Otherwise, compact
+        it if too many of its slots are marked with DUMMY.
+        """
+        if self.old_indices is not None:
+            return
+        if self.resizing and self.size > self.minsize and \
+                self.used < self.min_load*self.size:
+            self._resize(self.growth*self.used)
+        elif self.dummies > self.max_dummies*self.size:
+            self.compact()
+
+    def _insert(self, key, value, key_hash):
+        """
+        Add a new value to the dictionary or replace an old one. Return the
+        index of the entry in the dense arrays.
+        """
+        i, ix = self._lookup(key, key_hash)
+        if ix >= 0:
+            self.entry_values[ix] = value
+            return ix
+        if self.used >= self.size:
+            raise RuntimeError("dictionary is full")
+        if len(self.entry_keys) >= self.size:
+            # Only possible when resizing is off. Drop the deleted entries
+            # so the indices still fit in the index table.
+            self._rebuild(self.size)
+            i, ix = self._lookup(key, key_hash)
+        if i < 0 and not self.probing.robin_hood:
+            raise RuntimeError("dictionary is full")
+        new_ix = len(self.entry_keys)
+        self.entry_keys.append(key)
+        self.entry_values.append(value)
+        self.hashes.append(key_hash)
+        if self.probing.robin_hood:
+            self._robin_hood_insert(new_ix)
+            self.filled += 1
+        else:
+            if ix == EMPTY:
                 self.filled += 1
-        entry.key = key
-        entry.hash = self.first_hash(key)
-        entry.value = value
+            else:
+                # The first slot marked with DUMMY on the probe sequence is
+                # reused.
+                self.dummies -= 1
+            self.indices[i] = new_ix
+        self.used += 1
+        self.version += 1
+        return new_ix
 
-    def _del(self, entry):
+    def _del(self, i, ix):
         """
-        Mark an entry as free with the dummy key.
+        Free slot i, which holds the entry with index ix. The slot is marked
+        with DUMMY and the entry in the dense arrays is cleared. If i is None,
+        the entry is still in the old index table, which is left as it is.
+        The hash of the entry is kept, so probe distances in that table stay
+        valid.
         """
-        entry.key = dummy
-        entry.value = None
+        if i is None:
+            pass
+        elif self.probing.robin_hood:
+            self._robin_hood_del(i)
+            self.filled -= 1
+        else:
+            self.indices[i] = DUMMY
+            self.dummies += 1
+        self.entry_keys[ix] = None
+        self.entry_values[ix] = None
         self.used -= 1
+        self.version += 1
 
     def __getitem__(self, key):
-        value = self._lookup(key).value
-        if value is None:
+        i, ix = self._lookup(key, self.hasher(key))
+        if ix < 0:
             # Check if we're a subclass.
             if type(self) is not Dict:
                 # Try to call the __missing__ method.
@@ -302,7 +761,7 @@ class Dict(object):
                 if missing is not None:
                     return missing(key)
             raise KeyError("no such key: {0!r}".format(key))
-        return value
+        return self.entry_values[ix]
 
     def __setitem__(self, key, what):
         # None is used as a marker for empty entries, so it can't be in a
@@ -310,50 +769,45 @@ class Dict(object):
         assert what is not None and key is not None, \
             "key and value must not be None"
         old_used = self.used
-        self._insert(key, what)
-        
-        #For the purpose of experimentation, disable resizing
-        return
-        
+        self._insert(key, what, self.hasher(key))
         # Maybe resize the dict.
-        if not (self.used > old_used and
-                self.filled*3 >= self.size*2):
-            return
-        # Large dictionaries (< 5000) are only doubled in size.
-        factor = 2 if self.used > 5000 else 4
-        self._resize(factor*self.used)
+        if self.used > old_used:
+            self._maybe_grow()
 
     def __delitem__(self, key):
-        entry = self._lookup(key)
-        if entry.value is None:
+        i, ix = self._lookup(key, self.hasher(key))
+        if ix < 0:
             raise KeyError("no such key: {0!r}".format(key))
-        self._del(entry)
+        self._del(i, ix)
+        self._maybe_shrink()
 
     def __contains__(self, key):
         """
         Check if a key is in the dictionary.
         """
-        return self._lookup(key).value is not None
+        return self._lookup(key, self.hasher(key))[1] >= 0
 
     def __eq__(self, other):
         if not isinstance(other, Dict):
             try:
                 # Try to coerce the other to a Dict, so we can compare it.
-                other = Dict(other)
-            except TypeError:
+                coerced = Dict()
+                coerced.update(other)
+                other = coerced
+            except (TypeError, ValueError):
                 return NotImplemented
         if self.used != other.used:
             # They're not the same size.
             return False
         # Look through the table and compare every entry, breaking out early if
         # we find a difference.
-        for entry in self.table:
-            if entry.value is not None:
+        for key, value in zip(self.entry_keys, self.entry_values):
+            if value is not None:
                 try:
-                    bval = other[entry.key]
+                    bval = other[key]
                 except KeyError:
                     return False
-                if not bval == entry.value:
+                if not bval == value:
                     return False
         return True
 
@@ -362,25 +816,70 @@ class Dict(object):
 
     def keys(self):
         """
-        Return a list of keys in the dictionary.
+        Return a live view of the keys in the dictionary, see the views
+        module.
         """
-        return [entry.key for entry in self.table if entry.value is not None]
+        return views.KeysView(self)
 
     def values(self):
         """
-        Return a list of values in the dictionary.
+        Return a live view of the values in the dictionary.
         """
-        return [entry.value for entry in self.table if entry.value is not None]
+        return views.ValuesView(self)
 
     def items(self):
         """
-        Return a list of key-value pairs.
+        Return a live view of the key-value pairs in the dictionary.
         """
-        return [(entry.key, entry.value) for entry in self.table
-                if entry.value is not None]
+        return views.ItemsView(self)
+
+    def _iter_keys(self):
+        """
+        Generate the keys, walking the dense arrays once.
+        """
+        version = self.version
+        for key, value in zip(self.entry_keys, self.entry_values):
+            if value is not None:
+                yield key
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+
+    def _iter_values(self):
+        version = self.version
+        for value in self.entry_values:
+            if value is not None:
+                yield value
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+
+    def _iter_items(self):
+        version = self.version
+        for item in zip(self.entry_keys, self.entry_values):
+            if item[1] is not None:
+                yield item
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+
+    def _reversed_items(self):
+        """
+        Generate the key-value pairs from the last inserted to the first,
+        walking the dense arrays backwards.
+        """
+        version = self.version
+        keys = self.entry_keys
+        values = self.entry_values
+        for ix in range(len(values) - 1, -1, -1):
+            if values[ix] is not None:
+                yield keys[ix], values[ix]
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
 
     def __iter__(self):
-        return DictKeysIterator(self)
+        return self._iter_keys()
+
+    def __reversed__(self):
+        for key, value in self._reversed_items():
+            yield key
 
     def itervalues(self):
         """
@@ -409,6 +908,150 @@ class Dict(object):
         except KeyError:
             return default
 
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping (anything with a keys method)
+        or a sequence of pairs, and from the keyword arguments, as dict.update
+        does.
+        """
+        if hasattr(other, "keys"):
+            keys = list(other.keys())
+            values = [other[key] for key in keys]
+        else:
+            keys = []
+            values = []
+            for double in other:
+                if len(double) != 2:
+                    raise ValueError("{0!r} doesn't have a length of 2".format(
+                            double))
+                keys.append(double[0])
+                values.append(double[1])
+        for key, value in kwargs.items():
+            keys.append(key)
+            values.append(value)
+        self.set_many(keys, values)
+
+    def _reserve(self, n):
+        """
+        Make room for n more entries, so that inserting them does not resize
+        the table again.
+        """
+        if not self.resizing or \
+                len(self.entry_keys) + n < self.max_load*self.size:
+            return
+        newsize = self.minsize
+        while newsize*self.max_load <= self.used + n:
+            newsize <<= 1
+        # The batch pays for all its insertions anyway, so the table is
+        # rebuilt at once even in incremental mode.
+        self._rebuild(newsize)
+
+    def set_many(self, keys, values):
+        """
+        Set the values of many keys at once. The table is resized at most
+        once for the whole batch and the keys are hashed in one pass.
+        """
+        keys = list(keys)
+        values = list(values)
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        # None is used as a marker for empty entries, so it can't be in a
+        # dictionary.
+        assert None not in keys and None not in values, \
+            "key and value must not be None"
+        self._reserve(len(keys))
+        insert = self._insert
+        for key, value, key_hash in zip(keys, values,
+                                        map(self.hasher, keys)):
+            insert(key, value, key_hash)
+        self._maybe_grow()
+
+    def get_many(self, keys, default=0):
+        """
+        Return a list of the values for many keys, with the default for keys
+        that are not in the dictionary.
+        """
+        keys = list(keys)
+        lookup = self._lookup
+        values = self.entry_values
+        result = []
+        for key, key_hash in zip(keys, map(self.hasher, keys)):
+            ix = lookup(key, key_hash)[1]
+            result.append(values[ix] if ix >= 0 else default)
+        return result
+
+    def delete_many(self, keys):
+        """
+        Remove many keys at once. Keys that are not in the dictionary are
+        ignored. Return the number of keys removed.
+        """
+        keys = list(keys)
+        lookup = self._lookup
+        removed = 0
+        for key, key_hash in zip(keys, map(self.hasher, keys)):
+            i, ix = lookup(key, key_hash)
+            if ix >= 0:
+                self._del(i, ix)
+                removed += 1
+        self._maybe_shrink()
+        return removed
+
+    def _config(self):
+        """
+        Return the arguments that create an empty dictionary configured as
+        this one.
+        """
+        return dict(size=self.minsize, resizing=self.resizing,
+                    max_load=self.max_load, min_load=self.min_load,
+                    growth=self.growth, probing=self.probing,
+                    hasher=self.hasher, incremental=self.incremental,
+                    resize_steps=self.resize_steps,
+                    max_dummies=self.max_dummies,
+                    flood_limit=self.flood_limit)
+
+    def dump(self, fp):
+        """
+        Write a snapshot of the dictionary to the binary file fp, see the
+        snapshot module. The index table and the hashes are written as they
+        are, so load does not have to rebuild the table.
+        """
+        if self.old_indices is not None:
+            self._migrate(self.old_size)
+        state = dict(config=self._config(), size=self.size, used=self.used,
+                     filled=self.filled, dummies=self.dummies,
+                     keys=self.entry_keys, values=self.entry_values)
+        snapshot.dump(fp, SNAPSHOT_MAGIC, self.hasher, state,
+                      [self.indices, self.hashes])
+
+    @classmethod
+    def load(cls, fp):
+        """
+        Return a dictionary read from a snapshot written by dump.
+        """
+        state, same_hashes = snapshot.load(fp, SNAPSHOT_MAGIC)
+        d = cls(**state["config"])
+        d.size = state["size"]
+        d.indices = array(index_typecode(d.size), [EMPTY])*d.size
+        d._set_probe_limit()
+        snapshot.read_array(fp, d.indices, state)
+        d.hashes = array('Q', [0])*len(state["keys"])
+        snapshot.read_array(fp, d.hashes, state)
+        d.entry_keys = state["keys"]
+        d.entry_values = state["values"]
+        d.used = state["used"]
+        d.filled = state["filled"]
+        d.dummies = state["dummies"]
+        if not same_hashes:
+            # The keys hash differently in this process.
+            d.hashes = array('Q', [d.hasher(key) if value is not None else 0
+                                   for key, value in zip(d.entry_keys,
+                                                         d.entry_values)])
+            d._rebuild(d.size)
+        return d
+
+    def __reduce__(self):
+        return snapshot.from_bytes, (type(self), snapshot.to_bytes(self))
+
     def __len__(self):
         return self.used
 
@@ -416,6 +1059,14 @@ class Dict(object):
         r = ["{0!r} : {1!r}".format(k, v) for k, v in self.items()]
         return "Dict({" + ", ".join(r) + "})"
     
+    def occupancy(self):
+        """
+        Return an occupancy.Occupancy of the slots of the index table, for
+        exporting the clusters as an image or JSON without a display. While
+        resizing, only the new index table is analyzed.
+        """
+        return Occupancy.from_indices(self.indices)
+
     def draw_init(self, dimension):
 
         # Initialize the pygame modules
@@ -443,10 +1094,10 @@ class Dict(object):
 
         # Draw every cell in the board as a rectangle on the screen
         i = j = 0
-        for item in self.table:
-            filled = item.key is not None and item.key is not dummy
+        for ix in self.indices:
+            filled = ix >= 0
             if filled:
-                print(item.hash, end=' ')
+                print(self.hashes[ix] & (self.size - 1), end=' ')
             else:
                 print('*', end=' ')
             rectangle = (j*cell_dimension, i*cell_dimension,
@@ -482,74 +1133,72 @@ class Dict(object):
                     quit_window = True
 
 class DictIterator(object):
+    """
+    An iterator over a dictionary that knows how many items are left. It
+    stops with a RuntimeError if the dictionary is changed, other than by
+    setting the value of a key that is in it already.
+    """
 
     def __init__(self, d):
         self.d = d
-        self.used = self.d.used
-        self.len = self.d.used
-        self.pos = 0
+        self.left = d.used
+        self.items = getattr(d, self.generator)()
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        # Check if the dictionary has been mutated under us.
-        if self.used != self.d.used:
-            # Make this state permanent.
-            self.used = -1
-            raise RuntimeError("dictionary size changed during ineration")
-        i = self.pos
-        while i < self.d.size and self.d.table[i].value is None:
-            i += 1
-        self.pos = i + 1
-        if i >= self.d.size - 1:
-            # We're done.
-            raise StopIteration
-        self.len -= 1
-        return self._extract(self.d.table[i])
+        item = next(self.items)
+        self.left -= 1
+        return item
 
     next = __next__
 
-    def _extract(self, entry):
-        return getattr(entry, self.kind)
+    def __length_hint__(self):
+        return self.left
 
-    def __len__(self):
-        return self.len
+    __len__ = __length_hint__
 
 class DictKeysIterator(DictIterator):
-    kind = "key"
+
+    generator = "_iter_keys"
 
 class DictValuesIterator(DictIterator):
-    kind = "value"
+
+    generator = "_iter_values"
 
 class DictItemsIterator(DictIterator):
 
-    def _extract(self, entry):
-        return entry.key, entry.value
+    generator = "_iter_items"
 
 @print_timing
-def testing(dict_size = 2000, num_items = None, load_factor = 0.5):
-    counts['compare'] = 0
+def testing(dict_size = 2000, num_items = None, load_factor = 0.5,
+            probing = "double"):
+    random.seed(3)
+    cd = Dict(dict_size, resizing = False, probing = probing)
+    dict_size = cd.size
     if num_items == None:
         num_items = dict_size * load_factor
-    random.seed(3)
-    cd = Dict(dict_size)
     i = 0
     while i < num_items:
         s = ''.join(random.choice(string.ascii_letters) for k in range(10))
         cd[s] = random.randint(3,9)
         i += 1
     ll1 = list(cd.keys())
-    counts['compare'] = 0
+    cd.enable_stats()
     for i in range(len(ll1)):
         ll1[i] in cd
-    print('Average number of comparisons: ', old_div((1.0*counts['compare']),len(ll1)))
+    print('Average number of probes: ',
+          cd.stats()['counters']['probes_per_lookup'])
     print('Load factor: ', old_div((1.0*len(ll1)),dict_size))
             
 if __name__ == '__main__':
     
     mytimes = {}
-    for dict_size in range(1100, 3000, 500):
-        times['testing'] = 0
-        testing(dict_size = dict_size)
-        mytimes[dict_size] = times['testing']
+    for probing in PROBING:
+        for dict_size in range(1100, 3000, 500):
+            times['testing'] = 0
+            print('Probing: ', probing)
+            testing(dict_size = dict_size, load_factor = 0.8,
+                    probing = probing)
+            mytimes[probing, dict_size] = times['testing']
@@ -0,0 +1,395 @@
+"""
+A dictionary split into shards that are served by a pool of processes, so
+batches of lookups and insertions are not limited by a single interpreter.
+
+Keys are routed to shards by the top bits of their full hash. Each shard is
+a table with the layout of dictionary_mmap.MmapDict (and thus of
+dictionary_oa.Dict), kept in two blocks of multiprocessing.shared_memory:
+one for the header, index table and entries, one for the heap of pickled
+keys and values. A shared memory block can not grow, so a shard that is
+resized or whose heap is full is copied to a new block and the old one is
+unlinked. The parent process keeps the names of the current blocks of every
+shard and passes them along with each task.
+
+get_many, set_many and delete_many split a batch by shard and hand one task
+per shard to the pool. Each shard is changed by at most one process at a
+time, the one running its task.
+
+Running this module times set_many and get_many with 1, 2, 4 and 8
+processes.
+
+This file requires Python 3.8 or later for multiprocessing.shared_memory.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    SHARED_MEMORY_INSTALLED = False
+else:
+    SHARED_MEMORY_INSTALLED = True
+
+import multiprocessing
+from timeit import default_timer
+from hashing import FNVHasher
+from dictionary_oa import DoubleHashing
+from dictionary_mmap import MmapDict, HEAP_MAGIC, table_length
+
+class SharedTable(MmapDict):
+    """
+    An MmapDict kept in shared memory blocks instead of files. If names (the
+    names of the table and heap blocks) is None, a new empty table is
+    created. Otherwise, the blocks are attached.
+
+    Attributes:
+        * names - The names of the table and heap blocks. They change when
+          the table is rebuilt or the heap grows.
+    """
+
+    def __init__(self, names = None, size = 8, seed = 0, max_load = 2/3,
+                 max_dummies = 1/4):
+        if not SHARED_MEMORY_INSTALLED:
+            raise ImportError("SharedTable requires "
+                              "multiprocessing.shared_memory")
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be in (0, 1)")
+        if not 0 < max_dummies <= 1:
+            raise ValueError("max_dummies must be in (0, 1]")
+        self.readonly = False
+        self.max_load = max_load
+        self.max_dummies = max_dummies
+        self.probing = DoubleHashing()
+        self.table = None
+        self.heap = None
+        if names is not None:
+            self.table_block = SharedMemory(name=names[0])
+            self.heap_block = SharedMemory(name=names[1])
+            self.table = self.table_block.buf
+            self.heap = self.heap_block.buf
+            self._read_header()
+        else:
+            self.heap_block = SharedMemory(create=True, size=4096)
+            self.heap = self.heap_block.buf
+            self.heap[:len(HEAP_MAGIC)] = HEAP_MAGIC
+            self.seed = seed
+            self.heap_end = len(HEAP_MAGIC)
+            self.table_block = None
+            self._replace_table(1 << (size - 1).bit_length(), [])
+        self.hasher = FNVHasher(self.seed)
+
+    @property
+    def names(self):
+        return self.table_block.name, self.heap_block.name
+
+    def __repr__(self):
+        return "SharedTable({0!r}, {1} entries)".format(self.names, self.used)
+
+    def _unmap(self):
+        if self.table is not None:
+            self.table = None
+            self.heap = None
+            self.table_block.close()
+            self.heap_block.close()
+
+    def refresh(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def unlink(self):
+        """
+        Free the shared memory blocks. The table can not be used afterwards
+        by any process.
+        """
+        self.table_block.unlink()
+        self.heap_block.unlink()
+        self._unmap()
+
+    def _replace_table(self, size, entries):
+        """
+        Write a table with the given size holding the given entries to a new
+        block and unlink the old block.
+        """
+        block = SharedMemory(create=True, size=table_length(size))
+        self._fill_table(block.buf, size, entries)
+        old = self.table_block
+        self.table_block = block
+        self.table = block.buf
+        if old is not None:
+            old.close()
+            old.unlink()
+        self._read_header()
+
+    def _remap_heap(self):
+        raise ValueError("heap offset out of range")
+
+    def _grow_heap(self, end):
+        """
+        Copy the heap to a new block at least end bytes long, doubling it, so
+        appending is amortized constant time. Offsets stay valid.
+        """
+        block = SharedMemory(create=True, size=max(end, 2*len(self.heap)))
+        block.buf[:self.heap_end] = self.heap[:self.heap_end]
+        old = self.heap_block
+        self.heap_block = block
+        self.heap = block.buf
+        old.close()
+        old.unlink()
+
+def _set_shard(task):
+    names, config, keys, values, hashes = task
+    table = SharedTable(names, **config)
+    try:
+        for key, value, key_hash in zip(keys, values, hashes):
+            table._insert(key, value, key_hash)
+            table._maybe_grow()
+        return table.names, table.used
+    finally:
+        table.close()
+
+def _get_shard(task):
+    names, config, keys, hashes, default = task
+    table = SharedTable(names, **config)
+    try:
+        result = []
+        for key, key_hash in zip(keys, hashes):
+            i, ix = table._lookup(key, key_hash)
+            result.append(table._read(table._entry(ix)[2]) if ix >= 0
+                          else default)
+        return result
+    finally:
+        table.close()
+
+def _delete_shard(task):
+    names, config, keys, hashes = task
+    table = SharedTable(names, **config)
+    try:
+        for key, key_hash in zip(keys, hashes):
+            i, ix = table._lookup(key, key_hash)
+            if ix >= 0:
+                table._del(i, ix)
+                table._maybe_shrink()
+        return table.names, table.used
+    finally:
+        table.close()
+
+def _items_shard(task):
+    names, config = task
+    table = SharedTable(names, **config)
+    try:
+        return table.items()
+    finally:
+        table.close()
+
+class ShardedDict(object):
+    """
+    A mapping split into shards of shared memory tables, see the module
+    description. The pool is started on the first batch operation. Call
+    close (or use the dictionary as a context manager) to stop the pool and
+    free the shared memory.
+
+    Attributes:
+        * shards - The number of shards. Always a power of two.
+        * shift - The hash is shifted right by this to get the shard of a
+          key.
+        * processes - The number of processes in the pool. If None, one per
+          CPU.
+        * hasher - Maps keys to full hashes. It is a FNVHasher, so every
+          process hashes keys the same way.
+        * names - The names of the blocks of each shard.
+        * used - The number of entries in each shard.
+        * config - The arguments used to attach a shard.
+    """
+
+    def __init__(self, shards = 8, processes = None, size = 1024, seed = 0,
+                 max_load = 2/3, max_dummies = 1/4):
+        if shards < 1:
+            raise ValueError("there must be at least one shard")
+        self.shards = 1 << (shards - 1).bit_length()
+        self.shift = 64 - (self.shards - 1).bit_length()
+        self.processes = processes
+        self.hasher = FNVHasher(seed)
+        self.config = dict(max_load=max_load, max_dummies=max_dummies)
+        self.names = []
+        for j in range(self.shards):
+            table = SharedTable(size=max(8, size // self.shards), seed=seed,
+                                **self.config)
+            self.names.append(table.names)
+            table.close()
+        self.used = [0]*self.shards
+        self.pool = None
+
+    def _map(self, func, tasks):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        return self.pool.map(func, tasks)
+
+    def _split(self, keys):
+        """
+        Return the hashes of the keys and, for every shard, the positions in
+        keys of the keys that belong to it.
+        """
+        hashes = [self.hasher(key) for key in keys]
+        positions = [[] for j in range(self.shards)]
+        shift = self.shift
+        for n, key_hash in enumerate(hashes):
+            # With one shard, the shift is 64 and the shard always 0.
+            positions[key_hash >> shift].append(n)
+        return hashes, positions
+
+    def set_many(self, keys, values):
+        """
+        Set the values of many keys at once.
+        """
+        keys = list(keys)
+        values = list(values)
+        if len(keys) != len(values):
+            raise ValueError("keys and values must have the same length")
+        # None is used as a marker for empty entries, so it can't be in a
+        # dictionary.
+        assert None not in keys and None not in values, \
+            "key and value must not be None"
+        hashes, positions = self._split(keys)
+        shards = [j for j in range(self.shards) if positions[j]]
+        tasks = [(self.names[j], self.config,
+                  [keys[n] for n in positions[j]],
+                  [values[n] for n in positions[j]],
+                  [hashes[n] for n in positions[j]]) for j in shards]
+        for j, (names, used) in zip(shards, self._map(_set_shard, tasks)):
+            self.names[j] = names
+            self.used[j] = used
+
+    def get_many(self, keys, default=0):
+        """
+        Return a list of the values for many keys, with the default for keys
+        that are not in the dictionary.
+        """
+        keys = list(keys)
+        hashes, positions = self._split(keys)
+        shards = [j for j in range(self.shards) if positions[j]]
+        tasks = [(self.names[j], self.config,
+                  [keys[n] for n in positions[j]],
+                  [hashes[n] for n in positions[j]], default) for j in shards]
+        result = [default]*len(keys)
+        for j, values in zip(shards, self._map(_get_shard, tasks)):
+            for n, value in zip(positions[j], values):
+                result[n] = value
+        return result
+
+    def delete_many(self, keys):
+        """
+        Remove many keys at once. Keys that are not in the dictionary are
+        ignored. Return the number of keys removed.
+        """
+        keys = list(keys)
+        hashes, positions = self._split(keys)
+        shards = [j for j in range(self.shards) if positions[j]]
+        tasks = [(self.names[j], self.config,
+                  [keys[n] for n in positions[j]],
+                  [hashes[n] for n in positions[j]]) for j in shards]
+        before = len(self)
+        for j, (names, used) in zip(shards, self._map(_delete_shard, tasks)):
+            self.names[j] = names
+            self.used[j] = used
+        return before - len(self)
+
+    def items(self):
+        """
+        Return a list of key-value pairs.
+        """
+        tasks = [(names, self.config) for names in self.names]
+        return [item for items in self._map(_items_shard, tasks)
+                for item in items]
+
+    def keys(self):
+        """
+        Return a list of keys in the dictionary.
+        """
+        return [key for key, value in self.items()]
+
+    def values(self):
+        """
+        Return a list of values in the dictionary.
+        """
+        return [value for key, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        value = self.get_many([key], None)[0]
+        if value is None:
+            raise KeyError("no such key: {0!r}".format(key))
+        return value
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        value = self.get_many([key], None)[0]
+        return default if value is None else value
+
+    def __setitem__(self, key, what):
+        self.set_many([key], [what])
+
+    def __delitem__(self, key):
+        if not self.delete_many([key]):
+            raise KeyError("no such key: {0!r}".format(key))
+
+    def __contains__(self, key):
+        return self.get_many([key], None)[0] is not None
+
+    def __len__(self):
+        return sum(self.used)
+
+    def close(self):
+        """
+        Stop the pool and free the shared memory of all shards.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for names in self.names:
+            SharedTable(names, **self.config).unlink()
+        self.names = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return "ShardedDict({0} shards, {1} entries)".format(self.shards,
+                                                            len(self))
+
+def benchmark(num_keys = 200000, processes = (1, 2, 4, 8)):
+    """
+    Print the time per key of set_many and get_many of integer keys for
+    several numbers of processes.
+    """
+    keys = list(range(num_keys))
+    for num_processes in processes:
+        with ShardedDict(shards=8, processes=num_processes,
+                         size=2*num_keys) as d:
+            # Start the pool outside of the timing.
+            d.get_many([0])
+            t1 = default_timer()
+            d.set_many(keys, keys)
+            t2 = default_timer()
+            d.get_many(keys)
+            t3 = default_timer()
+        print('%d processes set_many %6.0fns/key get_many %6.0fns/key'
+              % (num_processes, (t2-t1)*1e9/num_keys,
+                 (t3-t2)*1e9/num_keys))
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,458 @@
+"""
+A mapping implemented as an open addressing table with a separate array of
+control bytes, as in the SwissTable of Abseil.
+
+The control byte of a slot is EMPTY, DELETED, or the low 7 bits of the full
+hash of the key in the slot (its fragment). The slots are split into
+aligned groups of GROUP slots, and a probe sequence goes from group to
+group. In each group, the control bytes are searched for the fragment of
+the key with bytearray.find, which scans them in C, and only slots whose
+fragment matches have their hash and key compared. A fragment matches a
+different key one time in 128, so a lookup of a key that is not in the
+table usually touches no entry at all. A group with an EMPTY slot ends the
+probe sequence, since an insertion would have used that slot.
+
+A deleted slot becomes EMPTY again if its group still has an EMPTY slot,
+since no probe sequence went past that group. Otherwise it is marked
+DELETED, and the table is rebuilt when the DELETED slots use up the room
+for growth.
+
+Running this module compares lookups with dictionary_oa.Dict, whose probes
+look at the index table and the hash of every entry on the way.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import random
+from array import array
+from timeit import default_timer
+from hashing import MixHasher, random_seed
+import views
+
+# The number of slots whose control bytes are searched at once.
+GROUP = 16
+GROUP_BITS = 4
+
+# The control bytes of slots without an entry. Fragments are below 0x80.
+EMPTY = 0x80
+DELETED = 0xFE
+
+class SwissDict(object):
+    """
+    A mapping interface implemented as a hash table with control bytes, see
+    the module description. Iteration goes over the slots in order, so it
+    does not follow the order of insertion.
+
+    Attributes:
+        * used - The number of entries.
+        * deleted - The number of slots marked DELETED.
+        * groups - The number of groups. Always a power of two.
+        * ctrl - The control byte of every slot, a bytearray.
+        * slot_keys, slot_values - The entries of the slots. Empty slots
+          hold None.
+        * hashes - The full hashes of the entries of the slots, so the table
+          is rebuilt without hashing keys again.
+        * max_load - Maximum fraction of slots used or DELETED before the
+          table is rebuilt.
+        * growth_left - The number of EMPTY slots that can still be filled
+          before the table is rebuilt.
+        * hasher - Maps keys to full hashes. By default, a MixHasher with a
+          random seed.
+        * version - Incremented by every change other than setting the value
+          of a key that is in the dictionary already. Iterators stop with an
+          error when it changes.
+    """
+
+    def __init__(self, size = 111, max_load = 7/8, hasher = None):
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be in (0, 1)")
+        self.max_load = max_load
+        self.hasher = MixHasher(random_seed()) if hasher is None else hasher
+        # Groups are found by masking the hash, so round up to a power of
+        # two.
+        groups = max(1, -(-size // GROUP))
+        self.mingroups = 1 << (groups - 1).bit_length()
+        self.version = 0
+        self.clear()
+
+    @classmethod
+    def fromkeys(cls, keys, value=0):
+        """
+        Return a new dictionary from a sequence of keys.
+        """
+        d = cls()
+        for key in keys:
+            d[key] = value
+        return d
+
+    def clear(self):
+        """
+        Clear the dictionary of all data.
+        """
+        self.version += 1
+        self._allocate(self.mingroups)
+        self.used = 0
+
+    def _allocate(self, groups):
+        """
+        Make the table empty with the given number of groups.
+        """
+        slots = groups*GROUP
+        self.groups = groups
+        self.ctrl = bytearray([EMPTY])*slots
+        self.slot_keys = [None]*slots
+        self.slot_values = [None]*slots
+        self.hashes = array('Q', [0])*slots
+        self.deleted = 0
+        self.growth_left = int(slots*self.max_load)
+
+    def _lookup(self, key, key_hash):
+        """
+        Return the slot of the entry for key, or -1 if the key is not in the
+        table.
+        """
+        ctrl = self.ctrl
+        fragment = key_hash & 0x7F
+        mask = self.groups - 1
+        g = (key_hash >> 7) & mask
+        # Visits every group once, since the number of groups is a power of
+        # two.
+        for step in range(1, self.groups + 1):
+            start = g << GROUP_BITS
+            end = start + GROUP
+            n = ctrl.find(fragment, start, end)
+            while n >= 0:
+                if self.hashes[n] == key_hash:
+                    other = self.slot_keys[n]
+                    if other is key or other == key:
+                        return n
+                n = ctrl.find(fragment, n + 1, end)
+            if ctrl.find(EMPTY, start, end) >= 0:
+                return -1
+            g = (g + step) & mask
+        return -1
+
+    def _free_slot(self, key_hash):
+        """
+        Return the first EMPTY or DELETED slot on the probe sequence of the
+        hash. There is always one, since the table is rebuilt before it is
+        full.
+        """
+        ctrl = self.ctrl
+        mask = self.groups - 1
+        g = (key_hash >> 7) & mask
+        for step in range(1, self.groups + 1):
+            start = g << GROUP_BITS
+            end = start + GROUP
+            n = ctrl.find(EMPTY, start, end)
+            if self.deleted:
+                m = ctrl.find(DELETED, start, end)
+                if m >= 0 and (n < 0 or m < n):
+                    n = m
+            if n >= 0:
+                return n
+            g = (g + step) & mask
+        raise RuntimeError("dictionary is full")
+
+    def _place(self, key, value, key_hash):
+        n = self._free_slot(key_hash)
+        if self.ctrl[n] == EMPTY:
+            self.growth_left -= 1
+        else:
+            self.deleted -= 1
+        self.ctrl[n] = key_hash & 0x7F
+        self.slot_keys[n] = key
+        self.slot_values[n] = value
+        self.hashes[n] = key_hash
+
+    def _rehash(self):
+        """
+        Rebuild the table without DELETED slots. The table doubles, unless
+        most of the slots that are not EMPTY are DELETED. It also doubles
+        until there is room for one more entry, which a small table with a
+        low max_load may not have.
+        """
+        self.version += 1
+        entries = [(key_hash, key, value) for key_hash, key, value
+                   in zip(self.hashes, self.slot_keys, self.slot_values)
+                   if key is not None]
+        groups = self.groups
+        if self.used >= groups*GROUP*self.max_load/2:
+            groups <<= 1
+        while int(groups*GROUP*self.max_load) <= self.used:
+            groups <<= 1
+        self._allocate(groups)
+        place = self._place
+        for key_hash, key, value in entries:
+            place(key, value, key_hash)
+
+    def _insert(self, key, value, key_hash):
+        """
+        Add a new value to the dictionary or replace an old one.
+        """
+        n = self._lookup(key, key_hash)
+        if n >= 0:
+            self.slot_values[n] = value
+            return
+        if self.growth_left <= 0:
+            self._rehash()
+        self._place(key, value, key_hash)
+        self.used += 1
+        self.version += 1
+
+    def _del(self, n):
+        """
+        Remove the entry in slot n.
+        """
+        self.version += 1
+        self.used -= 1
+        start = n & ~(GROUP - 1)
+        if self.ctrl.find(EMPTY, start, start + GROUP) >= 0:
+            self.ctrl[n] = EMPTY
+            self.growth_left += 1
+        else:
+            self.ctrl[n] = DELETED
+            self.deleted += 1
+        self.slot_keys[n] = None
+        self.slot_values[n] = None
+        self.hashes[n] = 0
+
+    def __getitem__(self, key):
+        n = self._lookup(key, self.hasher(key))
+        if n < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        return self.slot_values[n]
+
+    def __setitem__(self, key, what):
+        # None is used as a marker for empty slots, so it can't be in a
+        # dictionary.
+        assert what is not None and key is not None, \
+            "key and value must not be None"
+        self._insert(key, what, self.hasher(key))
+
+    def __delitem__(self, key):
+        n = self._lookup(key, self.hasher(key))
+        if n < 0:
+            raise KeyError("no such key: {0!r}".format(key))
+        self._del(n)
+
+    def __contains__(self, key):
+        return self._lookup(key, self.hasher(key)) >= 0
+
+    def get(self, key, default=0):
+        """
+        Return the value for key if it exists otherwise the default.
+        """
+        n = self._lookup(key, self.hasher(key))
+        return default if n < 0 else self.slot_values[n]
+
+    def pop(self, *args):
+        """
+        Remove and return the value for a key.
+        """
+        n = self._lookup(args[0], self.hasher(args[0]))
+        if n < 0:
+            if len(args) == 2:
+                return args[1]
+            raise KeyError("no such key: {0!r}".format(args[0]))
+        value = self.slot_values[n]
+        self._del(n)
+        return value
+
+    def popitem(self):
+        """
+        Remove and return any key-value pair from the dictionary.
+        """
+        if self.used == 0:
+            raise KeyError("empty dictionary")
+        for n, key in enumerate(self.slot_keys):
+            if key is not None:
+                item = key, self.slot_values[n]
+                self._del(n)
+                return item
+
+    def setdefault(self, key, default=0):
+        """
+        If key is in the dictionary, return it. Otherwise, set it to the
+        default value.
+        """
+        key_hash = self.hasher(key)
+        n = self._lookup(key, key_hash)
+        if n < 0:
+            assert default is not None and key is not None, \
+                "key and value must not be None"
+            self._insert(key, default, key_hash)
+            return default
+        return self.slot_values[n]
+
+    def update(self, other = (), **kwargs):
+        """
+        Add the key-value pairs from a mapping (anything with a keys method)
+        or a sequence of pairs, and from the keyword arguments, as dict.update
+        does.
+        """
+        if hasattr(other, "keys"):
+            pairs = [(key, other[key]) for key in other.keys()]
+        else:
+            pairs = []
+            for double in other:
+                if len(double) != 2:
+                    raise ValueError("{0!r} doesn't have a length of 2".format(
+                            double))
+                pairs.append(tuple(double))
+        pairs.extend(kwargs.items())
+        for key, value in pairs:
+            self[key] = value
+
+    def __eq__(self, other):
+        if not hasattr(other, "keys"):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        for key, value in self._iter_items():
+            try:
+                if not other[key] == value:
+                    return False
+            except KeyError:
+                return False
+        return True
+
+    def __ne__(self, other):
+        return not self == other
+
+    def keys(self):
+        """
+        Return a live view of the keys in the dictionary, see the views
+        module.
+        """
+        return views.KeysView(self)
+
+    def values(self):
+        """
+        Return a live view of the values in the dictionary.
+        """
+        return views.ValuesView(self)
+
+    def items(self):
+        """
+        Return a live view of the key-value pairs in the dictionary.
+        """
+        return views.ItemsView(self)
+
+    def _iter_items(self):
+        """
+        Generate the key-value pairs, walking the slots once.
+        """
+        version = self.version
+        for item in zip(self.slot_keys, self.slot_values):
+            if item[0] is not None:
+                yield item
+                if self.version != version:
+                    raise RuntimeError("dictionary changed during iteration")
+
+    def _iter_keys(self):
+        for key, value in self._iter_items():
+            yield key
+
+    def _iter_values(self):
+        for key, value in self._iter_items():
+            yield value
+
+    def _reversed_items(self):
+        """
+        Generate the key-value pairs in the reverse order of iteration.
+        """
+        version = self.version
+        for item in reversed(list(self._iter_items())):
+            yield item
+            if self.version != version:
+                raise RuntimeError("dictionary changed during iteration")
+
+    def __iter__(self):
+        return self._iter_keys()
+
+    def __reversed__(self):
+        for key, value in self._reversed_items():
+            yield key
+
+    def __len__(self):
+        return self.used
+
+    def __repr__(self):
+        r = ["{0!r} : {1!r}".format(k, v) for k, v in self._iter_items()]
+        return "SwissDict({" + ", ".join(r) + "})"
+
+def entries_compared(d, key):
+    """
+    Return the number of entries of a SwissDict whose hash a lookup of key
+    compares, that is the slots whose control byte matches the fragment of
+    the key on the way.
+    """
+    key_hash = d.hasher(key)
+    fragment = key_hash & 0x7F
+    mask = d.groups - 1
+    g = (key_hash >> 7) & mask
+    compared = 0
+    for step in range(1, d.groups + 1):
+        start = g << GROUP_BITS
+        group = d.ctrl[start:start + GROUP]
+        for n, byte in enumerate(group):
+            if byte == fragment:
+                compared += 1
+                if d.slot_keys[start + n] == key:
+                    return compared
+        if EMPTY in group:
+            break
+        g = (g + step) & mask
+    return compared
+
+def benchmark(slots = 1 << 16, loads = (0.5, 0.7, 0.875), samples = 20000):
+    """
+    Fill a SwissDict and a dictionary_oa.Dict (double hashing and linear
+    probing) with the same number of slots to each load factor, and print
+    the mean time per hit and per miss, and the number of entries whose
+    hash a miss compares.
+    """
+    from dictionary_oa import Dict
+    rng = random.Random(3)
+    print('%-6s %-7s %9s %9s %14s' % ('load', 'table', 'hit', 'miss',
+                                      'entries/miss'))
+    for load in loads:
+        n = int(load*slots)
+        keys = [rng.getrandbits(63) for i in range(n)]
+        misses = [rng.getrandbits(63) for i in range(samples)]
+        hits = rng.sample(keys, min(samples, n))
+        tables = [('double', Dict(slots, resizing=False, flood_limit=None)),
+                  ('linear', Dict(slots, resizing=False, probing="linear",
+                                  flood_limit=None)),
+                  ('swiss', SwissDict(slots, max_load=0.9))]
+        for name, d in tables:
+            for key in keys:
+                d[key] = 1
+            t1 = default_timer()
+            for key in hits:
+                key in d
+            t2 = default_timer()
+            for key in misses:
+                key in d
+            t3 = default_timer()
+            if name == 'swiss':
+                compared = sum(entries_compared(d, key) for key in misses)
+            else:
+                # Every slot of the probe sequence but the EMPTY one at the
+                # end holds an entry whose hash is compared.
+                d.enable_stats()
+                for key in misses:
+                    key in d
+                compared = d.stats()['counters']['probes'] - len(misses)
+            print('%-6.3f %-7s %7.0fns %7.0fns %14.3f'
+                  % (load, name, (t2-t1)*1e9/len(hits),
+                     (t3-t2)*1e9/len(misses), compared/len(misses)))
+
+if __name__ == '__main__':
+
+    benchmark()
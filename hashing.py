@@ -0,0 +1,195 @@
+"""
+Hash functions shared by the dictionary implementations in dictionary_oa and
+dictionary_chain.
+
+A hasher is a callable object that maps any hashable key to a well mixed
+64-bit integer (the full hash). Tables use a power of two number of slots, so
+the slot for a key is found by masking off the low bits of its full hash
+instead of reducing it modulo the size.
+
+Two hashers are provided:
+
+   * MixHasher - Applies a seeded 64-bit finalizer to the builtin hash of the
+     key. This is fast and accepts any hashable key, but the builtin hash of
+     strings and bytes is randomized per process.
+   * FNVHasher - FNV-1a over a byte encoding of the key. This is slower, but
+     gives the same hash in every process, so tables can be shared or stored.
+
+The dictionaries give every table its own random seed (see random_seed), so
+keys that collide in one table do not collide in another, and they switch
+to a new seed (see reseeded) when they detect keys that were chosen to
+collide. Keys whose builtin hashes are equal collide in MixHasher whatever
+the seed, so tables holding untrusted keys of that kind should use a
+FNVHasher.
+
+Running this module compares them with the polynomial hash that the
+dictionaries used originally, both for speed and for how evenly the keys are
+spread over the slots.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import binascii, os, random, string
+from timeit import default_timer
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+
+def fmix64(h):
+    """
+    The finalizer of MurmurHash3. Every bit of the input affects every bit of
+    the output, so the low bits can be used directly as a slot.
+    """
+    h ^= h >> 33
+    h = (h * 0xff51afd7ed558ccd) & MASK64
+    h ^= h >> 33
+    h = (h * 0xc4ceb9fe1a85ec53) & MASK64
+    h ^= h >> 33
+    return h
+
+def key_bytes(key):
+    """
+    Return a byte encoding of a key such that keys that compare equal have
+    the same encoding. Supports strings, bytes, numbers and tuples of those.
+    """
+    if isinstance(key, bytes):
+        return b"b" + key
+    if isinstance(key, str):
+        return b"s" + key.encode("utf-8")
+    if isinstance(key, float) and key.is_integer():
+        key = int(key)
+    if isinstance(key, int):
+        return b"i" + str(int(key)).encode("ascii")
+    if isinstance(key, float):
+        return b"f" + repr(key).encode("ascii")
+    if isinstance(key, tuple):
+        parts = [key_bytes(k) for k in key]
+        return b"t" + b"".join(str(len(p)).encode("ascii") + b":" + p
+                               for p in parts)
+    raise TypeError("cannot encode key of type {0}".format(
+            type(key).__name__))
+
+class MixHasher(object):
+    """
+    Hash a key with the builtin hash and a seeded 64-bit finalizer.
+
+    Attributes:
+       * seed - Changes the mapping from keys to hashes.
+       * stable - False, since the builtin hash of strings changes between
+         processes.
+    """
+
+    stable = False
+
+    def __init__(self, seed = 0):
+        self.seed = seed
+
+    def __call__(self, key):
+        return fmix64((hash(key) ^ self.seed) & MASK64)
+
+    def __repr__(self):
+        return "MixHasher(seed={0})".format(self.seed)
+
+class FNVHasher(object):
+    """
+    Hash a key with 64-bit FNV-1a over its byte encoding.
+
+    Attributes:
+       * seed - Changes the mapping from keys to hashes.
+       * stable - True, the hash of a key is the same in every process.
+    """
+
+    stable = True
+
+    def __init__(self, seed = 0):
+        self.seed = seed
+
+    def __call__(self, key):
+        h = FNV_OFFSET ^ self.seed
+        for c in bytearray(key_bytes(key)):
+            h = ((h ^ c) * FNV_PRIME) & MASK64
+        # FNV-1a leaves the low bits poorly mixed for short keys.
+        return fmix64(h)
+
+    def __repr__(self):
+        return "FNVHasher(seed={0})".format(self.seed)
+
+def random_seed():
+    """
+    Return a random 64-bit seed from the operating system, so the hashes of
+    a table can not be predicted from outside the process.
+    """
+    return int(binascii.hexlify(os.urandom(8)), 16)
+
+def reseeded(hasher):
+    """
+    Return a hasher of the same class as hasher with a new random seed, or
+    None if hasher does not take a seed.
+    """
+    if not hasattr(hasher, "seed"):
+        return None
+    return type(hasher)(random_seed())
+
+def polynomial_hash(s, size):
+    """
+    The polynomial string hash the dictionaries originally used. It is kept
+    for comparison only.
+    """
+    h, a, b = 0, 31415, 27183
+    if isinstance(s, int):
+        return s % size
+    for c in s:
+        h = (a*h + ord(c)) % size
+        a = a+b % (size - 1)
+    return h
+
+def spread(slots, size):
+    """
+    Return the chi-squared statistic and the largest bucket for a list of
+    slots. For uniformly spread keys, the statistic is close to size.
+    """
+    buckets = [0]*size
+    for i in slots:
+        buckets[i] += 1
+    expected = len(slots) / size
+    chi2 = sum((b - expected)**2 for b in buckets) / expected
+    return chi2, max(buckets)
+
+def benchmark(num_keys = 100000, size = 1 << 16):
+    """
+    Print the time per key and the distribution quality of each hash for
+    several kinds of keys.
+    """
+    random.seed(3)
+    workloads = {
+        'random strings': [''.join(random.choice(string.ascii_letters)
+                                   for k in range(10))
+                           for i in range(num_keys)],
+        'sequential strings': ['key{0}'.format(i) for i in range(num_keys)],
+        'sequential ints': list(range(0, num_keys*size, size)),
+        }
+    mask = size - 1
+    hashes = {
+        'polynomial': lambda k: polynomial_hash(k, size),
+        'mix': lambda k, h=MixHasher(): h(k) & mask,
+        'fnv': lambda k, h=FNVHasher(): h(k) & mask,
+        }
+    for workload, keys in sorted(workloads.items()):
+        for name, func in sorted(hashes.items()):
+            t1 = default_timer()
+            slots = [func(k) for k in keys]
+            t2 = default_timer()
+            chi2, longest = spread(slots, size)
+            print('%-18s %-10s %8.0fns/key chi2/size %6.2f largest bucket %d'
+                  % (workload, name, (t2-t1)*1e9/num_keys, chi2/size,
+                     longest))
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,299 @@
+"""
+Headless analysis of how the slots of a dictionary_oa.Dict or the buckets
+of a dictionary_chain.Dict are occupied, for looking at clustering on
+machines without a display. Unlike draw_dictionary, which draws every cell
+with pygame and waits for the window to be closed, every step works on the
+whole table at once, with numpy if it is installed and with bytes
+operations otherwise, so tables with tens of millions of slots are fine.
+
+The results can be exported as a PNG or PPM image, where each pixel shows
+the average color of a block of consecutive cells, or as JSON.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+try:
+    import numpy as np
+except ImportError:
+    NUMPY_INSTALLED = False
+else:
+    NUMPY_INSTALLED = True
+
+import json, struct, sys, zlib
+from binascii import hexlify, unhexlify
+from itertools import repeat
+from math import sqrt
+from tablestats import histogram
+
+# The states of a slot: never used, marked with DUMMY, holding an entry.
+FREE = 0
+DELETED = 1
+USED = 2
+
+# The colors of the states in images. Used slots have the color
+# draw_dictionary gives them.
+SLOT_COLORS = {FREE: (0, 0, 0), DELETED: (200, 60, 60), USED: (200, 200, 100)}
+
+# Cells that pad the image to a rectangle are white, as in draw_dictionary.
+PADDING = 255
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def translation(func):
+    """
+    Return a table for bytes.translate that maps every byte b to func(b).
+    """
+    return bytes(bytearray(func(b) for b in range(256)))
+
+# The index of a slot is negative (its most significant byte is at least
+# 0x80) for EMPTY and DUMMY, and the least significant byte tells them apart.
+_USED_HIGH = translation(lambda b: USED if b < 0x80 else FREE)
+_DELETED_LOW = translation(lambda b: DELETED if b == 0xFE else FREE)
+_MERGED = translation(lambda b: USED if b & USED else b)
+_OCCUPIED = translation(lambda b: 1 if b else 0)
+# The shade of a bucket, as in draw_dictionary of dictionary_chain.
+_SHADE = translation(lambda b: min(50*b, 255))
+
+def slot_states(indices):
+    """
+    Return the state (FREE, DELETED or USED) of every slot of the index
+    table of a dictionary_oa.Dict as bytes.
+    """
+    if NUMPY_INSTALLED:
+        a = np.frombuffer(indices, dtype=indices.typecode)
+        states = np.zeros(len(a), dtype=np.uint8)
+        states[a == -2] = DELETED
+        states[a >= 0] = USED
+        return states.tobytes()
+    # array.tostring was renamed to tobytes in Python 3.
+    raw = indices.tobytes() if hasattr(indices, 'tobytes') \
+        else indices.tostring()
+    width = indices.itemsize
+    if sys.byteorder == 'little':
+        high, low = raw[width-1::width], raw[::width]
+    else:
+        high, low = raw[::width], raw[width-1::width]
+    used = high.translate(_USED_HIGH)
+    deleted = low.translate(_DELETED_LOW)
+    if not used:
+        return used
+    # Or the two as integers, which combines them without a loop in Python.
+    # The conversions go through hex strings, which works in Python 2 too.
+    states = int(hexlify(used), 16) | int(hexlify(deleted), 16)
+    states = unhexlify('{0:0{1}x}'.format(states, 2*len(used)))
+    return states.translate(_MERGED)
+
+def downsample(plane, block, cells, pad):
+    """
+    Return the averages of the blocks of block consecutive bytes of plane,
+    padded with pad to cells bytes, as bytes.
+    """
+    plane = plane + bytes(bytearray([pad]))*(cells - len(plane))
+    if block == 1:
+        return plane
+    if NUMPY_INSTALLED:
+        a = np.frombuffer(plane, dtype=np.uint8).reshape(-1, block)
+        return np.round(a.mean(axis=1)).astype(np.uint8).tobytes()
+    return bytes(bytearray(int(round(sum(bytearray(plane[k:k+block]))/block))
+                           for k in range(0, cells, block)))
+
+def png_chunk(tag, data):
+    return b''.join([struct.pack('>I', len(data)), tag, data,
+                     struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)])
+
+class Occupancy(object):
+    """
+    How the cells (slots or buckets) of a table are occupied. Create it with
+    the occupancy method of a dictionary.
+
+    Attributes:
+       * kind - "slots" for an open addressing table, "buckets" for a
+         chained table.
+       * size - The number of cells.
+       * states - For slots, the state of each slot as bytes, see
+         slot_states. None for buckets.
+       * lengths - For buckets, the length of each chain as a list, or a
+         numpy array if numpy is installed. None for slots.
+    """
+
+    def __init__(self, kind, size, states = None, lengths = None):
+        self.kind = kind
+        self.size = size
+        self.states = states
+        self.lengths = lengths
+
+    @classmethod
+    def from_indices(cls, indices):
+        return cls("slots", len(indices), states=slot_states(indices))
+
+    @classmethod
+    def from_chain_lengths(cls, lengths):
+        if NUMPY_INSTALLED:
+            lengths = np.asarray(lengths, dtype=np.int64)
+        else:
+            lengths = list(lengths)
+        return cls("buckets", len(lengths), lengths=lengths)
+
+    def occupied(self):
+        """
+        Return bytes with a 1 for every cell that is not free and a 0 for
+        every other. Slots marked with DUMMY are occupied, since probe
+        sequences go through them.
+        """
+        if self.states is not None:
+            return self.states.translate(_OCCUPIED)
+        if NUMPY_INSTALLED:
+            return (self.lengths > 0).astype(np.uint8).tobytes()
+        return bytes(bytearray(map(min, self.lengths, repeat(1))))
+
+    def clusters(self):
+        """
+        Return a dict mapping the length of a run of occupied cells to the
+        number of such runs. Runs wrap around the end of the table.
+        """
+        occupied = self.occupied()
+        start = occupied.find(b'\x00')
+        if start < 0:
+            return {self.size: 1} if self.size else {}
+        # Start at a free cell, so no run is split at the end of the table.
+        occupied = occupied[start:] + occupied[:start]
+        if not NUMPY_INSTALLED:
+            return histogram(len(run) for run in occupied.split(b'\x00')
+                             if run)
+        a = np.frombuffer(occupied, dtype=np.uint8).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], a, [0])))
+        runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+        counts = np.bincount(runs)
+        return dict((int(length), int(counts[length]))
+                    for length in np.flatnonzero(counts))
+
+    def summary(self):
+        """
+        Return the counts of the analysis as a dict: the size, the number of
+        free, deleted and used slots or the chain_histogram of buckets
+        (a list whose k-th element is the number of chains of length k),
+        and the histogram and maximum of the cluster lengths.
+        """
+        clusters = self.clusters()
+        result = {
+            'kind': self.kind,
+            'size': self.size,
+            'cluster_histogram': clusters,
+            'max_cluster': max(clusters) if clusters else 0,
+            }
+        if self.states is not None:
+            for name, state in (('free', FREE), ('deleted', DELETED),
+                                ('used', USED)):
+                result[name] = self.states.count(bytes(bytearray([state])))
+        elif NUMPY_INSTALLED:
+            result['chain_histogram'] = [int(count) for count in
+                                         np.bincount(self.lengths,
+                                                     minlength=1)]
+        else:
+            counts = histogram(self.lengths)
+            longest = max(counts) if counts else 0
+            result['chain_histogram'] = [counts.get(length, 0) for length
+                                         in range(longest + 1)]
+        return result
+
+    def planes(self):
+        """
+        Return the red, green and blue shade of every cell as three bytes
+        objects. Slots have the colors in SLOT_COLORS, buckets the gray of
+        draw_dictionary, brighter for longer chains.
+        """
+        if self.states is not None:
+            return [self.states.translate(translation(
+                        lambda b: SLOT_COLORS.get(b, (0, 0, 0))[channel]))
+                    for channel in range(3)]
+        if NUMPY_INSTALLED:
+            shade = np.minimum(50*self.lengths, 255).astype(np.uint8).tobytes()
+        else:
+            shade = bytes(bytearray(map(min, self.lengths,
+                                        repeat(255)))).translate(_SHADE)
+        return [shade]*3
+
+    def layout(self, max_pixels):
+        """
+        Return the number of cells per pixel, and the width and height of an
+        image of at most about max_pixels pixels showing the cells row by
+        row.
+        """
+        block = max(1, -(-self.size // max_pixels))
+        pixels = -(-self.size // block)
+        width = max(1, int(sqrt(pixels - 1)) + 1)
+        height = -(-pixels // width)
+        return block, width, height
+
+    def image(self, max_pixels = 1 << 20):
+        """
+        Return the width, height and RGB bytes (row by row, three bytes per
+        pixel) of the image of the cells.
+        """
+        block, width, height = self.layout(max_pixels)
+        cells = block*width*height
+        rgb = bytearray(3*width*height)
+        for channel, plane in enumerate(self.planes()):
+            rgb[channel::3] = downsample(plane, block, cells, PADDING)
+        return width, height, bytes(rgb)
+
+    def to_ppm(self, max_pixels = 1 << 20):
+        """
+        Return the image of the cells as a binary PPM file.
+        """
+        width, height, rgb = self.image(max_pixels)
+        return 'P6\n{0} {1}\n255\n'.format(width, height).encode() + rgb
+
+    def to_png(self, max_pixels = 1 << 20, level = 6):
+        """
+        Return the image of the cells as a PNG file, compressed with the
+        given zlib level.
+        """
+        width, height, rgb = self.image(max_pixels)
+        stride = 3*width
+        # Every row starts with filter type 0 (none).
+        rows = b''.join(b'\x00' + rgb[k:k+stride]
+                        for k in range(0, len(rgb), stride))
+        header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+        return b''.join([PNG_SIGNATURE, png_chunk(b'IHDR', header),
+                         png_chunk(b'IDAT', zlib.compress(rows, level)),
+                         png_chunk(b'IEND', b'')])
+
+    def to_json(self, max_pixels = 4096):
+        """
+        Return the summary as JSON, with a heatmap of at most about
+        max_pixels values: the fraction of occupied cells in each block of
+        consecutive cells, row by row.
+        """
+        block, width, height = self.layout(max_pixels)
+        occupied = self.occupied().translate(translation(
+            lambda b: 255 if b else 0))
+        heat = downsample(occupied, block, block*width*height, 0)
+        result = self.summary()
+        result['heatmap'] = {
+            'width': width,
+            'height': height,
+            'cells_per_pixel': block,
+            'occupied': [round(b/255, 3) for b in bytearray(heat)],
+            }
+        return json.dumps(result, sort_keys=True)
+
+    def save(self, path, max_pixels = None):
+        """
+        Write the analysis to a file. The format (png, ppm or json) is taken
+        from the extension of the path.
+        """
+        if path.endswith('.png'):
+            data = self.to_png(max_pixels or 1 << 20)
+        elif path.endswith('.ppm'):
+            data = self.to_ppm(max_pixels or 1 << 20)
+        elif path.endswith('.json'):
+            data = self.to_json(max_pixels or 4096).encode()
+        else:
+            raise ValueError("unknown format, use .png, .ppm or .json")
+        with open(path, 'wb') as fp:
+            fp.write(data)
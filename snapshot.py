@@ -0,0 +1,106 @@
+"""
+A binary snapshot format for the dictionaries in dictionary_oa and
+dictionary_chain, used by their dump and load methods and for pickling.
+
+A snapshot is laid out as:
+
+   * A fixed header (see HEADER) with the magic of the dictionary class, the
+     fingerprint of its hasher and the length of the state.
+   * The state, a pickle of a dict with the configuration of the table and
+     its keys and values.
+   * The arrays of the table (index tables, hashes), written contiguously
+     in the byte order of the machine that wrote them, in the order given by
+     the dictionary.
+
+Loading reads each array with a single readinto into an array allocated
+beforehand, so the stored hashes are used without hashing any key again.
+This is only valid if the hasher maps keys to the same hashes in the loading
+process. The builtin hash of strings is randomized per process, so the
+fingerprint, the hash of a fixed key, is compared on loading. If it differs,
+the dictionary has to rehash its keys.
+"""
+from __future__ import division
+from __future__ import print_function
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+import io, pickle, struct, sys
+
+# Magic of the dictionary class, fingerprint of the hasher and length of the
+# pickled state.
+HEADER = struct.Struct("<8sQQ")
+
+FINGERPRINT_KEY = ("PyDict", 1)
+
+# Pickles of this protocol can be read by Python 2 and 3.
+PICKLE_PROTOCOL = 2
+
+def fingerprint(hasher):
+    """
+    Return the hash of a fixed key. Two hashers with the same fingerprint
+    are assumed to map all keys to the same hashes.
+    """
+    return hasher(FINGERPRINT_KEY)
+
+def dump(fp, magic, hasher, state, arrays):
+    """
+    Write a snapshot to the binary file fp. The state must be picklable.
+    """
+    state = dict(state, byteorder=sys.byteorder,
+                 arrays=[(a.typecode, len(a)) for a in arrays])
+    data = pickle.dumps(state, PICKLE_PROTOCOL)
+    fp.write(HEADER.pack(magic, fingerprint(hasher), len(data)))
+    fp.write(data)
+    for a in arrays:
+        a.tofile(fp)
+
+def load(fp, magic):
+    """
+    Read the header and the state of a snapshot from the binary file fp.
+    Return the state and whether the stored hashes can be used. The arrays
+    are read next, with read_array. Raise ValueError if the snapshot is
+    truncated or corrupt.
+    """
+    header = fp.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("truncated snapshot")
+    found, stored, length = HEADER.unpack(header)
+    if found != magic:
+        raise ValueError("not a snapshot of this dictionary class")
+    data = fp.read(length)
+    if len(data) < length:
+        raise ValueError("truncated snapshot")
+    try:
+        state = pickle.loads(data)
+        hasher = state["config"]["hasher"]
+    except Exception:
+        # A damaged pickle can fail in many ways (UnpicklingError,
+        # EOFError, KeyError...), all of them meaning the same thing here.
+        raise ValueError("corrupt snapshot")
+    return state, fingerprint(hasher) == stored
+
+def read_array(fp, a, state):
+    """
+    Fill the array a from fp. It must have the type and length it had when
+    the snapshot was written.
+    """
+    nbytes = len(a)*a.itemsize
+    if fp.readinto(a) != nbytes:
+        raise ValueError("truncated snapshot")
+    if state["byteorder"] != sys.byteorder:
+        a.byteswap()
+
+def from_bytes(cls, data):
+    """
+    Load a dictionary of class cls from a snapshot in a bytes object. This
+    is used for unpickling.
+    """
+    return cls.load(io.BytesIO(data))
+
+def to_bytes(d):
+    """
+    Return a snapshot of a dictionary as a bytes object.
+    """
+    fp = io.BytesIO()
+    d.dump(fp)
+    return fp.getvalue()
@@ -0,0 +1,74 @@
+"""
+Counters of the lookups and rebuilds of one hash table, used by the stats
+methods of the dictionaries in dictionary_oa, dictionary_chain and
+dictionary_cuckoo.
+
+Counting costs nothing until it is enabled. enable_stats stores counting
+versions of the lookup and resize methods on the instance, where they hide
+the methods of the class, and disable_stats removes them again.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import object
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+def histogram(values):
+    """
+    Return a dict mapping each value to the number of times it occurs.
+    """
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+class TableStats(object):
+    """
+    The counters of one table.
+
+    Attributes:
+       * lookups - The number of lookups.
+       * probes - The total number of slots or chain entries looked at.
+       * max_probes - The most looked at by one lookup.
+       * probe_histogram - Maps the number looked at to the number of
+         lookups that looked at that many.
+       * rebuilds - Maps the kind of a rebuild (resize, compact) to the
+         number of rebuilds, their total and their longest duration in
+         seconds.
+    """
+
+    def __init__(self):
+        self.lookups = 0
+        self.probes = 0
+        self.max_probes = 0
+        self.probe_histogram = {}
+        self.rebuilds = {}
+
+    def record_lookup(self, probes):
+        self.lookups += 1
+        self.probes += probes
+        if probes > self.max_probes:
+            self.max_probes = probes
+        self.probe_histogram[probes] = self.probe_histogram.get(probes, 0) + 1
+
+    def record_rebuild(self, kind, seconds):
+        count, total, longest = self.rebuilds.get(kind, (0, 0.0, 0.0))
+        self.rebuilds[kind] = (count + 1, total + seconds,
+                               max(longest, seconds))
+
+    def snapshot(self):
+        """
+        Return the counters as a dict of plain values.
+        """
+        return {
+            'lookups': self.lookups,
+            'probes': self.probes,
+            'probes_per_lookup': self.probes/self.lookups if self.lookups
+            else 0.0,
+            'max_probes': self.max_probes,
+            'probe_histogram': dict(self.probe_histogram),
+            'rebuilds': dict((kind, {'count': count, 'seconds': total,
+                                     'max_seconds': longest})
+                             for kind, (count, total, longest)
+                             in self.rebuilds.items()),
+            }
@@ -0,0 +1,158 @@
+"""
+Randomized differential testing against the builtin dict: the same random
+operations are applied to a dictionary and to a dict, and every result and,
+now and then, the whole contents are compared.
+"""
+from __future__ import division
+import random
+
+def int_key(rng):
+    return rng.randrange(400)
+
+def str_key(rng):
+    return 'key{0}'.format(rng.randrange(400))
+
+def tuple_key(rng):
+    return (rng.randrange(20), str_key(rng)[:5])
+
+def colliding_key(rng):
+    # Multiples of 2**61 - 1 all have the builtin hash 0, so their full
+    # hashes are equal under every seed of hashing.MixHasher.
+    return rng.randrange(40)*(2**61 - 1)
+
+KEYS = {
+    'int': int_key,
+    'str': str_key,
+    'tuple': tuple_key,
+    'colliding': colliding_key,
+    }
+
+MASK64 = (1 << 64) - 1
+
+def unmix64(h):
+    """
+    The inverse of hashing.fmix64.
+    """
+    for c in (0xc4ceb9fe1a85ec53, 0xff51afd7ed558ccd):
+        h ^= h >> 33
+        h = (h*pow(c, -1, 1 << 64)) & MASK64
+    return h ^ (h >> 33)
+
+def flooding_keys(seed, n):
+    """
+    Return n int keys whose full hashes under MixHasher(seed) differ only in
+    the top 16 bits, so they share a slot, a stride and a bucket in any
+    table of up to 2**16 slots. Under another seed, they spread out.
+    """
+    keys = []
+    j = 1
+    while len(keys) < n:
+        key = unmix64(j << 48) ^ seed
+        # Smaller ints are their own builtin hash.
+        if key < 2**61 - 1:
+            keys.append(key)
+        j += 1
+    return keys
+
+# The probability of an insertion in each phase: the table grows, then
+# insertions and deletions balance, then it shrinks.
+PHASES = (0.75, 0.45, 0.15)
+
+def compare(d, ref, ordered = False):
+    assert len(d) == len(ref)
+    assert dict(d.items()) == ref
+    keys = list(d)
+    assert len(keys) == len(ref)
+    if ordered:
+        assert keys == list(ref)
+    else:
+        assert set(keys) == set(ref)
+    for key, value in ref.items():
+        assert key in d
+        assert d[key] == value
+
+def run_batch(d, ref, make_key, rng):
+    """
+    Apply one of the batch operations set_many, get_many and delete_many
+    with a few random keys.
+    """
+    keys = [make_key(rng) for i in range(rng.randrange(1, 20))]
+    op = rng.random()
+    if op < 0.4:
+        values = [rng.randrange(1, 1000) for key in keys]
+        d.set_many(keys, values)
+        ref.update(zip(keys, values))
+    elif op < 0.7:
+        assert d.get_many(keys, -1) == [ref.get(key, -1) for key in keys]
+    else:
+        removed = set(keys) & set(ref)
+        assert d.delete_many(keys) == len(removed)
+        for key in removed:
+            del ref[key]
+
+def run(d, make_key, seed = 0, steps = 1500, ordered = False, check = None,
+        extra = None, batch = False):
+    """
+    Apply steps random operations in each phase to the dictionary d and to
+    a dict, with keys from make_key. Compare the contents every 50 steps and
+    at the end, and call check(d) with them to test invariants of d. If
+    extra is given, extra(d, rng) is called now and then, for operations
+    that do not change the contents (compaction, for example). If batch is
+    True, the batch operations of d are tested as well.
+    """
+    rng = random.Random(seed)
+    ref = {}
+    for insert_ratio in PHASES:
+        for step in range(steps):
+            key = make_key(rng)
+            op = rng.random()
+            if op < insert_ratio:
+                value = rng.randrange(1, 1000)
+                d[key] = value
+                ref[key] = value
+            elif op < insert_ratio + 0.15:
+                if key in ref:
+                    del d[key]
+                    del ref[key]
+                else:
+                    try:
+                        del d[key]
+                    except KeyError:
+                        pass
+                    else:
+                        raise AssertionError("deleted missing key")
+            elif op < insert_ratio + 0.2:
+                assert d.pop(key, -1) == ref.pop(key, -1)
+            elif op < insert_ratio + 0.22:
+                if ref:
+                    key, value = d.popitem()
+                    assert ref.pop(key) == value
+            elif op < insert_ratio + 0.25:
+                value = rng.randrange(1, 1000)
+                assert d.setdefault(key, value) == ref.setdefault(key, value)
+            elif batch and op < insert_ratio + 0.28:
+                run_batch(d, ref, make_key, rng)
+            elif op < 0.999:
+                assert d.get(key, -1) == ref.get(key, -1)
+                assert (key in d) == (key in ref)
+            else:
+                d.clear()
+                ref.clear()
+            if extra is not None and rng.random() < 0.01:
+                extra(d, rng)
+            if step % 50 == 0:
+                compare(d, ref, ordered)
+                if check is not None:
+                    check(d)
+        compare(d, ref, ordered)
+        if check is not None:
+            check(d)
+    # Empty the table, which shrinks it, and fill it again.
+    while ref:
+        key, value = d.popitem()
+        assert ref.pop(key) == value
+    compare(d, ref, ordered)
+    pairs = [(make_key(rng), i + 1) for i in range(200)]
+    d.update(pairs)
+    ref.update(pairs)
+    compare(d, ref, ordered)
@@ -0,0 +1,240 @@
+from __future__ import division
+import random
+from collections import OrderedDict
+import pytest
+
+from dictionary_cache import CacheDict, POLICIES, memoize
+from differential import KEYS, run
+
+class FakeTimer(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.parametrize('keys', sorted(KEYS))
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_unbounded_matches_dict(policy, keys):
+    run(CacheDict(policy=policy, size=8), KEYS[keys], ordered=True,
+        steps=500)
+
+def test_lru_matches_model():
+    d = CacheDict(max_entries=20, size=8)
+    ref = OrderedDict()
+    rng = random.Random(0)
+    for step in range(5000):
+        key = rng.randrange(60)
+        op = rng.random()
+        if op < 0.4:
+            d[key] = ref[key] = step + 1
+            ref.move_to_end(key)
+            if len(ref) > 20:
+                ref.popitem(last=False)
+        elif op < 0.5:
+            assert d.pop(key, None) == ref.pop(key, None)
+        else:
+            assert d.get(key, None) == ref.get(key, None)
+            if key in ref:
+                ref.move_to_end(key)
+        assert dict(d.items()) == dict(ref)
+    # The least recently used entry is evicted next.
+    while ref:
+        assert d.popitem() == ref.popitem(last=False)
+
+def fill(d, keys):
+    for key in keys:
+        d[key] = key.upper()
+
+def test_lru_order():
+    d = CacheDict(max_entries=3, policy='lru')
+    fill(d, 'abc')
+    d['a']
+    d['d'] = 'D'
+    assert sorted(d) == ['a', 'c', 'd']
+    d['c'] = 'C'
+    d['e'] = 'E'
+    assert sorted(d) == ['c', 'd', 'e']
+
+def test_lfu_order():
+    d = CacheDict(max_entries=3, policy='lfu')
+    fill(d, 'abc')
+    d['a'], d['a'], d['b']
+    d['d'] = 'D'
+    assert sorted(d) == ['a', 'b', 'd']
+    # Among the least used entries, the least recently used goes first.
+    d['d']
+    d['e'] = 'E'
+    assert sorted(d) == ['a', 'd', 'e']
+    assert d.popitem() == ('e', 'E')
+
+def test_clock_order():
+    d = CacheDict(max_entries=3, policy='clock')
+    fill(d, 'abc')
+    # All reference bits are set, so the hand clears them all and comes
+    # back to the first entry.
+    d['d'] = 'D'
+    assert sorted(d) == ['b', 'c', 'd']
+    d['b']
+    d['e'] = 'E'
+    assert sorted(d) == ['b', 'd', 'e']
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_ttl(policy):
+    timer = FakeTimer()
+    d = CacheDict(ttl=10, timer=timer, policy=policy)
+    d['a'] = 1
+    timer.now = 5
+    d['b'] = 2
+    assert d['a'] == 1
+    timer.now = 10
+    assert 'a' not in d
+    assert d.get('a', None) is None
+    assert d['b'] == 2
+    # Setting a key again restarts its ttl.
+    d['b'] = 3
+    timer.now = 14.5
+    assert d['b'] == 3
+    d['c'] = 4
+    timer.now = 30
+    assert d.expire() == 2
+    assert len(d) == 0
+    info = d.info()
+    assert info.expirations == 3
+    assert (info.hits, info.misses) == (3, 1)
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_pop_honours_ttl(policy):
+    timer = FakeTimer()
+    d = CacheDict(ttl=10, timer=timer, policy=policy)
+    d['a'] = 1
+    d['b'] = 2
+    timer.now = 5
+    d['c'] = 3
+    assert d.pop('a') == 1
+    timer.now = 10
+    # b expired, so it is gone as if it had never been set.
+    assert d.pop('b', None) is None
+    with pytest.raises(KeyError):
+        d.pop('b')
+    assert d.pop('c') == 3
+    assert len(d) == 0
+    info = d.info()
+    assert info.expirations == 1
+    assert (info.hits, info.misses) == (0, 0)
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_max_bytes(policy):
+    d = CacheDict(max_bytes=10, sizeof=lambda key, value: value,
+                  policy=policy)
+    for key, value in zip('abcd', (3, 3, 3, 3)):
+        d[key] = value
+    assert len(d) == 3 and d.nbytes == 9
+    d['e'] = 7
+    assert d.nbytes <= 10 and d['e'] == 7
+    # An entry larger than the limit does not fit on its own.
+    d['f'] = 11
+    assert 'f' not in d and d.nbytes <= 10
+    assert d.nbytes == sum(d.values())
+
+def test_info_counters():
+    d = CacheDict(max_entries=2)
+    d['a'] = 1
+    d['b'] = 2
+    d['a'], d.get('b'), d.get('x'), d.setdefault('y', 3)
+    # y evicted a, the least recently used entry.
+    assert d.get_many(['b', 'z']) == [2, 0]
+    info = d.info()
+    assert info.hits == 3
+    assert info.misses == 3
+    assert info.evictions == 1
+    assert info.currsize == 2
+    assert (info.max_entries, info.max_bytes) == (2, None)
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        CacheDict(max_entries=0)
+    with pytest.raises(ValueError):
+        CacheDict(max_bytes=0)
+    with pytest.raises(ValueError):
+        CacheDict(ttl=0)
+
+@pytest.mark.parametrize('policy', sorted(POLICIES))
+def test_memoize_hits(policy):
+    calls = []
+
+    @memoize(maxsize=4, policy=policy)
+    def square(x):
+        """Return x*x."""
+        calls.append(x)
+        return x*x
+
+    assert [square(x) for x in (1, 2, 1, 2, 3)] == [1, 4, 1, 4, 9]
+    assert calls == [1, 2, 3]
+    info = square.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 3, 3)
+    for x in range(10):
+        square(x)
+    assert len(square.cache) == 4
+    assert square.__name__ == 'square' and square.__doc__ == 'Return x*x.'
+    square.cache_clear()
+    assert square.cache_info().hits == 0 and len(square.cache) == 0
+    assert square.func(5) == 25
+
+def test_memoize_keyword_arguments():
+    calls = []
+
+    @memoize(maxsize=None)
+    def f(a, b=0, c=0):
+        calls.append((a, b, c))
+        return None if a < 0 else a + b + c
+
+    assert f(1, b=2, c=3) == f(1, c=3, b=2) == 6
+    assert f(1, 2, 3) == 6
+    assert f(1, b=2) == 3
+    # Keywords are keyed apart from positional arguments.
+    assert calls == [(1, 2, 3), (1, 2, 3), (1, 2, 0)]
+    # A result of None is cached too.
+    assert f(-1) is None and f(-1) is None
+    assert calls[-1] == (-1, 0, 0) and len(calls) == 4
+
+def test_memoize_ttl():
+    timer = FakeTimer()
+    calls = []
+
+    @memoize(ttl=10)
+    def f(x):
+        calls.append(x)
+        return x
+    f.cache.timer = timer
+    f(1)
+    timer.now = 9
+    f(1)
+    timer.now = 10
+    f(1)
+    assert calls == [1, 1]
+    assert f.cache_info().expirations == 1
+
+def test_memoize_maxsize_zero_caches_nothing():
+    calls = []
+
+    @memoize(maxsize=0)
+    def f(x):
+        calls.append(x)
+        return x + 1
+
+    assert [f(1), f(1), f(2)] == [2, 2, 3]
+    assert calls == [1, 1, 2]
+    info = f.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (0, 3, 0)
+    assert info.max_entries == 0
+
+def test_memoize_wraps():
+    def f(x):
+        """Doc."""
+        return x
+    g = memoize()(f)
+    assert g.__wrapped__ is f
+    assert (g.__name__, g.__doc__) == ('f', 'Doc.')
+    assert memoize(maxsize=0)(f).__wrapped__ is f
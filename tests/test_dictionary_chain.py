@@ -0,0 +1,165 @@
+from __future__ import division
+import io
+import pytest
+
+from dictionary_chain import Dict, BUCKETS, BLIMPY_INSTALLED, SortedBucket
+from differential import KEYS, run, flooding_keys
+from hashing import MixHasher
+
+CONFIGS = {
+    'default': {},
+    'growing': dict(size=8),
+    'incremental': dict(size=8, incremental=True, rehash_steps=1),
+    'long_chains': dict(size=8, max_load=4, min_load=1/2),
+    'fixed': dict(size=64, resizing=False),
+    }
+
+STORES = sorted(name for name in BUCKETS
+                if name != 'linkedlist' or BLIMPY_INSTALLED)
+
+def check(d):
+    """
+    Every entry is in the bucket its full hash selects, and the chains hold
+    used entries in all.
+    """
+    total = 0
+    for store in (d.buckets, d.new_buckets):
+        if store is None:
+            continue
+        mask = store.size - 1
+        for i in range(store.size):
+            handles = list(store.handles(i))
+            assert len(handles) == store.chain_length(i)
+            for handle in handles:
+                assert store.hash(handle) & mask == i
+                assert store.hash(handle) == d.hasher(store.key(handle))
+            total += len(handles)
+    assert total == d.used
+
+@pytest.mark.parametrize('keys', sorted(KEYS))
+@pytest.mark.parametrize('config', sorted(CONFIGS))
+@pytest.mark.parametrize('buckets', STORES)
+def test_matches_dict(buckets, config, keys):
+    d = Dict(buckets=buckets, **CONFIGS[config])
+    run(d, KEYS[keys], check=check, batch=True)
+
+@pytest.mark.parametrize('buckets', STORES)
+def test_incremental_rehash_finishes(buckets):
+    d = Dict(size=8, buckets=buckets, incremental=True, rehash_steps=1)
+    ref = {}
+    for i in range(300):
+        d[i] = ref[i] = i + 1
+        # Entries are found whether or not their bucket has been moved.
+        assert all(d[k] == v for k, v in ref.items())
+        check(d)
+    while d.new_buckets is not None:
+        d[-1] = 1
+        del d[-1]
+    check(d)
+    assert dict(d.items()) == ref
+
+def test_arena_reuses_free_nodes():
+    d = Dict(size=8, buckets='arena')
+    for i in range(100):
+        d[i] = i + 1
+    for i in range(0, 100, 2):
+        del d[i]
+    assert len(d.buckets.keys) == 100
+    for i in range(100, 150):
+        d[i] = i + 1
+    # The 50 removed nodes are taken from the free list.
+    assert len(d.buckets.keys) == 100
+    assert d.buckets.free == -1
+    check(d)
+    assert sorted(d.keys()) == list(range(1, 100, 2)) + list(range(100, 150))
+
+@pytest.mark.parametrize('buckets', STORES)
+def test_missing_keys_leave_chains_alone(buckets):
+    d = Dict(size=8, buckets=buckets)
+    d[1] = 2
+    for i in range(2, 50):
+        assert i not in d
+        assert d.get(i, None) is None
+    assert sum(d.buckets.chain_length(i) for i in range(d.size)) == 1
+
+def test_chain_lengths_stay_between_load_factors():
+    d = Dict(size=8, max_load=2, min_load=1/2)
+    for i in range(1000):
+        d[i] = i + 1
+        assert d.used <= d.max_load*d.bucket_count()
+    assert d.rehash_progress() is None
+    histogram = d.chain_histogram()
+    assert sum(histogram) == d.bucket_count()
+    assert sum(k*n for k, n in enumerate(histogram)) == d.used
+    for i in range(990):
+        del d[i]
+    # Shrinking sizes the table for growth*used entries again.
+    assert d.bucket_count() <= 2*d.growth*d.used
+    check(d)
+
+def test_update_like_dict():
+    d = Dict()
+    ref = {}
+    d.update({1: 2, 3: 4})
+    ref.update({1: 2, 3: 4})
+    d.update([(3, 5), (6, 7)], eight=8)
+    ref.update([(3, 5), (6, 7)], eight=8)
+    assert dict(d.items()) == ref
+    with pytest.raises(ValueError):
+        d.update([(1, 2, 3)])
+    with pytest.raises(ValueError):
+        d.set_many([1, 2], [3])
+    assert Dict.fromkeys('ab', 1) == {'a': 1, 'b': 1}
+
+@pytest.mark.parametrize('buckets', STORES)
+def test_reseeds_when_flooded(buckets):
+    seed = 12345
+    keys = flooding_keys(seed, 200)
+    d = Dict(hasher=MixHasher(seed), buckets=buckets)
+    for i, key in enumerate(keys):
+        d[key] = i + 1
+    assert 1 <= d.reseeds <= 2
+    assert type(d.hasher) is MixHasher and d.hasher.seed != seed
+    assert all(d[key] == i + 1 for i, key in enumerate(keys))
+    check(d)
+
+def test_long_chains_become_sorted():
+    keys = [i*(2**61 - 1) for i in range(100)]
+    d = Dict(buckets='tree')
+    for key in keys:
+        d[key] = 1
+    i = d.hasher(keys[0]) & (d.size - 1)
+    assert type(d.buckets.table[i]) is SortedBucket
+    assert d.reseeds <= 3
+    for key in keys[:95]:
+        del d[key]
+    assert type(d.buckets.table[i]) is list
+    assert sorted(d) == keys[95:]
+    check(d)
+
+def test_tables_get_random_seeds():
+    assert Dict().hasher.seed != Dict().hasher.seed
+
+def test_popitem_resumes_where_it_stopped():
+    d = Dict(size=1024, resizing=False)
+    for i in range(2000):
+        d[i] = i + 1
+    positions = []
+    while d:
+        d.popitem()
+        positions.append(d.popitem_pos)
+    # Every call starts at the bucket of the last one, so the buckets are
+    # emptied in order.
+    assert positions == sorted(positions)
+    assert len(d) == 0
+
+def test_load_restores_chain_limit():
+    d = Dict(size=8)
+    for i in range(5000):
+        d[i] = i + 1
+    fp = io.BytesIO()
+    d.dump(fp)
+    fp.seek(0)
+    copy = Dict.load(fp)
+    assert copy.size == d.size
+    assert copy.chain_limit == d.chain_limit
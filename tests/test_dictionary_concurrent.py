@@ -0,0 +1,125 @@
+from __future__ import division
+import random, sys, threading
+import pytest
+
+from dictionary_concurrent import ConcurrentDict
+
+STORES = {
+    'list': {},
+    'arena_incremental': dict(buckets='arena', incremental=True,
+                              rehash_steps=1),
+    }
+
+@pytest.fixture(autouse=True)
+def switch_often():
+    # Switch threads often, so reads overlap writes in progress.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+def run_threads(targets):
+    errors = []
+    def wrap(target):
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                errors.append(e)
+        return run
+    threads = [threading.Thread(target=wrap(t)) for t in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+
+@pytest.mark.parametrize('store', sorted(STORES))
+def test_writers_and_readers(store):
+    d = ConcurrentDict(size=8, stripes=2, **STORES[store])
+    writers, keys_per_writer = 4, 100
+    finished = []
+    expected = {}
+
+    def writer(w):
+        # Each writer owns its keys, so the final contents are known. The
+        # value of a key names the key, so readers can check what they get.
+        keys = list(range(w*keys_per_writer, (w + 1)*keys_per_writer))
+        rng = random.Random(w)
+        final = {}
+        for step in range(3000):
+            key = rng.choice(keys)
+            if rng.random() < 0.6:
+                final[key] = (key, step)
+                d[key] = final[key]
+            else:
+                assert d.pop(key, None) == final.pop(key, None)
+        expected.update(final)
+        finished.append(w)
+
+    def deleter():
+        # One key is inserted and deleted over and over while it is read.
+        for step in range(3000):
+            d['hot'] = ('hot', step)
+            del d['hot']
+        finished.append('hot')
+
+    def reader(r):
+        rng = random.Random(100 + r)
+        while len(finished) < writers + 1:
+            key = rng.randrange(writers*keys_per_writer)
+            value = d.get(key, None)
+            assert value is None or value[0] == key
+            value = d.get('hot', None)
+            assert value is None or value[0] == 'hot'
+            assert ('hot' in d) in (True, False)
+
+    run_threads([lambda w=w: writer(w) for w in range(writers)] +
+                [deleter] + [lambda r=r: reader(r) for r in range(3)])
+    assert 'hot' not in d
+    assert dict(d.items()) == expected
+    assert len(d) == len(expected)
+    for key, value in expected.items():
+        assert d[key] == value
+    for segment in d.segments:
+        assert sum(1 for key in segment) == segment.used
+
+@pytest.mark.parametrize('store', sorted(STORES))
+def test_compute_if_absent_calls_once(store):
+    d = ConcurrentDict(size=16, stripes=4, **STORES[store])
+    calls = []
+    lock = threading.Lock()
+
+    def compute(key):
+        with lock:
+            calls.append(key)
+        return key*2
+
+    def worker():
+        for key in range(500):
+            assert d.compute_if_absent(key, compute) == key*2
+            assert d.setdefault(key, -1) == key*2
+
+    run_threads([worker]*4)
+    assert sorted(calls) == list(range(500))
+    assert len(d) == 500
+
+def test_single_thread_operations():
+    d = ConcurrentDict(stripes=3)
+    assert d.stripes == 4
+    d.update({1: 2}, three=4)
+    assert d[1] == 2 and d['three'] == 4
+    assert d.pop(1) == 2
+    with pytest.raises(KeyError):
+        d.pop(1)
+    with pytest.raises(KeyError):
+        del d[1]
+    assert sorted(d.keys()) == ['three'] and list(d.values()) == [4]
+    d.clear()
+    assert len(d) == 0 and 'three' not in d
+    with pytest.raises(ValueError):
+        ConcurrentDict(stripes=0)
+    one = ConcurrentDict(stripes=1)
+    one[5] = 6
+    assert one[5] == 6
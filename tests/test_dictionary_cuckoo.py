@@ -0,0 +1,95 @@
+import pytest
+
+from dictionary_cuckoo import CuckooDict
+from differential import KEYS, run, flooding_keys
+from hashing import MixHasher
+
+CONFIGS = {
+    'default': {},
+    'growing': dict(size=8),
+    'one_slot': dict(size=8, bucket_slots=1, max_load=0.4),
+    'two_slots': dict(size=8, bucket_slots=2, max_load=0.8),
+    'no_stash': dict(size=8, stash_size=0),
+    'few_kicks': dict(size=8, max_kicks=2),
+    }
+
+def check(d):
+    """
+    Every entry is in one of its two buckets or in the stash, with its full
+    hash, and the stash is within its limit.
+    """
+    slots = d.bucket_slots
+    used = 0
+    for n, key in enumerate(d.slot_keys):
+        if key is None:
+            continue
+        key_hash = d.hasher(key)
+        assert d.hashes[n] == key_hash
+        assert n//slots in (key_hash & (d.size - 1), key_hash >> d.shift)
+        used += 1
+    assert d.stash_hashes == [d.hasher(key) for key in d.stash_keys]
+    assert used + len(d.stash_keys) == d.used
+    assert len(d.stash_keys) <= d.stash_limit
+
+@pytest.mark.parametrize('keys', sorted(KEYS))
+@pytest.mark.parametrize('config', sorted(CONFIGS))
+def test_matches_dict(config, keys):
+    d = CuckooDict(**CONFIGS[config])
+    run(d, KEYS[keys], check=check)
+
+def test_fills_to_max_load():
+    d = CuckooDict(size=1024, max_load=0.9)
+    size = d.size
+    for i in range(int(0.9*size*d.bucket_slots) - 1):
+        d[i] = i + 1
+    # Four slots per bucket get a table to 90% without growing it.
+    assert d.size == size
+    assert len(d.stash_keys) <= d.stash_size
+    check(d)
+
+def test_flooded_keys_are_rehashed():
+    seed = 99
+    keys = flooding_keys(seed, 100)
+    d = CuckooDict(hasher=MixHasher(seed))
+    for i, key in enumerate(keys):
+        d[key] = i + 1
+    # All the keys share both buckets under the first seed.
+    assert d.rehashes >= 1 and d.hasher.seed != seed
+    assert all(d[key] == i + 1 for i, key in enumerate(keys))
+    check(d)
+
+def test_new_key_survives_reseeding_growth(monkeypatch):
+    # Make every rehash try a new seed, as one does when the grown table
+    # still overflows the stash.
+    rehash = CuckooDict._rehash
+    monkeypatch.setattr(CuckooDict, '_rehash',
+                        lambda self, size, reseed=False:
+                        rehash(self, size, True))
+    d = CuckooDict(size=8)
+    for i in range(200):
+        d[i] = i + 1
+        assert d[i] == i + 1
+    assert all(d[i] == i + 1 for i in range(200))
+    check(d)
+
+def test_colliding_keys_back_off():
+    d = CuckooDict()
+    keys = [i*(2**61 - 1) for i in range(200)]
+    for i, key in enumerate(keys):
+        d[key] = i + 1
+    # The stash limit doubles, so the table is rehashed a few times, not
+    # once per key.
+    assert d.rehashes < 20
+    assert all(d[key] == i + 1 for i, key in enumerate(keys))
+    check(d)
+
+def test_stats_count_slots():
+    d = CuckooDict()
+    d.enable_stats()
+    for i in range(1000):
+        d[i] = i + 1
+    counters = d.stats()['counters']
+    assert counters['lookups'] == 1000
+    assert counters['max_probes'] <= 2*d.bucket_slots + len(d.stash_keys)
+    d.disable_stats()
+    assert d.stats()['counters'] is None
@@ -0,0 +1,144 @@
+from __future__ import division
+import random
+import pytest
+
+from dictionary_mmap import MmapDict, HEADER
+
+def check(d):
+    """
+    The counts in the header match the slots and entries of the table.
+    """
+    indices = [d._index(i) for i in range(d.size)]
+    live = [ix for ix in indices if ix >= 0]
+    assert len(live) == len(set(live)) == d.used
+    assert d.filled == d.used + indices.count(-2)
+    assert d.entries <= d.size
+
+def test_matches_dict(tmp_path):
+    path = str(tmp_path / 'd')
+    d = MmapDict(path)
+    rng = random.Random(0)
+    ref = {}
+    for step in range(3000):
+        key = rng.choice([rng.randrange(300), 'key{0}'.format(
+                    rng.randrange(300)), (rng.randrange(9), 'x')])
+        op = rng.random()
+        if op < 0.5:
+            value = [rng.randrange(1000)]
+            d[key] = ref[key] = value
+        elif op < 0.8:
+            if key in ref:
+                del d[key]
+                del ref[key]
+            else:
+                with pytest.raises(KeyError):
+                    del d[key]
+        else:
+            assert d.get(key, None) == ref.get(key, None)
+            assert (key in d) == (key in ref)
+        if step % 100 == 0:
+            check(d)
+            assert dict(d.items()) == ref
+    assert list(d.keys()) == list(ref)
+    assert len(d) == len(ref)
+    d.close()
+
+def test_reopen(tmp_path):
+    path = str(tmp_path / 'd')
+    ref = dict(('key{0}'.format(i), i) for i in range(500))
+    with MmapDict(path, seed=3) as d:
+        d.update(ref)
+        del d['key7']
+        del ref['key7']
+    with MmapDict(path) as d:
+        assert d.seed == 3
+        assert dict(d.items()) == ref
+        d['new'] = 1
+    with MmapDict(path, readonly=True) as d:
+        assert d['new'] == 1
+        assert len(d) == len(ref) + 1
+        assert list(d.keys())[:3] == ['key0', 'key1', 'key2']
+        check(d)
+
+def test_readonly_writes_raise(tmp_path):
+    path = str(tmp_path / 'd')
+    with MmapDict(path) as d:
+        d[1] = 2
+    with MmapDict(path, readonly=True) as d:
+        for write in (lambda: d.__setitem__(1, 3),
+                      lambda: d.__delitem__(1), lambda: d.update({2: 3}),
+                      lambda: d.compact()):
+            with pytest.raises(IOError):
+                write()
+        assert dict(d.items()) == {1: 2}
+    with pytest.raises(IOError):
+        MmapDict(str(tmp_path / 'missing'), readonly=True)
+
+def test_rebuild_after_deletes(tmp_path):
+    path = str(tmp_path / 'd')
+    with MmapDict(path) as d:
+        for i in range(1000):
+            d[i] = i*i
+        for i in range(950):
+            del d[i]
+            assert d.filled - d.used <= d.max_dummies*d.size
+        check(d)
+        assert d.entries < 1000
+        assert dict(d.items()) == dict((i, i*i) for i in range(950, 1000))
+        d.compact()
+        assert d.filled == d.used == d.entries == 50
+    with MmapDict(path) as d:
+        assert sorted(d.keys()) == list(range(950, 1000))
+
+def test_rebuilds_leave_room_at_low_max_load(tmp_path, monkeypatch):
+    rebuilds = []
+    rebuild = MmapDict._rebuild
+    def counting_rebuild(self, newsize):
+        rebuilds.append(newsize)
+        rebuild(self, newsize)
+    monkeypatch.setattr(MmapDict, '_rebuild', counting_rebuild)
+    with MmapDict(str(tmp_path / 'd'), max_load=0.4) as d:
+        for i in range(3000):
+            d[i] = i
+        assert d.used <= d.max_load*d.size
+        check(d)
+    # Each rebuild at least doubles the table, not once per insertion.
+    assert len(rebuilds) <= 12
+    assert rebuilds == sorted(set(rebuilds))
+
+def test_readers_see_rebuilds_after_refresh(tmp_path):
+    path = str(tmp_path / 'd')
+    writer = MmapDict(path)
+    writer['a'] = 1
+    writer.flush()
+    reader = MmapDict(path, readonly=True)
+    for i in range(100):
+        writer[i] = i
+    writer.flush()
+    assert reader['a'] == 1
+    reader.refresh()
+    assert len(reader) == 101 and reader[99] == 99
+    reader.close()
+    writer.close()
+
+def test_bad_header_is_rejected(tmp_path):
+    path = str(tmp_path / 'd')
+    with MmapDict(path) as d:
+        d[1] = 2
+    with open(path, 'r+b') as f:
+        f.write(b'NOTADICT')
+    with pytest.raises(ValueError):
+        MmapDict(path)
+    other = str(tmp_path / 'e')
+    with open(other, 'wb') as f:
+        f.write(b'\0'*HEADER.size)
+    with open(other + '.heap', 'wb') as f:
+        f.write(b'PYHEAP01')
+    with pytest.raises(ValueError):
+        MmapDict(other, readonly=True)
+
+def test_bad_arguments(tmp_path):
+    with pytest.raises(ValueError):
+        MmapDict(str(tmp_path / 'd'), max_load=1)
+    with pytest.raises(ValueError):
+        MmapDict(str(tmp_path / 'd'), max_dummies=0)
@@ -0,0 +1,168 @@
+from __future__ import division
+import random
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from dictionary_numpy import Int64Dict, BytesDict
+from hashing import MixHasher
+
+def int_keys(rng, n):
+    return [rng.randrange(-500, 500) for i in range(n)]
+
+def bytes_keys(rng, n):
+    return ['k{0}'.format(rng.randrange(500)).encode('ascii')
+            for i in range(n)]
+
+TABLES = {
+    'int64': (lambda: Int64Dict(), int_keys),
+    'bytes': (lambda: BytesDict(6), bytes_keys),
+    'bytes_wide': (lambda: BytesDict(19, max_load=3/4), bytes_keys),
+    }
+
+def compare(d, ref):
+    assert len(d) == len(ref)
+    assert dict((k, int(v)) for k, v in d.items()) == ref
+    assert sorted(d.keys().tolist()) == sorted(ref)
+    assert d.used + d.dummies <= d.max_load*d.size
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_batches_match_dict(table):
+    make, make_keys = TABLES[table]
+    d = make()
+    rng = random.Random(0)
+    ref = {}
+    for step in range(300):
+        keys = make_keys(rng, rng.randrange(1, 60))
+        op = rng.random()
+        if op < 0.5:
+            values = [rng.randrange(1000) for key in keys]
+            d.set_many(keys, values)
+            # The last value of a repeated key is kept.
+            ref.update(zip(keys, values))
+        elif op < 0.75:
+            removed = set(keys) & set(ref)
+            assert d.delete_many(keys) == len(removed)
+            for key in removed:
+                del ref[key]
+        else:
+            assert d.get_many(keys, -1).tolist() == \
+                [ref.get(key, -1) for key in keys]
+            assert d.contains_many(keys).tolist() == \
+                [key in ref for key in keys]
+        if step % 20 == 0:
+            compare(d, ref)
+    compare(d, ref)
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_single_keys(table):
+    make, make_keys = TABLES[table]
+    d = make()
+    key, other = make_keys(random.Random(1), 1)[0], make_keys(
+        random.Random(2), 1)[0]
+    d[key] = 5
+    assert d[key] == 5 and key in d and len(d) == 1
+    assert other not in d
+    assert d.get(other, 7) == 7
+    with pytest.raises(KeyError):
+        d[other]
+    del d[key]
+    with pytest.raises(KeyError):
+        del d[key]
+    assert len(d) == 0
+    d[key] = 6
+    d.clear()
+    assert len(d) == 0 and key not in d
+
+def test_rebuild_clears_dummies():
+    d = Int64Dict()
+    keys = np.arange(1000)
+    d.set_many(keys, keys*2)
+    d.delete_many(keys[:900])
+    assert d.dummies == 900
+    # The next batch that does not fit rebuilds the table without them.
+    d.set_many(keys[:900] + 5000, keys[:900])
+    assert d.dummies == 0
+    assert len(d) == 1000
+    assert d.get_many(keys[900:]).tolist() == (keys[900:]*2).tolist()
+    assert d.get_many(keys[:900] + 5000).tolist() == keys[:900].tolist()
+
+def test_short_bytes_keys_are_zero_padded():
+    d = BytesDict(4)
+    d[b'ab'] = 1
+    assert b'ab\x00' in d
+    assert b'abc' not in d
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        Int64Dict(max_load=1)
+    d = Int64Dict()
+    with pytest.raises(ValueError):
+        d.set_many([1, 2], [3])
+
+def test_strided_keys():
+    d = BytesDict(8)
+    keys = np.array([b'k%d' % i for i in range(40)], 'S8')
+    d.set_many(keys[::2], np.arange(20))
+    assert d.get_many(keys[::2]).tolist() == list(range(20))
+    assert d.contains_many(keys[1::2]).tolist() == [False]*20
+    i = Int64Dict()
+    grid = np.arange(100).reshape(10, 10)
+    i.set_many(grid[:, 3], grid[:, 4])
+    assert i.get_many(grid[:, 3]).tolist() == grid[:, 4].tolist()
+
+def test_hash_is_mixhasher_for_int64():
+    d = Int64Dict(seed=5)
+    keys = np.array([0, 1, 12345, 2**40 + 3], np.int64)
+    assert d._hash(keys).tolist() == [MixHasher(5)(int(k)) for k in keys]
+
+def test_lossy_keys_are_rejected():
+    b = BytesDict(4)
+    for keys in (b'abcde', 'abcde', [b'ab', b'abcdefg']):
+        for method in (b.get_many, b.contains_many, b.delete_many):
+            with pytest.raises(ValueError):
+                method(keys)
+        with pytest.raises(ValueError):
+            b.set_many(keys, np.zeros(np.size(keys)))
+    with pytest.raises(ValueError):
+        b[b'abcde'] = 1
+    i = Int64Dict()
+    for keys in (3.7, [1, 2.5], float('nan'), 2**63, 2**64, '3',
+                 np.array([2**63], np.uint64)):
+        for method in (i.get_many, i.contains_many, i.delete_many):
+            with pytest.raises(TypeError):
+                method(keys)
+        with pytest.raises(TypeError):
+            i.set_many(keys, np.zeros(np.size(keys)))
+    with pytest.raises(TypeError):
+        i[3.7] = 1
+    # Nothing was stored on the way.
+    assert len(b) == len(i) == 0
+
+def test_keys_at_the_limits_round_trip():
+    rng = random.Random(3)
+    tables = [
+        (BytesDict(4), lambda: bytes(bytearray(
+            rng.randrange(1, 256) for j in range(rng.randrange(5))))),
+        (Int64Dict(), lambda: rng.choice(
+            [rng.randrange(-2**63, 2**63), 2**63 - 1 - rng.randrange(50),
+             -2**63 + rng.randrange(50)])),
+        ]
+    for d, make_key in tables:
+        ref = {}
+        for step in range(100):
+            keys = [make_key() for j in range(20)]
+            values = [rng.randrange(1000) for key in keys]
+            d.set_many(keys, values)
+            ref.update(zip(keys, values))
+            gone = keys[::3]
+            assert d.delete_many(gone) == len(set(gone))
+            for key in set(gone):
+                del ref[key]
+            assert d.get_many(keys, -1).tolist() == \
+                [ref.get(key, -1) for key in keys]
+        assert dict((k, int(v)) for k, v in d.items()) == ref
+    # Integral floats are the same keys as the integers.
+    i = Int64Dict()
+    i.set_many([1.0, 2.0], [3, 4])
+    assert i.get_many([1, 2]).tolist() == [3, 4]
@@ -0,0 +1,223 @@
+from __future__ import division
+import pytest
+
+from dictionary_oa import Dict, PROBING, DUMMY
+from differential import KEYS, run, flooding_keys
+from hashing import FNVHasher, MixHasher
+
+CONFIGS = {
+    'default': {},
+    'growing': dict(size=8),
+    'incremental': dict(size=8, incremental=True, resize_steps=1),
+    'tombstones': dict(size=8, max_dummies=1/20),
+    'fixed': dict(size=1024, resizing=False),
+    'fnv': dict(hasher=FNVHasher(seed=7)),
+    }
+
+def check(d):
+    """
+    The counts of the index table match its slots, and (unless it is being
+    moved) every used slot holds a live entry with its full hash.
+    """
+    if d.old_indices is not None:
+        return
+    indices = d.indices.tolist()
+    live = [ix for ix in indices if ix >= 0]
+    assert len(live) == len(set(live)) == d.used
+    assert all(d.entry_values[ix] is not None for ix in live)
+    assert all(d.hashes[ix] == d.hasher(d.entry_keys[ix]) for ix in live)
+    assert len(indices) == d.size
+    assert indices.count(DUMMY) == d.dummies
+    assert d.filled == d.used + d.dummies
+    if d.probing.robin_hood:
+        # Deletion shifts entries back instead of leaving DUMMY slots.
+        assert DUMMY not in indices
+
+def compact(d, rng):
+    d.compact()
+
+@pytest.mark.parametrize('keys', sorted(KEYS))
+@pytest.mark.parametrize('config', sorted(CONFIGS))
+@pytest.mark.parametrize('probing', sorted(PROBING))
+def test_matches_dict(probing, config, keys):
+    d = Dict(probing=probing, **CONFIGS[config])
+    run(d, KEYS[keys], ordered=True, check=check, extra=compact,
+        batch=True)
+
+def test_load_factors():
+    d = Dict(size=8)
+    for i in range(100):
+        d[i] = i + 1
+        assert d.filled < d.max_load*d.size
+    for i in range(95):
+        del d[i]
+    assert d.size < 100
+    assert d.used >= d.min_load*d.size or d.size == d.minsize
+    check(d)
+
+@pytest.mark.parametrize('probing', sorted(PROBING))
+def test_fixed_size_fills_up(probing):
+    # Every probe sequence visits every slot, so the table fills up
+    # completely before it refuses an insertion.
+    d = Dict(size=16, resizing=False, probing=probing)
+    keys = ['key{0}'.format(i) for i in range(16)]
+    for i, key in enumerate(keys):
+        d[key] = i + 1
+    assert d.size == 16
+    with pytest.raises(RuntimeError):
+        d['key16'] = 17
+    assert sorted(d.keys()) == sorted(keys)
+    assert all(d[key] == i + 1 for i, key in enumerate(keys))
+    check(d)
+
+def test_bad_load_factors():
+    with pytest.raises(ValueError):
+        Dict(max_load=1)
+    with pytest.raises(ValueError):
+        Dict(min_load=1/2, max_load=1/2)
+    with pytest.raises(ValueError):
+        Dict(growth=1)
+
+class CountingHasher(MixHasher):
+
+    def __init__(self, seed = 0):
+        MixHasher.__init__(self, seed)
+        self.calls = 0
+
+    def __call__(self, key):
+        self.calls += 1
+        return MixHasher.__call__(self, key)
+
+@pytest.mark.parametrize('probing', sorted(PROBING))
+def test_keys_are_hashed_once(probing):
+    hasher = CountingHasher()
+    d = Dict(size=8, probing=probing, hasher=hasher)
+    # Resizing reuses the stored hashes.
+    for i in range(100):
+        d[i] = i + 1
+    assert hasher.calls == 100
+    for operation in (lambda: d[5], lambda: 6 in d, lambda: d.get(-1),
+                      lambda: d.pop(7), lambda: d.setdefault(8, 0),
+                      lambda: d.setdefault(-2, 1)):
+        hasher.calls = 0
+        operation()
+        assert hasher.calls == 1
+
+@pytest.mark.parametrize('probing', sorted(PROBING))
+def test_incremental_resize_finishes(probing):
+    d = Dict(size=8, probing=probing, incremental=True, resize_steps=1)
+    ref = {}
+    for i in range(300):
+        d[i] = ref[i] = i + 1
+        # Entries are found whether or not their slot has been moved.
+        assert all(d[k] == v for k, v in ref.items())
+    while d.old_indices is not None:
+        0 in d
+    check(d)
+
+def test_compaction_clears_dummies():
+    d = Dict(size=1024, resizing=False, probing='linear', max_dummies=1)
+    for i in range(500):
+        d[i] = i + 1
+    for i in range(0, 500, 2):
+        del d[i]
+    assert d.dummies == 250
+    d.compact()
+    assert d.dummies == 0
+    assert len(d.entry_keys) == d.used == 250
+    assert list(d) == list(range(1, 500, 2))
+    check(d)
+
+@pytest.mark.parametrize('probing', ['linear', 'double', 'quadratic'])
+def test_dummies_are_bounded(probing):
+    d = Dict(size=256, resizing=False, probing=probing, max_dummies=1/8)
+    for i in range(2000):
+        d[i] = i + 1
+        if i >= 100:
+            del d[i - 100]
+        assert d.dummies <= d.max_dummies*d.size
+    assert sorted(d) == list(range(1900, 2000))
+    check(d)
+
+def test_entries_are_dense():
+    d = Dict(size=8)
+    for i in range(100):
+        d[i] = i + 1
+    for i in range(0, 100, 3):
+        del d[i]
+    assert list(d) == [i for i in range(100) if i % 3]
+    assert d.popitem() == (98, 99)
+    # Resizing drops the holes left by deleted entries.
+    size, i = d.size, 100
+    while d.size == size:
+        d[i] = i + 1
+        i += 1
+    assert len(d.entry_keys) == len(d.hashes) == d.used
+    check(d)
+
+def test_update_like_dict():
+    d = Dict()
+    ref = {}
+    d.update({1: 2, 3: 4})
+    ref.update({1: 2, 3: 4})
+    d.update([(3, 5), (6, 7)], eight=8)
+    ref.update([(3, 5), (6, 7)], eight=8)
+    assert dict(d.items()) == ref
+    with pytest.raises(ValueError):
+        d.update([(1, 2, 3)])
+    with pytest.raises(ValueError):
+        d.set_many([1, 2], [3])
+    assert Dict.fromkeys('ab', 1) == {'a': 1, 'b': 1}
+
+@pytest.mark.parametrize('probing', sorted(PROBING))
+def test_reseeds_when_flooded(probing):
+    seed = 12345
+    keys = flooding_keys(seed, 200)
+    assert len(set(MixHasher(seed)(key) & 0xffff for key in keys)) == 1
+    d = Dict(hasher=MixHasher(seed), probing=probing)
+    for i, key in enumerate(keys):
+        d[key] = i + 1
+    assert 1 <= d.reseeds <= 2
+    assert type(d.hasher) is MixHasher and d.hasher.seed != seed
+    assert all(d[key] == i + 1 for i, key in enumerate(keys))
+    check(d)
+
+def test_reseeds_are_bounded():
+    # These keys collide whatever the seed, the limit grows instead.
+    keys = [i*(2**61 - 1) for i in range(300)]
+    d = Dict()
+    for key in keys:
+        d[key] = 1
+    assert d.reseeds <= 3
+    assert sorted(d) == sorted(keys)
+    check(d)
+
+def test_flood_guard_off():
+    seed = 3
+    d = Dict(hasher=MixHasher(seed), flood_limit=None)
+    for key in flooding_keys(seed, 100):
+        d[key] = 1
+    assert d.reseeds == 0 and d.hasher.seed == seed
+    # A hasher without a seed can not be reseeded, so the guard turns off.
+    d = Dict(size=8, hasher=lambda key: 7)
+    for i in range(300):
+        d[i] = i + 1
+    assert d.flood_limit is None and d.reseeds == 0
+    assert all(d[i] == i + 1 for i in range(300))
+
+def test_tables_get_random_seeds():
+    assert Dict().hasher.seed != Dict().hasher.seed
+
+@pytest.mark.parametrize('config', ['growing', 'incremental', 'tombstones'])
+def test_clear_restores_initial_size(config):
+    d = Dict(**CONFIGS[config])
+    for i in range(1000):
+        d[i] = i + 1
+    assert d.size > d.minsize
+    d.clear()
+    # As with dictionary_chain.Dict, an emptied table starts over small.
+    assert d.size == d.minsize == 8 and len(d.indices) == 8
+    assert d.old_indices is None
+    d[1] = 2
+    assert dict(d.items()) == {1: 2}
+    check(d)
@@ -0,0 +1,72 @@
+from __future__ import division
+import os
+import pytest
+
+sharded = pytest.importorskip('dictionary_sharded')
+if not sharded.SHARED_MEMORY_INSTALLED:
+    pytest.skip('requires multiprocessing.shared_memory',
+                allow_module_level=True)
+if not os.path.isdir('/dev/shm'):
+    pytest.skip('shared memory blocks are not visible in /dev/shm',
+                allow_module_level=True)
+
+from dictionary_sharded import ShardedDict, SharedTable
+
+def exists(name):
+    return os.path.exists(os.path.join('/dev/shm', name.lstrip('/')))
+
+def all_names(d):
+    return [name for names in d.names for name in names]
+
+def test_pool_round_trip():
+    d = ShardedDict(shards=4, processes=2, size=32)
+    first = all_names(d)
+    assert all(exists(name) for name in first)
+    ref = dict(('key{0}'.format(i), [i]) for i in range(3000))
+    keys = list(ref)
+    d.set_many(keys, [ref[key] for key in keys])
+    # The shards grew in the workers, which replaced their blocks and
+    # unlinked the old ones.
+    assert not any(exists(name) for name in first)
+    names = all_names(d)
+    assert all(exists(name) for name in names)
+    assert len(d) == len(ref)
+    assert sum(d.used) == len(ref)
+    assert d.get_many(keys + ['missing'], -1) == \
+        [ref[key] for key in keys] + [-1]
+    assert dict(d.items()) == ref
+    assert d.delete_many(keys[:2500] + ['missing']) == 2500
+    for key in keys[:2500]:
+        del ref[key]
+    assert dict(d.items()) == ref
+    assert d['key2999'] == [2999]
+    assert 'key0' not in d
+    d['key0'] = 'x'
+    assert d.get('key0') == 'x'
+    del d['key0']
+    with pytest.raises(KeyError):
+        del d['key0']
+    d.close()
+    assert not any(exists(name) for name in all_names(d) + names)
+
+def test_context_manager_unlinks():
+    with ShardedDict(shards=2, processes=1, size=16) as d:
+        d.set_many(range(100), range(1, 101))
+        assert sorted(d.keys()) == list(range(100))
+        names = all_names(d)
+    assert not any(exists(name) for name in names)
+
+def test_shared_table_is_an_mmap_dict():
+    table = SharedTable(size=8, seed=4)
+    try:
+        for i in range(500):
+            table[i] = -i
+        for i in range(0, 500, 2):
+            del table[i]
+        other = SharedTable(table.names)
+        assert other.seed == 4
+        assert dict(other.items()) == dict((i, -i) for i in range(1, 500, 2))
+        other.close()
+    finally:
+        table.unlink()
+    assert not any(exists(name) for name in table.names)
@@ -0,0 +1,78 @@
+import pytest
+
+from dictionary_swiss import SwissDict, EMPTY, DELETED, GROUP
+from differential import KEYS, run
+
+CONFIGS = {
+    'default': {},
+    'growing': dict(size=1),
+    'sparse': dict(size=1, max_load=0.5),
+    'full': dict(size=64, max_load=0.99),
+    }
+
+def check(d):
+    """
+    The control bytes match the slots, and the room for growth accounts for
+    all used and DELETED slots.
+    """
+    for n, key in enumerate(d.slot_keys):
+        if key is None:
+            assert d.ctrl[n] in (EMPTY, DELETED)
+        else:
+            assert d.hashes[n] == d.hasher(key)
+            assert d.ctrl[n] == d.hashes[n] & 0x7F
+    assert d.ctrl.count(DELETED) == d.deleted
+    assert len(d.slot_keys) - d.slot_keys.count(None) == d.used
+    assert d.used + d.deleted + d.growth_left == \
+        int(len(d.ctrl)*d.max_load)
+
+@pytest.mark.parametrize('keys', sorted(KEYS))
+@pytest.mark.parametrize('config', sorted(CONFIGS))
+def test_matches_dict(config, keys):
+    d = SwissDict(**CONFIGS[config])
+    run(d, KEYS[keys], check=check)
+
+def test_deletes_in_open_groups_free_slots():
+    d = SwissDict(size=1024)
+    for i in range(100):
+        d[i] = i + 1
+    for i in range(100):
+        del d[i]
+    # No group filled up, so no slot had to be marked DELETED.
+    assert d.deleted == 0 and d.used == 0
+    assert d.ctrl.count(EMPTY) == len(d.ctrl)
+    check(d)
+
+def test_deleted_slots_are_dropped_by_rebuilds():
+    d = SwissDict(size=GROUP, max_load=0.99)
+    for i in range(GROUP - 1):
+        d[i] = i + 1
+    groups = d.groups
+    for n in range(1000):
+        del d[n]
+        d[n + GROUP - 1] = n + 1
+        check(d)
+    # The number of entries stayed the same, so the table did not grow.
+    assert d.groups == groups
+    assert len(d) == GROUP - 1
+
+@pytest.mark.parametrize('max_load', [0.01, 0.05, 0.1])
+def test_tiny_max_load(max_load):
+    # One group has room for at most one entry at these loads, so a
+    # rebuild has to grow the table until the next entry fits.
+    d = SwissDict(size=1, max_load=max_load)
+    for i in range(300):
+        d[i] = i + 1
+        assert d.growth_left >= 0
+        assert d.used <= d.max_load*len(d.ctrl)
+    check(d)
+    assert all(d[i] == i + 1 for i in range(300))
+    for i in range(300):
+        del d[i]
+    check(d)
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        SwissDict(max_load=1)
+    with pytest.raises(ValueError):
+        SwissDict(max_load=0)
@@ -0,0 +1,54 @@
+import os, subprocess, sys
+import pytest
+
+from hashing import MixHasher, FNVHasher, key_bytes, spread, random_seed, \
+    reseeded
+
+HASHERS = [MixHasher, FNVHasher]
+
+@pytest.mark.parametrize('cls', HASHERS)
+def test_equal_keys_hash_equal(cls):
+    h = cls()
+    assert h(1) == h(1.0) == h(True)
+    assert h((1, 'a')) == h((1.0, 'a'))
+    assert h('key') == h(''.join(['k', 'ey']))
+
+@pytest.mark.parametrize('cls', HASHERS)
+def test_seed_changes_hashes(cls):
+    keys = ['key{0}'.format(i) for i in range(100)]
+    assert [cls(1)(k) for k in keys] != [cls(2)(k) for k in keys]
+    assert all(0 <= cls(3)(k) < 1 << 64 for k in keys)
+
+@pytest.mark.parametrize('cls', HASHERS)
+def test_low_bits_spread(cls):
+    h, size = cls(), 256
+    chi2, largest = spread([h(i) & (size - 1) for i in range(10*size)],
+                           size)
+    # The statistic is close to size for uniformly spread keys.
+    assert chi2 < 2*size
+    assert largest < 40
+
+def test_key_bytes():
+    encodings = [key_bytes(k) for k in (1, '1', b'1', (1,), 1.5, ('1',))]
+    assert len(set(encodings)) == len(encodings)
+    assert key_bytes(2.0) == key_bytes(2)
+    with pytest.raises(TypeError):
+        key_bytes([1])
+
+def fnv_hash_in_process(hashseed):
+    code = "from hashing import FNVHasher; print(FNVHasher()(('a', b'b', 3)))"
+    env = dict(os.environ, PYTHONHASHSEED=str(hashseed))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.check_output([sys.executable, '-c', code], env=env,
+                                   cwd=root)
+
+def test_fnv_is_stable_between_processes():
+    assert fnv_hash_in_process(1) == fnv_hash_in_process(2)
+
+@pytest.mark.parametrize('cls', HASHERS)
+def test_reseeded(cls):
+    hasher = reseeded(cls(5))
+    assert type(hasher) is cls and hasher.seed != 5
+    assert reseeded(lambda key: 0) is None
+    assert 0 <= random_seed() < 1 << 64
+    assert random_seed() != random_seed()
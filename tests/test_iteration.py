@@ -0,0 +1,79 @@
+import operator
+import pytest
+
+import dictionary_oa, dictionary_chain
+
+TABLES = {
+    'oa': lambda: dictionary_oa.Dict(size=8),
+    'oa_incremental': lambda: dictionary_oa.Dict(size=8, incremental=True,
+                                                 resize_steps=1),
+    'chain': lambda: dictionary_chain.Dict(size=8),
+    'chain_arena': lambda: dictionary_chain.Dict(size=8, buckets='arena'),
+    'chain_incremental': lambda: dictionary_chain.Dict(
+        size=8, incremental=True, rehash_steps=1),
+    }
+
+def fill(d, n = 100):
+    for i in range(n):
+        d[i] = i + 1000
+    return dict((i, i + 1000) for i in range(n))
+
+CHANGES = {
+    'insert': lambda d: d.__setitem__('new', 1),
+    'delete': lambda d: d.__delitem__(50),
+    # The size is the same afterwards, only the version tells.
+    'delete_insert': lambda d: (d.__delitem__(50), d.__setitem__('new', 1)),
+    'pop': lambda d: d.pop(50),
+    'popitem': lambda d: d.popitem(),
+    'clear': lambda d: d.clear(),
+    }
+
+ITERATORS = {
+    'iter': iter,
+    'keys': lambda d: iter(d.keys()),
+    'values': lambda d: iter(d.values()),
+    'items': lambda d: iter(d.items()),
+    'iterkeys': operator.methodcaller('iterkeys'),
+    'itervalues': operator.methodcaller('itervalues'),
+    'iteritems': operator.methodcaller('iteritems'),
+    }
+
+@pytest.mark.parametrize('iterator', sorted(ITERATORS))
+@pytest.mark.parametrize('change', sorted(CHANGES))
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_changes_stop_iteration(table, change, iterator):
+    d = TABLES[table]()
+    fill(d)
+    it = ITERATORS[iterator](d)
+    next(it)
+    CHANGES[change](d)
+    with pytest.raises(RuntimeError):
+        for item in it:
+            pass
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_setting_values_does_not_stop_iteration(table):
+    d = TABLES[table]()
+    ref = fill(d)
+    seen = []
+    for key in d:
+        d[key] = ref[key] = -key
+        seen.append(key)
+    assert sorted(seen) == sorted(ref)
+    assert dict(d.items()) == ref
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_iteration_sees_every_entry_once(table):
+    d = TABLES[table]()
+    ref = fill(d, 300)
+    for i in range(0, 300, 3):
+        del d[i]
+        del ref[i]
+    keys = list(d)
+    assert sorted(keys) == sorted(ref)
+    assert list(d.values()) == [ref[key] for key in keys]
+    assert list(d.items()) == [(key, ref[key]) for key in keys]
+    it = d.iteritems()
+    assert it.__length_hint__() == len(ref)
+    next(it)
+    assert it.__length_hint__() == len(ref) - 1
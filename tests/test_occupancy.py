@@ -0,0 +1,173 @@
+from __future__ import division
+import json, struct, zlib
+import pytest
+
+import occupancy
+import dictionary_oa, dictionary_chain
+from occupancy import FREE, DELETED, USED, SLOT_COLORS, PNG_SIGNATURE
+
+@pytest.fixture(params=['numpy', 'bytes'])
+def path(request, monkeypatch):
+    """
+    Run a test with numpy, if it is installed, and without.
+    """
+    if request.param == 'numpy':
+        if not occupancy.NUMPY_INSTALLED:
+            pytest.skip('requires numpy')
+    else:
+        monkeypatch.setattr(occupancy, 'NUMPY_INSTALLED', False)
+    return request.param
+
+def table():
+    d = dictionary_oa.Dict(size=64, resizing=False, probing='linear')
+    for i in range(40):
+        d['key{0}'.format(i)] = i
+    for i in range(0, 40, 3):
+        del d['key{0}'.format(i)]
+    states = [USED if ix >= 0 else DELETED if ix == dictionary_oa.DUMMY
+              else FREE for ix in d.indices.tolist()]
+    return d, states
+
+def clusters(occupied):
+    # Runs of occupied cells, wrapping around the end.
+    start = occupied.index(False)
+    runs, length = {}, 0
+    for flag in occupied[start:] + occupied[:start] + [False]:
+        if flag:
+            length += 1
+        elif length:
+            runs[length] = runs.get(length, 0) + 1
+            length = 0
+    return runs
+
+def pixels(width, height, rgb):
+    assert len(rgb) == 3*width*height
+    rgb = bytearray(rgb)
+    return [tuple(rgb[k:k+3]) for k in range(0, len(rgb), 3)]
+
+def expected_pixels(states, width, height):
+    return [SLOT_COLORS[s] for s in states] + \
+        [(255, 255, 255)]*(width*height - len(states))
+
+def test_slot_states(path):
+    d, states = table()
+    assert list(bytearray(occupancy.slot_states(d.indices))) == states
+    # Wider index tables too.
+    d = dictionary_oa.Dict(size=1 << 9, resizing=False)
+    for i in range(300):
+        d[i] = i
+    del d[7]
+    states = [USED if ix >= 0 else DELETED if ix == dictionary_oa.DUMMY
+              else FREE for ix in d.indices.tolist()]
+    assert d.indices.itemsize > 1
+    assert list(bytearray(occupancy.slot_states(d.indices))) == states
+
+def test_slot_states_keep_leading_free_slots(path):
+    # The bytes path combines the states as one integer, which must keep
+    # the slots that are free at the start of the table.
+    for size in (1, 8, 1 << 9):
+        d = dictionary_oa.Dict(size=size, resizing=False)
+        assert occupancy.slot_states(d.indices) == bytes(bytearray(size))
+        if size > 1:
+            d[0] = 1
+            states = [USED if ix >= 0 else FREE for ix in d.indices.tolist()]
+            assert list(bytearray(occupancy.slot_states(d.indices))) == \
+                states
+
+def test_empty_chain_summary(path):
+    d = dictionary_chain.Dict(size=16, resizing=False)
+    summary = d.occupancy().summary()
+    assert summary['chain_histogram'] == [16]
+    assert summary['max_cluster'] == 0
+
+def test_ppm(path):
+    d, states = table()
+    data = d.occupancy().to_ppm()
+    lines = data.split(b'\n', 3)
+    assert lines[0] == b'P6' and lines[2] == b'255'
+    width, height = map(int, lines[1].split())
+    assert width*height >= 64
+    assert pixels(width, height, lines[3]) == \
+        expected_pixels(states, width, height)
+
+def read_png(data):
+    assert data[:8] == PNG_SIGNATURE
+    pos, chunks = 8, {}
+    while pos < len(data):
+        length, = struct.unpack('>I', data[pos:pos+4])
+        tag = data[pos+4:pos+8]
+        body = data[pos+8:pos+8+length]
+        crc, = struct.unpack('>I', data[pos+8+length:pos+12+length])
+        assert crc == zlib.crc32(tag + body) & 0xffffffff
+        chunks[tag] = body
+        pos += 12 + length
+    width, height, depth, color = struct.unpack('>IIBB',
+                                                chunks[b'IHDR'][:10])
+    assert (depth, color) == (8, 2)
+    rows = zlib.decompress(chunks[b'IDAT'])
+    stride = 1 + 3*width
+    assert len(rows) == stride*height
+    assert all(rows[k:k+1] == b'\x00' for k in range(0, len(rows), stride))
+    rgb = b''.join(rows[k+1:k+stride] for k in range(0, len(rows), stride))
+    return width, height, rgb
+
+def test_png(path):
+    d, states = table()
+    width, height, rgb = read_png(d.occupancy().to_png())
+    assert pixels(width, height, rgb) == \
+        expected_pixels(states, width, height)
+
+def test_json(path):
+    d, states = table()
+    result = json.loads(d.occupancy().to_json())
+    assert result['kind'] == 'slots' and result['size'] == 64
+    assert result['free'] == states.count(FREE)
+    assert result['deleted'] == states.count(DELETED) == d.dummies
+    assert result['used'] == states.count(USED) == len(d)
+    runs = clusters([s != FREE for s in states])
+    assert result['cluster_histogram'] == dict((str(k), n)
+                                               for k, n in runs.items())
+    assert result['max_cluster'] == max(runs)
+    heat = result['heatmap']
+    assert heat['cells_per_pixel'] == 1
+    assert heat['occupied'][:64] == [0.0 if s == FREE else 1.0
+                                     for s in states]
+    assert d.stats()['cluster_histogram'] == runs
+
+def test_downsampled_image(path):
+    d, states = table()
+    width, height, rgb = d.occupancy().image(max_pixels=16)
+    # Four slots per pixel, averaged.
+    assert (width, height) == (4, 4)
+    red = bytearray(rgb)[::3]
+    for p in range(16):
+        block = [SLOT_COLORS[s][0] for s in states[4*p:4*p+4]]
+        assert red[p] == int(round(sum(block)/4))
+
+def test_chain_buckets(path):
+    d = dictionary_chain.Dict(size=16, resizing=False)
+    for i in range(40):
+        d[i] = i
+    lengths = [d.buckets.chain_length(i) for i in range(16)]
+    occ = d.occupancy()
+    summary = occ.summary()
+    assert summary['kind'] == 'buckets'
+    assert summary['chain_histogram'] == d.chain_histogram()
+    width, height, rgb = occ.image()
+    shades = [min(50*n, 255) for n in lengths]
+    assert pixels(width, height, rgb)[:16] == [(s, s, s) for s in shades]
+    result = json.loads(occ.to_json())
+    assert result['heatmap']['occupied'][:16] == [1.0 if n else 0.0
+                                                  for n in lengths]
+
+def test_save(path, tmp_path):
+    d, states = table()
+    occ = d.occupancy()
+    for ext, data in (('png', occ.to_png()), ('ppm', occ.to_ppm()),
+                      ('json', occ.to_json().encode())):
+        name = str(tmp_path / ('table.' + ext))
+        occ.save(name)
+        with open(name, 'rb') as fp:
+            assert fp.read() == data
+    with pytest.raises(ValueError):
+        occ.save(str(tmp_path / 'table.gif'))
@@ -0,0 +1,130 @@
+from __future__ import division
+import io, os, pickle, subprocess, sys
+import pytest
+
+import dictionary_oa, dictionary_chain, snapshot
+from hashing import MixHasher, FNVHasher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TABLES = {
+    'oa': lambda **kw: dictionary_oa.Dict(size=8, **kw),
+    'oa_robin_hood': lambda **kw: dictionary_oa.Dict(
+        size=8, probing='robin_hood', **kw),
+    'chain': lambda **kw: dictionary_chain.Dict(size=8, **kw),
+    'chain_arena': lambda **kw: dictionary_chain.Dict(
+        size=8, buckets='arena', **kw),
+    }
+
+def fill(d):
+    ref = {}
+    for i in range(300):
+        key = ('key{0}'.format(i), i) if i % 3 else 'key{0}'.format(i)
+        d[key] = ref[key] = i + 1
+    for i in range(0, 300, 7):
+        key = ('key{0}'.format(i), i) if i % 3 else 'key{0}'.format(i)
+        del d[key]
+        del ref[key]
+    return ref
+
+def dump_load(d):
+    fp = io.BytesIO()
+    d.dump(fp)
+    fp.seek(0)
+    return type(d).load(fp)
+
+def check_copy(d, copy, ref):
+    assert type(copy) is type(d)
+    assert dict(copy.items()) == ref
+    if isinstance(d, dictionary_oa.Dict):
+        # The dense entries keep their order.
+        assert list(copy.keys()) == list(d.keys())
+    for key, value in ref.items():
+        assert copy[key] == value
+    # The copy is a working table of its own.
+    copy['extra'] = 1
+    del copy[next(iter(ref))]
+    assert 'extra' not in d and len(d) == len(ref)
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+@pytest.mark.parametrize('copy', [dump_load,
+                                  lambda d: pickle.loads(pickle.dumps(d))])
+def test_round_trip(table, copy):
+    d = TABLES[table]()
+    ref = fill(d)
+    check_copy(d, copy(d), ref)
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+@pytest.mark.parametrize('hasher', [FNVHasher(seed=9), MixHasher(seed=5)])
+def test_round_trip_with_hasher(table, hasher):
+    d = TABLES[table](hasher=hasher)
+    ref = fill(d)
+    copy = dump_load(d)
+    assert type(copy.hasher) is type(hasher)
+    assert copy.hasher.seed == hasher.seed
+    check_copy(d, copy, ref)
+
+def test_round_trip_while_resizing():
+    for d in (dictionary_oa.Dict(size=8, incremental=True, resize_steps=1),
+              dictionary_chain.Dict(size=8, incremental=True,
+                                    rehash_steps=1)):
+        ref = {}
+        i = 0
+        # Stop in the middle of a resize.
+        while i < 100 or getattr(d, 'old_indices', None) is None and \
+                getattr(d, 'new_buckets', None) is None:
+            d[i] = ref[i] = i + 1
+            i += 1
+        check_copy(d, dump_load(d), ref)
+        check_copy(d, pickle.loads(pickle.dumps(d)), ref)
+
+DUMP_IN_PROCESS = """
+import sys, dictionary_oa, dictionary_chain
+cls = {'oa': dictionary_oa.Dict, 'chain': dictionary_chain.Dict}[sys.argv[1]]
+d = cls(size=8)
+for i in range(200):
+    d['key{0}'.format(i)] = i
+with open(sys.argv[2], 'wb') as fp:
+    d.dump(fp)
+"""
+
+@pytest.mark.parametrize('module', ['oa', 'chain'])
+def test_load_with_other_hash_seed(module, tmp_path):
+    # The builtin hash of strings differs in the process that wrote the
+    # snapshot, so the keys are rehashed on loading.
+    path = str(tmp_path / 'snapshot')
+    env = dict(os.environ, PYTHONHASHSEED='1')
+    subprocess.check_call([sys.executable, '-c', DUMP_IN_PROCESS, module,
+                           path], env=env, cwd=ROOT)
+    cls = {'oa': dictionary_oa.Dict, 'chain': dictionary_chain.Dict}[module]
+    with open(path, 'rb') as fp:
+        d = cls.load(fp)
+    ref = dict(('key{0}'.format(i), i) for i in range(200))
+    assert dict(d.items()) == ref
+    for key, value in ref.items():
+        assert key in d and d[key] == value
+    d['key5'] = -1
+    del d['key6']
+    assert d['key5'] == -1 and 'key6' not in d and len(d) == 199
+
+@pytest.mark.parametrize('table', sorted(TABLES))
+def test_truncated_or_corrupt_snapshot(table):
+    d = TABLES[table]()
+    fill(d)
+    data = io.BytesIO()
+    d.dump(data)
+    data = data.getvalue()
+    with pytest.raises(ValueError):
+        type(d).load(io.BytesIO(data[:10]))
+    # The arrays are at the end.
+    with pytest.raises(ValueError):
+        type(d).load(io.BytesIO(data[:-5]))
+    with pytest.raises(ValueError):
+        type(d).load(io.BytesIO(b'PYDICTXX' + data[8:]))
+    # Cut or damaged in the pickled state, after the header.
+    with pytest.raises(ValueError):
+        type(d).load(io.BytesIO(data[:snapshot.HEADER.size + 10]))
+    corrupt = bytearray(data)
+    corrupt[snapshot.HEADER.size:snapshot.HEADER.size + 20] = b'\xff'*20
+    with pytest.raises(ValueError):
+        type(d).load(io.BytesIO(bytes(corrupt)))
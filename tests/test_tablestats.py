@@ -0,0 +1,95 @@
+from __future__ import division
+import pytest
+
+import dictionary_oa, dictionary_chain
+from tablestats import histogram
+
+# Multiples of 2**61 - 1 all have the builtin hash 0, so they share a probe
+# sequence or a chain.
+COLLIDING = [i*(2**61 - 1) for i in range(1, 11)]
+
+def test_histogram():
+    assert histogram('abcab') == {'a': 2, 'b': 2, 'c': 1}
+
+def check_counters(counters):
+    hist = counters['probe_histogram']
+    assert sum(hist.values()) == counters['lookups']
+    assert sum(k*n for k, n in hist.items()) == counters['probes']
+    assert counters['max_probes'] == max(hist)
+
+@pytest.mark.parametrize('probing', sorted(dictionary_oa.PROBING))
+def test_oa_counts_when_enabled(probing):
+    d = dictionary_oa.Dict(size=8, probing=probing)
+    d.enable_stats()
+    for i in range(100):
+        d[i] = i
+    for i in range(100):
+        d[i]
+    d.compact()
+    counters = d.stats()['counters']
+    check_counters(counters)
+    assert counters['lookups'] == 200
+    assert counters['rebuilds']['resize']['count'] >= 3
+    assert counters['rebuilds']['compact']['count'] == 1
+
+def test_oa_probe_lengths():
+    d = dictionary_oa.Dict(size=64, resizing=False, probing='linear')
+    for key in COLLIDING:
+        d[key] = 1
+    d.enable_stats()
+    for key in COLLIDING:
+        d[key]
+    counters = d.stats()['counters']
+    # The n-th colliding key is found in the n-th slot of the cluster.
+    assert counters['probe_histogram'] == dict((n, 1) for n in range(1, 11))
+    assert counters['max_probes'] == 10
+    stats = d.stats()
+    assert stats['cluster_histogram'] == {10: 1}
+    assert stats['max_cluster'] == 10
+    del d[COLLIDING[0]]
+    stats = d.stats()
+    assert stats['dummies'] == 1 and stats['tombstone_ratio'] == 1/64
+    assert stats['holes'] == 1
+
+def test_chain_counts_when_enabled():
+    d = dictionary_chain.Dict(size=8, max_load=20)
+    for key in COLLIDING:
+        d[key] = 1
+    d.enable_stats()
+    for key in COLLIDING:
+        d[key]
+    assert 'missing' not in d
+    counters = d.stats()['counters']
+    check_counters(counters)
+    assert counters['lookups'] == 11
+    assert counters['max_probes'] == 10
+    for i in range(200):
+        d[i] = i
+    counters = d.stats()['counters']
+    assert counters['rebuilds']['resize']['count'] >= 1
+    stats = d.stats()
+    assert sum(stats['chain_histogram']) == d.size
+    assert stats['max_chain'] >= 10
+    assert stats['rehashing'] is None
+
+@pytest.mark.parametrize('cls', [dictionary_oa.Dict, dictionary_chain.Dict])
+def test_disable_restores_methods(cls):
+    d = cls(size=8)
+    d.enable_stats()
+    assert '_lookup' in d.__dict__ and '_resize' in d.__dict__
+    for i in range(100):
+        d[i] = i
+    d.disable_stats()
+    for name in ('_lookup', '_resize', 'compact'):
+        assert name not in d.__dict__
+        if hasattr(cls, name):
+            assert getattr(d, name).__func__ is getattr(cls, name)
+    assert d.stats()['counters'] is None
+    assert d.table_stats is None
+    for i in range(100, 200):
+        d[i] = i
+    assert sorted(d) == list(range(200))
+    # Counting starts from zero when enabled again.
+    d.enable_stats()
+    d[5]
+    assert d.stats()['counters']['lookups'] == 1
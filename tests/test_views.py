@@ -0,0 +1,93 @@
+import pytest
+
+import dictionary_oa, dictionary_chain, dictionary_cuckoo, dictionary_swiss
+
+CLASSES = {
+    'oa': dictionary_oa.Dict,
+    'chain': dictionary_chain.Dict,
+    }
+
+def make(name, pairs):
+    d = CLASSES[name](size=8)
+    for key, value in pairs:
+        d[key] = value
+    return d
+
+PAIRS = [(1, 'a'), ('two', 'b'), ((3, 3), 'c'), (4, 'a')]
+
+@pytest.mark.parametrize('name', sorted(CLASSES))
+def test_views_are_live(name):
+    d = make(name, PAIRS)
+    ref = dict(PAIRS)
+    keys, values, items = d.keys(), d.values(), d.items()
+    for i in range(100):
+        d[i + 10] = ref[i + 10] = str(i)
+    del d[1]
+    del ref[1]
+    d['two'] = ref['two'] = 'z'
+    assert len(keys) == len(values) == len(items) == len(ref)
+    assert set(keys) == set(ref)
+    assert sorted(values) == sorted(ref.values())
+    assert set(items) == set(ref.items())
+    assert 1 not in keys and 'two' in keys
+    assert ('two', 'z') in items and ('two', 'b') not in items
+    assert 'z' in values and 'nothing' not in values
+    d.clear()
+    assert len(keys) == 0 and list(items) == [] and list(values) == []
+
+@pytest.mark.parametrize('name', sorted(CLASSES))
+def test_set_operations_match_dict(name):
+    d = make(name, PAIRS)
+    ref = dict(PAIRS)
+    others = [set(), {1, 'x'}, {(3, 3), 4, 5}, set(ref)]
+    for other in others:
+        assert d.keys() & other == ref.keys() & other
+        assert d.keys() | other == ref.keys() | other
+        assert d.keys() - other == ref.keys() - other
+        assert d.keys() ^ other == ref.keys() ^ other
+        assert d.keys().isdisjoint(other) == ref.keys().isdisjoint(other)
+        assert (d.keys() == other) == (ref.keys() == other)
+        assert (d.keys() <= other) == (ref.keys() <= other)
+        assert (d.keys() > other) == (ref.keys() > other)
+    item_others = [set(), {(1, 'a'), (1, 'b')}, {(4, 'a'), ('x', 'y')},
+                   set(ref.items())]
+    for other in item_others:
+        assert d.items() & other == ref.items() & other
+        assert d.items() | other == ref.items() | other
+        assert d.items() - other == ref.items() - other
+        assert d.items() ^ other == ref.items() ^ other
+        assert (d.items() == other) == (ref.items() == other)
+        assert (d.items() < other) == (ref.items() < other)
+    # Views of two dictionaries compare as sets too.
+    assert d.keys() == make(name, reversed(PAIRS)).keys()
+    assert d.items() != make(name, PAIRS[:-1]).items()
+
+@pytest.mark.parametrize('name', sorted(CLASSES))
+def test_repr(name):
+    d = make(name, [(1, 'a')])
+    assert repr(d.keys()) == 'Dict.keys([1])'
+    assert repr(d.values()) == "Dict.values(['a'])"
+    assert repr(d.items()) == "Dict.items([(1, 'a')])"
+
+@pytest.mark.parametrize('cls', [dictionary_oa.Dict, dictionary_chain.Dict,
+                                 dictionary_cuckoo.CuckooDict,
+                                 dictionary_swiss.SwissDict])
+def test_reversed(cls):
+    d = cls(size=8)
+    for i in range(100):
+        d[i] = str(i)
+    for i in range(0, 100, 3):
+        del d[i]
+    assert list(reversed(d)) == list(d)[::-1]
+    assert list(reversed(d.keys())) == list(d.keys())[::-1]
+    assert list(reversed(d.values())) == list(d.values())[::-1]
+    assert list(reversed(d.items())) == list(d.items())[::-1]
+    if cls is dictionary_oa.Dict:
+        # Like a dict, the last inserted key comes first.
+        ref = dict((i, str(i)) for i in range(100) if i % 3)
+        assert list(reversed(d.items())) == list(reversed(ref.items()))
+    keys = reversed(d.keys())
+    next(keys)
+    d[1000] = 'x'
+    with pytest.raises(RuntimeError):
+        next(keys)
@@ -0,0 +1,84 @@
+"""
+Live views of the keys, values and items of the dictionaries in
+dictionary_oa and dictionary_chain, like those returned by the keys, values
+and items methods of the builtin dict in Python 3.
+
+A view holds nothing but the dictionary. It iterates over the table of the
+dictionary directly and always reflects its current contents. Views of keys
+and items are sets, so they support comparisons and the operators &, |, -
+and ^, which return builtin sets. As in Python 3.8, reversed gives the
+contents of a view in the reverse order of iteration: from the last
+inserted entry to the first for dictionary_oa.
+"""
+from __future__ import division
+from __future__ import print_function
+__url__     = "https://github.com/tkralphs/PyDict"
+__license__ = "CC BY 3.0"
+
+try:
+    from collections.abc import KeysView as _KeysView, \
+        ValuesView as _ValuesView, ItemsView as _ItemsView
+except ImportError:
+    from collections import KeysView as _KeysView, \
+        ValuesView as _ValuesView, ItemsView as _ItemsView
+
+class KeysView(_KeysView):
+    """
+    A view of the keys of a dictionary. Membership tests look up the key.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._iter_keys()
+
+    def __reversed__(self):
+        for key, value in self._mapping._reversed_items():
+            yield key
+
+    def __repr__(self):
+        return "{0}.keys([{1}])".format(type(self._mapping).__name__,
+                                        ", ".join(repr(k) for k in self))
+
+class ValuesView(_ValuesView):
+    """
+    A view of the values of a dictionary. Membership tests scan the values.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._iter_values()
+
+    def __reversed__(self):
+        for key, value in self._mapping._reversed_items():
+            yield value
+
+    def __contains__(self, value):
+        for v in self:
+            if v is value or v == value:
+                return True
+        return False
+
+    def __repr__(self):
+        return "{0}.values([{1}])".format(type(self._mapping).__name__,
+                                          ", ".join(repr(v) for v in self))
+
+class ItemsView(_ItemsView):
+    """
+    A view of the key-value pairs of a dictionary. Membership tests look up
+    the key and compare the value.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+    def __reversed__(self):
+        return self._mapping._reversed_items()
+
+    def __repr__(self):
+        return "{0}.items([{1}])".format(
+            type(self._mapping).__name__,
+            ", ".join("({0!r}, {1!r})".format(k, v) for k, v in self))